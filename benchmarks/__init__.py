@@ -0,0 +1,7 @@
+import os
+import sys
+
+#the app modules import each other from src/, as when run with python src/app.py
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
@@ -0,0 +1,76 @@
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "benchmarks"
+
+from benchmarks.run import load_book
+from benchmarks.workload import Workload
+
+import month_end
+import parallel_close
+
+logger = logging.getLogger(__name__)
+
+"""
+Month-end close time against the number of worker processes.
+
+Loads a seeded synthetic book with benchmarks.workload, then closes every month of the workload with
+month_end.close_month on the main process and with parallel_close.close_month_parallel for each worker
+count. The median over the repeats is printed per month closed, with the speedup over the serial close
+and the shard skew of the last run. Closing a month again re-credits the same interest, so every run
+does the same work.
+"""
+
+def time_close(close, months:list, repeats:int) -> float:
+    """
+    Args:
+        close (callable): closes one Year Month, called with the Year Month
+        months (list): Year Months closed per run
+        repeats (int): timed runs
+
+    Returns:
+        float: median seconds per month closed
+    """
+    elapsed = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for yyyymm in months:
+            close(yyyymm)
+        elapsed.append((time.perf_counter() - start) / len(months))
+    return statistics.median(elapsed)
+
+def main():
+    parser=argparse.ArgumentParser(description="Time the month-end close of a synthetic book against the number of worker processes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="worker process counts to run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--trns-per-account", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per worker count, the median is kept")
+    args=parser.parse_args()
+
+    workload = Workload(seed=args.seed, accounts=args.accounts, trns_per_account=args.trns_per_account)
+    app = load_book(workload, workload.transaction_lines(), workload.interest_rule_lines())
+    months = workload.months()
+
+    serial = time_close(lambda yyyymm: month_end.close_month(app, yyyymm), months, args.repeats)
+    print(f"Workload: {workload.config()} | CPUs: {os.cpu_count()}")
+    print("Workers | ms/month  | Speedup | Skew")
+    print(f"{'serial':>7} | {serial*1000:9.2f} | {1.0:7.2f} |")
+    for workers in args.workers:
+        reports = []
+        def close(yyyymm):
+            _, report = parallel_close.close_month_parallel(app, yyyymm, workers=workers)
+            reports.append(report)
+        seconds = time_close(close, months, args.repeats)
+        shard_seconds = [row[3] for row in reports[-1]]
+        skew = max(shard_seconds) / statistics.mean(shard_seconds) if statistics.mean(shard_seconds) > 0 else 1.0
+        print(f"{workers:7} | {seconds*1000:9.2f} | {serial/seconds:7.2f} | {skew:.2f}")
+
+if __name__ == "__main__":
+    main()
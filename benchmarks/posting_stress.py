@@ -0,0 +1,150 @@
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "benchmarks"
+
+import benchmarks  #puts src/ on sys.path
+
+from banking_app import BankingApp
+from posting_engine import PostingEngine
+
+logger = logging.getLogger(__name__)
+
+"""
+Stress run of the posting engine with concurrent producer threads.
+
+Every producer posts a seeded mix of deposits and withdrawals, many of them backdated, to a small
+set of shared accounts so that withdrawals compete for the same balances. After each run the
+book is checked against the futures returned to the producers:
+
+* every posted amount is in its account's balance and ledger, nothing is lost or posted twice
+* no end of day balance of any account is below zero
+* transaction ids are unique within each account
+* the postings of each producer to an account are in the ledger in submission order
+
+and the throughput is printed for each number of producer threads.
+"""
+
+def produce(engine:PostingEngine, producer:int, num_lines:int, num_accounts:int, submitted:list) -> None:
+    """
+    Submit the lines of one producer
+
+    Args:
+        engine (PostingEngine): posting engine
+        producer (int): producer number, also the random seed
+        num_lines (int): lines to submit
+        num_accounts (int): number of shared accounts
+        submitted (list): receives (producer, line, future) for every line
+    """
+    rnd = random.Random(producer)
+    for _ in range(num_lines):
+        trn_type = "D" if rnd.random() < 0.55 else "W"
+        line = f"2023{rnd.randint(1, 12):02}{rnd.randint(1, 28):02} ST{rnd.randrange(num_accounts):03} {trn_type} {rnd.randint(1, 500)}.{rnd.randint(0, 99):02}"
+        submitted.append((producer, line, engine.submit(line)))
+
+def check_book(app:BankingApp, submitted:list) -> list:
+    """
+    Check the book against what the producers were told
+
+    Args:
+        app (BankingApp): banking app after the run
+        submitted (list): (producer, line, future) for every submitted line
+
+    Returns:
+        list: problems found, empty if the book is consistent
+    """
+    problems = []
+    expected = {}
+    for producer, line, future in submitted:
+        if future.result() is None:
+            trn_date, bank_acc_num, trn_type, amount = line.split()
+            cents = int(amount.replace(".", ""))
+            expected.setdefault(bank_acc_num, {}).setdefault(producer, []).append((trn_type, cents))
+
+    for bank_acc_num, by_producer in expected.items():
+        bank_acc = app.accounts.get(bank_acc_num)
+        ledger = bank_acc.ledger
+        signed = sum(-cents if trn_type == "W" else cents for rows in by_producer.values() for trn_type, cents in rows)
+        posted = sum(len(rows) for rows in by_producer.values())
+        if bank_acc.balance != signed or len(ledger) != posted:
+            problems.append(f"{bank_acc_num}: balance {bank_acc.balance} for {len(ledger)} rows, expected {signed} for {posted} rows")
+
+        day_amounts = {}
+        for row in range(len(ledger)):
+            day_amounts[ledger.ordinals[row]] = day_amounts.get(ledger.ordinals[row], 0) + ledger.signed_cents(row)
+        balance = 0
+        for day in sorted(day_amounts):
+            balance += day_amounts[day]
+            if balance < 0:
+                problems.append(f"{bank_acc_num}: negative end of day balance {balance}")
+                break
+
+        trn_ids = [trn.trn_id for trns in bank_acc.get_transactions().values() for trn in trns]
+        if len(trn_ids) != len(set(trn_ids)):
+            problems.append(f"{bank_acc_num}: duplicate transaction ids")
+
+        #each producer's posted rows must appear in the ledger as a subsequence, in submission order
+        ledger_rows = [(chr(ledger.types[row]), ledger.cents[row]) for row in range(len(ledger))]
+        for producer, rows in by_producer.items():
+            pos = 0
+            for row in rows:
+                try:
+                    pos = ledger_rows.index(row, pos) + 1
+                except ValueError:
+                    problems.append(f"{bank_acc_num}: postings of producer {producer} out of order")
+                    break
+    return problems
+
+def run(num_threads:int, lines_per_thread:int, num_accounts:int) -> tuple:
+    """
+    Run the producers against a fresh banking app
+
+    Args:
+        num_threads (int): producer threads
+        lines_per_thread (int): lines submitted by each producer
+        num_accounts (int): number of shared accounts
+
+    Returns:
+        tuple: postings per second, number of lines, list of problems
+    """
+    app = BankingApp()
+    submitted_lists = [[] for _ in range(num_threads)]
+    with PostingEngine(app) as engine:
+        start = time.perf_counter()
+        producers = [threading.Thread(target=produce, args=(engine, producer, lines_per_thread, num_accounts, submitted_lists[producer]))
+                     for producer in range(num_threads)]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+    elapsed = time.perf_counter() - start
+    submitted = [item for items in submitted_lists for item in items]
+    return len(submitted) / elapsed, len(submitted), check_book(app, submitted)
+
+def main():
+    parser=argparse.ArgumentParser(description="Stress the posting engine with concurrent producer threads")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16], help="producer thread counts to run")
+    parser.add_argument("--lines", type=int, default=200000, help="total lines per run, split over the producers")
+    parser.add_argument("--accounts", type=int, default=20, help="number of shared accounts")
+    args=parser.parse_args()
+
+    failed = False
+    print("Threads | Lines     | Postings/sec | Problems")
+    for num_threads in args.threads:
+        rate, lines, problems = run(num_threads, args.lines // num_threads, args.accounts)
+        print(f"{num_threads:7} | {lines:9} | {rate:12,.0f} | {len(problems)}")
+        for problem in problems[:10]:
+            print(f"    {problem}")
+        failed = failed or bool(problems)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "benchmarks"
+
+from benchmarks.workload import Workload
+
+from banking_app import BankingApp
+import month_end
+
+logger = logging.getLogger(__name__)
+
+"""
+Benchmark runner for the banking app.
+
+Builds a seeded synthetic book with benchmarks.workload and times the hot paths:
+ingestion, statement generation, single account and bank-wide month-end interest, and the memory
+held per transaction. Each timing is run once to warm up, then the median of the repeated runs is kept.
+Results are written as JSON and can be compared against a stored baseline:
+```
+python benchmarks/run.py --output results.json --baseline benchmarks/baseline.json --threshold 0.35 --min-delta-ms 20
+```
+The exit status is 1 when any metric is worse than the baseline by more than the threshold and, for timings,
+one timed run is also slower by more than the absolute floor, so scheduler noise on short runs is not a regression.
+"""
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+def _median_of(repeats:int, func) -> float:
+    """
+    Args:
+        repeats (int): number of timed runs, after one untimed warmup run
+        func (callable): function to time, called without arguments
+
+    Returns:
+        float: median run in seconds
+    """
+    func()
+    elapsed = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - start)
+    return statistics.median(elapsed)
+
+def load_book(workload:Workload, trn_lines:list, rule_lines:list) -> BankingApp:
+    """
+    Build an in-memory banking app holding the workload
+
+    Args:
+        workload (Workload): workload
+        trn_lines (list): transaction lines
+        rule_lines (list): interest rule lines
+
+    Returns:
+        BankingApp: loaded banking app
+    """
+    app = BankingApp()
+    for line in rule_lines:
+        app.process_interest_rule(line)
+    for line in trn_lines:
+        app.process_transaction(line)
+    return app
+
+def bench_ingestion(workload:Workload, trn_lines:list, rule_lines:list, repeats:int) -> dict:
+    """
+    Rows per second loaded through the same validation path as the console
+    """
+    elapsed = _median_of(repeats, lambda: load_book(workload, trn_lines, rule_lines))
+    rows = len(trn_lines) + len(rule_lines)
+    return {"ingestion_rows_per_sec": {"value": rows / elapsed, "unit": "rows/s", "better": "higher", "run_ms": elapsed * 1000}}
+
+def bench_memory(workload:Workload, trn_lines:list, rule_lines:list) -> dict:
+    """
+    Bytes held per posted transaction, measured with tracemalloc
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    app = load_book(workload, trn_lines, rule_lines)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    num_trns = sum(len(bank_acc.ledger) for bank_acc in app.accounts.values())
+    return {"memory_bytes_per_transaction": {"value": (after - before) / max(num_trns, 1), "unit": "bytes", "better": "lower"}}
+
+def bench_statement(app:BankingApp, workload:Workload, repeats:int, num_statements:int=200) -> dict:
+    """
+    Time to render one month statement, interest calculation included
+    """
+    acc_nums = list(app.accounts.keys())[:num_statements]
+    yyyymm = workload.months()[-1]
+
+    def render():
+        #start from a cold interest cache so every statement calculates its interest
+        app.interest_cache.clear()
+        for acc_num in acc_nums:
+            bank_acc = app.accounts.get(acc_num)
+            app.get_month_interest(bank_acc, yyyymm)
+            for _ in bank_acc.statement_lines(yyyymm):
+                pass
+
+    elapsed = _median_of(repeats, render)
+    return {"statement_ms": {"value": elapsed * 1000 / max(len(acc_nums), 1), "unit": "ms", "better": "lower", "run_ms": elapsed * 1000}}
+
+def bench_interest(app:BankingApp, workload:Workload, repeats:int) -> dict:
+    """
+    Single account interest and bank-wide month-end close over every month of the workload
+    """
+    accounts = list(app.accounts.values())
+    months = workload.months()
+
+    def single():
+        for yyyymm in months:
+            for bank_acc in accounts:
+                app.calculate_interest_for_acc(bank_acc, yyyymm)
+
+    def close():
+        for yyyymm in months:
+            month_end.close_month(app, yyyymm)
+
+    single_elapsed = _median_of(repeats, single)
+    close_elapsed = _median_of(repeats, close)
+    return {
+        "interest_per_account_month_us": {"value": single_elapsed * 1e6 / max(len(accounts) * len(months), 1), "unit": "us", "better": "lower",
+                                          "run_ms": single_elapsed * 1000},
+        "month_end_close_ms": {"value": close_elapsed * 1000 / max(len(months), 1), "unit": "ms", "better": "lower",
+                               "run_ms": close_elapsed * 1000},
+    }
+
+def run_benchmarks(workload:Workload, repeats:int=5) -> dict:
+    """
+    Run every benchmark on a workload
+
+    Args:
+        workload (Workload): workload
+        repeats (int, optional): timed runs per timing after a warmup run, the median is kept. Defaults to 5.
+
+    Returns:
+        dict: report with the workload config, environment and results
+    """
+    trn_lines = workload.transaction_lines()
+    rule_lines = workload.interest_rule_lines()
+
+    results = {}
+    results.update(bench_ingestion(workload, trn_lines, rule_lines, repeats))
+    results.update(bench_memory(workload, trn_lines, rule_lines))
+    app = load_book(workload, trn_lines, rule_lines)
+    results.update(bench_statement(app, workload, repeats))
+    results.update(bench_interest(app, workload, repeats))
+    return {
+        "config": workload.config(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "results": results,
+    }
+
+def compare(report:dict, baseline:dict, threshold:float, min_delta_ms:float=0.0) -> list:
+    """
+    Compare a report against a baseline report
+
+    Args:
+        report (dict): current report
+        baseline (dict): baseline report
+        threshold (float): allowed relative slowdown, 0.25 is 25%
+        min_delta_ms (float, optional): for timings, a timed run must also be slower by more than this. Defaults to 0.0.
+
+    Returns:
+        list: (metric, baseline value, current value, relative change, regressed) for each common metric
+    """
+    if report.get("config") != baseline.get("config"):
+        logger.warning("Baseline was recorded with a different workload config")
+    rows = []
+    for name, base in baseline.get("results", {}).items():
+        current = report["results"].get(name)
+        if current is None or not base["value"]:
+            continue
+        change = (current["value"] - base["value"]) / base["value"]
+        worse = change if base["better"] == "lower" else -change
+        regressed = worse > threshold
+        if "run_ms" in base and "run_ms" in current:
+            regressed = regressed and current["run_ms"] - base["run_ms"] > min_delta_ms
+        rows.append((name, base["value"], current["value"], change, regressed))
+    return rows
+
+def print_report(report:dict, comparison:list=None) -> None:
+    """
+    Print the results and, if given, the comparison against the baseline
+    """
+    print(f"Workload: {report['config']}")
+    for name, result in report["results"].items():
+        print(f"{name:30} {result['value']:14,.2f} {result['unit']}")
+    if comparison:
+        print("\nMetric                         | Baseline       | Current        | Change  | Status")
+        for name, base_value, value, change, regressed in comparison:
+            print(f"{name:30} | {base_value:14,.2f} | {value:14,.2f} | {change*100:+6.1f}% | {'REGRESSED' if regressed else 'ok'}")
+
+def main():
+    parser=argparse.ArgumentParser(description="Benchmark the banking app on a synthetic workload")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--trns-per-account", type=int, default=50)
+    parser.add_argument("--rule-changes", type=int, default=24)
+    parser.add_argument("--backdated-share", type=float, default=0.05)
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per timing after a warmup run, the median is kept")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", nargs="?", const=BASELINE_FILE, help="compare against a baseline JSON report")
+    parser.add_argument("--threshold", type=float, default=0.35, help="allowed relative regression against the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=20.0, help="a timing also regresses only if one timed run is slower by more than this")
+    args=parser.parse_args()
+
+    workload = Workload(seed=args.seed, accounts=args.accounts, trns_per_account=args.trns_per_account,
+                        rule_changes=args.rule_changes, backdated_share=args.backdated_share)
+    report = run_benchmarks(workload, repeats=args.repeats)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            comparison = compare(report, json.load(file), args.threshold, args.min_delta_ms)
+    print_report(report, comparison)
+    if comparison and any(row[4] for row in comparison):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
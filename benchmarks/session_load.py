@@ -0,0 +1,309 @@
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "benchmarks"
+
+from benchmarks.workload import Workload
+
+from banking_app import BankingApp
+from utils import utils
+
+logger = logging.getLogger(__name__)
+
+"""
+Console session load harness.
+
+Replays scripted sessions through BankingApp.run(), the real menu code, with stdin and stdout
+redirected. Sessions are generated from benchmarks.workload or recorded, one stdin file per session,
+and run back to back against the same app so the ledgers grow from one session to the next:
+```
+python benchmarks/session_load.py --sessions 200 --commands 50 --report-every 50
+python benchmarks/session_load.py --script session1.txt session2.txt --repeat 20
+```
+A command runs from the read of its menu choice to the read of the next menu choice, so its time
+includes the prompts, the statement echoed after a transaction and the menu printed again. The
+report gives latency percentiles and output bytes per menu choice, overall and per window of sessions.
+"""
+
+#menu choices followed by one line of details, the others are a single line
+_DETAIL_CHOICES = ("T", "I", "P", "B")
+
+class SessionInput:
+    """
+    Stand-in for sys.stdin feeding the lines of a session to input(), and timing each command
+    """
+
+    def __init__(self, commands:list, output:"OutputCounter", results:list):
+        """
+        Constructor
+
+        Args:
+            commands (list): (choice, list of detail lines) of the session
+            output (OutputCounter): stand-in for sys.stdout, to attribute the output bytes
+            results (list): receives (choice, seconds, output bytes) for every command
+        """
+        self.output = output
+        self.results = results
+        self._lines = []
+        self._starts = set()
+        for choice, details in commands:
+            self._starts.add(len(self._lines))
+            self._lines.append(choice)
+            self._lines.extend(details)
+        self._pos = 0
+        self._current = None
+
+    def readline(self) -> str:
+        if self._pos >= len(self._lines):
+            return ""
+        line = self._lines[self._pos]
+        if self._pos in self._starts:
+            self.finish()
+            self._current = (line.strip().upper(), time.perf_counter(), self.output.count)
+        self._pos += 1
+        return line + "\n"
+
+    def finish(self) -> None:
+        """
+        Record the command running, if any
+        """
+        if self._current is None:
+            return
+        choice, start, count = self._current
+        self.results.append((choice, time.perf_counter() - start, self.output.count - count))
+        self._current = None
+
+class OutputCounter(io.TextIOBase):
+    """
+    Stand-in for sys.stdout counting what is written, optionally passing it on
+    """
+
+    def __init__(self, echo=None):
+        """
+        Constructor
+
+        Args:
+            echo (TextIO, optional): stream receiving the output as well. Defaults to None to discard it.
+        """
+        self.count = 0
+        self.echo = echo
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text:str) -> int:
+        #the console output is ASCII, one byte per character
+        self.count += len(text)
+        if self.echo is not None:
+            self.echo.write(text)
+        return len(text)
+
+def parse_script(lines:list) -> list:
+    """
+    Split a recorded stdin session into commands, following the menu
+
+    Args:
+        lines (list): session lines, without line endings
+
+    Returns:
+        list: (choice, list of detail lines), ending with Q
+    """
+    commands = []
+    pos = 0
+    while pos < len(lines):
+        choice = lines[pos]
+        pos += 1
+        if choice.strip().upper() in _DETAIL_CHOICES:
+            commands.append((choice, lines[pos:pos+1]))
+            pos += 1
+        else:
+            commands.append((choice, []))
+        if choice.strip().upper() == "Q":
+            return commands
+    commands.append(("Q", []))
+    return commands
+
+def generate_sessions(workload:Workload, num_sessions:int, num_commands:int, statement_share:float=0.2,
+                      rule_share:float=0.02) -> list:
+    """
+    Generate sessions posting the workload transactions in feed order, with statements and interest rules mixed in
+
+    Args:
+        workload (Workload): workload supplying the transaction and interest rule lines
+        num_sessions (int): number of sessions
+        num_commands (int): commands per session, before the final Q
+        statement_share (float, optional): share of print statement commands. Defaults to 0.2.
+        rule_share (float, optional): share of interest rule commands. Defaults to 0.02.
+
+    Returns:
+        list: sessions, each a list of (choice, list of detail lines)
+    """
+    rnd = random.Random(workload.seed)
+    trn_lines = iter(workload.transaction_lines())
+    rule_lines = workload.interest_rule_lines()
+    posted = []
+    sessions = []
+    for _ in range(num_sessions):
+        commands = []
+        for _ in range(num_commands):
+            draw = rnd.random()
+            if draw < rule_share:
+                commands.append(("I", [rnd.choice(rule_lines)]))
+            elif draw < rule_share + statement_share and posted:
+                trn_date, bank_acc_num, _, _ = rnd.choice(posted).split()
+                commands.append(("P", [f"{bank_acc_num} {trn_date[:6]}"]))
+            else:
+                line = next(trn_lines, None)
+                if line is None:
+                    break
+                posted.append(line)
+                commands.append(("T", [line]))
+        commands.append(("Q", []))
+        sessions.append(commands)
+    return sessions
+
+def run_sessions(app:BankingApp, sessions:list, echo=None) -> list:
+    """
+    Replay sessions one after the other through the console menu
+
+    Args:
+        app (BankingApp): banking app, kept across sessions
+        sessions (list): sessions, each a list of (choice, list of detail lines)
+        echo (TextIO, optional): stream receiving the console output. Defaults to None to discard it.
+
+    Returns:
+        list: per session, list of (choice, seconds, output bytes) for every command
+    """
+    results = []
+    stdin, stdout = sys.stdin, sys.stdout
+    try:
+        for commands in sessions:
+            output = OutputCounter(echo)
+            session_results = []
+            session_input = SessionInput(commands, output, session_results)
+            sys.stdin, sys.stdout = session_input, output
+            try:
+                app.run()
+            except EOFError:
+                #a recorded session without Q
+                pass
+            session_input.finish()
+            results.append(session_results)
+    finally:
+        sys.stdin, sys.stdout = stdin, stdout
+    return results
+
+def summarize(results:list) -> dict:
+    """
+    Args:
+        results (list): (choice, seconds, output bytes) of the commands
+
+    Returns:
+        dict: per menu choice, count, latency percentiles in ms and output bytes
+    """
+    by_choice = {}
+    for choice, seconds, output_bytes in results:
+        by_choice.setdefault(choice, []).append((seconds, output_bytes))
+    summary = {}
+    for choice, rows in sorted(by_choice.items()):
+        latencies = sorted(seconds for seconds, _ in rows)
+        total_bytes = sum(output_bytes for _, output_bytes in rows)
+        summary[choice] = {"count": len(rows),
+                           "p50_ms": utils.percentile(latencies, 50)*1000,
+                           "p95_ms": utils.percentile(latencies, 95)*1000,
+                           "p99_ms": utils.percentile(latencies, 99)*1000,
+                           "max_ms": latencies[-1]*1000,
+                           "mean_bytes": total_bytes / len(rows),
+                           "total_bytes": total_bytes}
+    return summary
+
+def book_rows(app:BankingApp) -> int:
+    """
+    Returns:
+        int: transaction rows in the book, interest included
+    """
+    return sum(len(bank_acc.ledger) for bank_acc in app.accounts.values())
+
+def print_report(summary:dict, windows:list) -> None:
+    """
+    Print the per-command summary and the per-window latencies
+
+    Args:
+        summary (dict): summary of all sessions
+        windows (list): (first session, last session, book rows, summary) per window of sessions
+    """
+    print("Command | Count   | p50 ms  | p95 ms  | p99 ms  | max ms   | bytes/cmd")
+    for choice, row in summary.items():
+        print(f"{choice:7} | {row['count']:7} | {row['p50_ms']:7.3f} | {row['p95_ms']:7.3f} | {row['p99_ms']:7.3f} | "
+              f"{row['max_ms']:8.3f} | {row['mean_bytes']:9.0f}")
+    if len(windows) <= 1:
+        return
+    print()
+    print("Sessions    | Book rows | T p50 ms | T p95 ms | T bytes/cmd | P p50 ms | P p95 ms | P bytes/cmd")
+    empty = {"p50_ms": 0.0, "p95_ms": 0.0, "mean_bytes": 0.0}
+    for first, last, rows, window_summary in windows:
+        trn = window_summary.get("T", empty)
+        stmt = window_summary.get("P", empty)
+        print(f"{first:5}-{last:<5} | {rows:9} | {trn['p50_ms']:8.3f} | {trn['p95_ms']:8.3f} | {trn['mean_bytes']:11.0f} | "
+              f"{stmt['p50_ms']:8.3f} | {stmt['p95_ms']:8.3f} | {stmt['mean_bytes']:11.0f}")
+
+def main():
+    parser=argparse.ArgumentParser(description="Replay console sessions through BankingApp.run() and report per-command latency")
+    parser.add_argument("--script", nargs="+", help="recorded sessions, one stdin file per session, instead of generated sessions")
+    parser.add_argument("--repeat", type=int, default=1, help="times the recorded sessions are replayed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=100, help="generated sessions")
+    parser.add_argument("--commands", type=int, default=50, help="commands per generated session")
+    parser.add_argument("--statement-share", type=float, default=0.2, help="share of P commands in generated sessions")
+    parser.add_argument("--report-every", type=int, default=25, help="sessions per window of the growth report")
+    parser.add_argument("--echo", action="store_true", help="pass the console output through to stderr")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args=parser.parse_args()
+
+    if args.script:
+        sessions = []
+        for path in args.script:
+            with open(path) as file:
+                sessions.append(parse_script(file.read().splitlines()))
+        sessions = sessions * args.repeat
+        config = {"scripts": args.script, "repeat": args.repeat}
+    else:
+        total = args.sessions * args.commands
+        workload = Workload(seed=args.seed, accounts=args.accounts, trns_per_account=max(total // args.accounts, 1))
+        sessions = generate_sessions(workload, args.sessions, args.commands, statement_share=args.statement_share)
+        config = {"workload": workload.config(), "sessions": args.sessions, "commands": args.commands,
+                  "statement_share": args.statement_share}
+
+    app = BankingApp()
+    echo = sys.stderr if args.echo else None
+    start = time.perf_counter()
+    all_results = []
+    windows = []
+    for first in range(0, len(sessions), args.report_every):
+        window = sessions[first:first + args.report_every]
+        window_results = [row for session in run_sessions(app, window, echo) for row in session]
+        all_results.extend(window_results)
+        windows.append((first + 1, first + len(window), book_rows(app), summarize(window_results)))
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(all_results)
+    print(f"{len(sessions)} sessions, {len(all_results)} commands in {elapsed:.2f}s")
+    print_report(summary, windows)
+    if args.output:
+        report = {"config": config, "elapsed_sec": elapsed, "commands": summary,
+                  "windows": [{"first_session": first, "last_session": last, "book_rows": rows, "commands": window_summary}
+                              for first, last, rows, window_summary in windows]}
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main()
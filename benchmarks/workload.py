@@ -0,0 +1,103 @@
+import datetime
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+"""
+Seeded synthetic bank workload. The same seed and sizes always produce the same lines.
+"""
+
+class Workload:
+
+    def __init__(self, seed:int=42, accounts:int=1000, trns_per_account:int=50, rule_changes:int=24,
+                 backdated_share:float=0.05, start_date:datetime.date=datetime.date(2023, 1, 1), num_days:int=365):
+        """
+        Constructor
+
+        Args:
+            seed (int, optional): random seed. Defaults to 42.
+            accounts (int, optional): number of accounts. Defaults to 1000.
+            trns_per_account (int, optional): average transactions per account. Defaults to 50.
+            rule_changes (int, optional): number of interest rules over the period. Defaults to 24.
+            backdated_share (float, optional): share of transactions dated before earlier lines of the feed. Defaults to 0.05.
+            start_date (datetime.date, optional): first day of the period. Defaults to 2023-01-01.
+            num_days (int, optional): length of the period in days. Defaults to 365.
+        """
+        self.seed = seed
+        self.accounts = accounts
+        self.trns_per_account = trns_per_account
+        self.rule_changes = rule_changes
+        self.backdated_share = backdated_share
+        self.start_date = start_date
+        self.num_days = num_days
+
+    def config(self) -> dict:
+        """
+        Returns:
+            dict: workload parameters, for the benchmark report
+        """
+        return {"seed": self.seed, "accounts": self.accounts, "trns_per_account": self.trns_per_account,
+                "rule_changes": self.rule_changes, "backdated_share": self.backdated_share,
+                "start_date": self.start_date.strftime("%Y%m%d"), "num_days": self.num_days}
+
+    def account_numbers(self) -> list:
+        """
+        Returns:
+            list: account numbers of the workload
+        """
+        return [f"AC{acc:07}" for acc in range(self.accounts)]
+
+    def transaction_lines(self) -> list:
+        """
+        Generate the transaction feed in <Date> <Account> <Type> <Amount> format. Lines come in date
+        order across all accounts, except the backdated share, which is dated up to 60 days earlier
+
+        Returns:
+            list: transaction lines
+        """
+        rnd = random.Random(self.seed)
+        account_numbers = self.account_numbers()
+        total = self.accounts * self.trns_per_account
+        lines = []
+        for k in range(total):
+            day = k * self.num_days // total
+            if rnd.random() < self.backdated_share:
+                day = max(day - rnd.randint(1, 60), 0)
+            trn_date = self.start_date + datetime.timedelta(days=day)
+            bank_acc_num = account_numbers[rnd.randrange(self.accounts)]
+            if rnd.random() < 0.6:
+                line = f"{trn_date:%Y%m%d} {bank_acc_num} D {rnd.randint(10, 2000)}.{rnd.randint(0, 99):02}"
+            else:
+                line = f"{trn_date:%Y%m%d} {bank_acc_num} W {rnd.randint(1, 300)}.{rnd.randint(0, 99):02}"
+            lines.append(line)
+        return lines
+
+    def interest_rule_lines(self) -> list:
+        """
+        Generate the interest rules in <Date> <RuleId> <Rate in %> format, spread evenly over the period
+
+        Returns:
+            list: interest rule lines
+        """
+        rnd = random.Random(self.seed + 1)
+        lines = []
+        for k in range(self.rule_changes):
+            rule_date = self.start_date + datetime.timedelta(days=k * self.num_days // max(self.rule_changes, 1))
+            lines.append(f"{rule_date:%Y%m%d} RULE{k:04} {rnd.randint(50, 500) // 100}.{rnd.randint(0, 99):02}")
+        return lines
+
+    def months(self) -> list:
+        """
+        Returns:
+            list: Year Months fully inside the period
+        """
+        months = []
+        day = self.start_date
+        end_date = self.start_date + datetime.timedelta(days=self.num_days)
+        while day < end_date:
+            next_month = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+            if day.day == 1 and next_month <= end_date:
+                months.append(f"{day.year:04}{day.month:02}")
+            day = next_month
+        return months
@@ -1,10 +1,20 @@
+import argparse
 import logging
 from datetime import datetime
 
 from banking_app import BankingApp
+from storage import SqliteStorage
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
-    app = BankingApp()
+    parser=argparse.ArgumentParser(description="AwesomeGIC Bank console")
+    parser.add_argument("--data-dir", help="directory of the journal and snapshots, state is kept in memory only if not given")
+    parser.add_argument("--db", help="SQLite database holding the accounts, transactions and interest rules")
+    parser.add_argument("--cache-accounts", type=int, help="with --db, most accounts kept in memory, least recently used are evicted")
+    args=parser.parse_args()
+
+    metrics.install_signal_handler()
+    app = BankingApp(data_dir=args.data_dir, storage=SqliteStorage(args.db, max_accounts=args.cache_accounts) if args.db else None)
     app.run()
\ No newline at end of file
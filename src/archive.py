@@ -0,0 +1,290 @@
+from array import array
+from collections import OrderedDict
+from datetime import date, timedelta
+import logging
+import os
+import struct
+from typing import NamedTuple
+import zlib
+
+from balance_index import BalanceIndex
+from ledger import Ledger
+from utils import utils
+
+logger = logging.getLogger(__name__)
+
+"""
+Archive tier for closed months.
+
+Compaction freezes every month up to a Year Month. For each account, the detail rows of the closed
+months move to one compressed file per month in the archive directory, and the account keeps a
+summary per closed month: opening and closing balance, interest credited and number of rows. The
+balance index keeps a single entry holding the closing balance of the last closed day. Interest of
+the open months only needs that balance, so the working set follows the open activity instead of
+the age of the accounts.
+
+Statements of closed months read the month file back on demand; recently read months are kept
+decoded in a small LRU cache.
+"""
+
+ARCHIVE_MAGIC = b"BANKARC1"
+
+#number of accounts in the month
+_MONTH_HEADER = struct.Struct("<I")
+#account number length, opening balance, number of rows
+_ACCOUNT_HEADER = struct.Struct("<Hqi")
+
+class MonthSummary(NamedTuple):
+    opening_balance: int
+    closing_balance: int
+    interest: int
+    rows: int
+
+class CompactedAccount(NamedTuple):
+    months: dict           #map of Year Month to (opening balance, ordinals, type codes, cents) of the closed rows
+    month_summaries: dict  #map of Year Month to MonthSummary of the closed months
+    ledger: Ledger         #open rows
+    balance_index: BalanceIndex
+    interest_rows: dict
+
+class MonthArchive:
+    """
+    Compressed detail rows of the closed months, one file per Year Month
+    """
+
+    def __init__(self, archive_dir:str, cached_months:int=12):
+        """
+        Constructor
+
+        Args:
+            archive_dir (str): directory of the month files, created on the first write
+            cached_months (int, optional): decoded months kept in memory. Defaults to 12.
+        """
+        self.archive_dir = archive_dir
+        self.cached_months = cached_months
+        self._cache = OrderedDict()
+
+    def month_path(self, yyyymm:int) -> str:
+        """
+        Args:
+            yyyymm (int): Year Month
+
+        Returns:
+            str: path of the month file
+        """
+        return os.path.join(self.archive_dir, f"{yyyymm}.arc")
+
+    def months(self) -> list:
+        """
+        Returns:
+            list: archived Year Months in order
+        """
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(name[:-4] for name in os.listdir(self.archive_dir) if name.endswith(".arc"))
+
+    def write_month(self, yyyymm:int, accounts:dict) -> int:
+        """
+        Write the rows of a closed month. The file is written to a temporary file and renamed
+
+        Args:
+            yyyymm (int): Year Month
+            accounts (dict): map of bank account number to (opening balance, ordinals, type codes, cents),
+                             rows in date order, posting order kept within a day
+
+        Returns:
+            int: compressed size in bytes
+        """
+        parts = [_MONTH_HEADER.pack(len(accounts))]
+        for bank_acc_num, (opening_balance, ordinals, types, cents) in accounts.items():
+            acc_bytes = bank_acc_num.encode()
+            parts.append(_ACCOUNT_HEADER.pack(len(acc_bytes), opening_balance, len(ordinals)))
+            parts.append(acc_bytes)
+            parts.append(array("i", ordinals).tobytes())
+            parts.append(array("B", types).tobytes())
+            parts.append(array("q", cents).tobytes())
+        payload = zlib.compress(b"".join(parts), 6)
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = self.month_path(yyyymm)
+        with open(path + ".tmp", "wb") as f:
+            f.write(ARCHIVE_MAGIC)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self._cache.pop(str(yyyymm), None)
+        return len(payload) + len(ARCHIVE_MAGIC)
+
+    def sync(self) -> None:
+        """
+        Make the renames of the written month files durable
+        """
+        dir_fd = os.open(self.archive_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def read_month(self, yyyymm:int) -> dict:
+        """
+        Get the rows of a closed month, from the cache or the month file
+
+        Args:
+            yyyymm (int): Year Month
+
+        Returns:
+            dict: map of bank account number to (opening balance, ordinals, type codes, cents), empty if the month is not archived
+        """
+        yyyymm = str(yyyymm)
+        accounts = self._cache.get(yyyymm)
+        if accounts is not None:
+            self._cache.move_to_end(yyyymm)
+            return accounts
+
+        path = self.month_path(yyyymm)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "rb") as f:
+            if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                raise ValueError(f"{path} is not an archive month file")
+            payload = memoryview(zlib.decompress(f.read()))
+
+        accounts = {}
+        (num_accounts,) = _MONTH_HEADER.unpack_from(payload, 0)
+        pos = _MONTH_HEADER.size
+        for _ in range(num_accounts):
+            length, opening_balance, num_rows = _ACCOUNT_HEADER.unpack_from(payload, pos)
+            pos += _ACCOUNT_HEADER.size
+            bank_acc_num = bytes(payload[pos:pos+length]).decode()
+            pos += length
+            ordinals = array("i")
+            ordinals.frombytes(payload[pos:pos+4*num_rows])
+            pos += 4*num_rows
+            types = array("B")
+            types.frombytes(payload[pos:pos+num_rows])
+            pos += num_rows
+            cents = array("q")
+            cents.frombytes(payload[pos:pos+8*num_rows])
+            pos += 8*num_rows
+            accounts[bank_acc_num] = (opening_balance, ordinals, types, cents)
+
+        self._cache[yyyymm] = accounts
+        while len(self._cache) > self.cached_months:
+            self._cache.popitem(last=False)
+        return accounts
+
+    def build_transactions(self, bank_acc_num:str, yyyymm:int) -> tuple:
+        """
+        Build the transaction objects of an account for a closed month
+
+        Args:
+            bank_acc_num (str): Bank Account Number
+            yyyymm (int): Year Month
+
+        Returns:
+            tuple: opening balance and map of transaction dates to list of transaction objects, in date order
+        """
+        entry = self.read_month(yyyymm).get(bank_acc_num)
+        if entry is None:
+            return 0, {}
+        opening_balance, ordinals, types, cents = entry
+        #archived rows are already in date order
+        ledger = Ledger.from_columns([ordinals, cents, types], array("i", range(len(ordinals))))
+        return opening_balance, ledger.build_transactions()
+
+def compact_account(bank_acc, through_yyyymm:str) -> CompactedAccount:
+    """
+    Freeze the months of an account up to a Year Month: summarize them, and build the ledger without
+    their rows and the balance index collapsed before the end of the last closed month. The account
+    itself is not changed
+
+    Args:
+        bank_acc (BankAccount): Bank Account object
+        through_yyyymm (str): last Year Month to close
+
+    Returns:
+        CompactedAccount: closed rows in date order and the open state of the account, None if no rows are closed
+    """
+    _, cutoff_date = utils.get_month_first_last_day(through_yyyymm)
+    cutoff = cutoff_date.toordinal()
+    ledger = bank_acc.ledger
+    closed_rows = ledger.get_span(date.min, cutoff_date)
+    if not closed_rows:
+        return None
+
+    months = {}
+    for ordinal, row in zip(closed_rows.ordinals(), closed_rows):
+        yyyymm = utils.get_yyyymm(date.fromordinal(ordinal))
+        entry = months.get(yyyymm)
+        if entry is None:
+            month_first_day, _ = utils.get_month_first_last_day(yyyymm)
+            opening_balance = bank_acc.get_eod_balance(month_first_day - timedelta(days=1))
+            entry = (opening_balance, array("i"), array("B"), array("q"))
+            months[yyyymm] = entry
+        entry[1].append(ordinal)
+        entry[2].append(ledger.types[row])
+        entry[3].append(ledger.cents[row])
+
+    month_summaries = {}
+    for yyyymm, (opening_balance, ordinals, _, _) in months.items():
+        _, month_last_day = utils.get_month_first_last_day(yyyymm)
+        month_summaries[yyyymm] = MonthSummary(opening_balance, bank_acc.get_eod_balance(month_last_day),
+                                                        bank_acc.get_interest(yyyymm), len(ordinals))
+
+    #keep the open rows in posting order, the interest rows follow their new row numbers
+    open_ledger = Ledger()
+    open_index = BalanceIndex()
+    open_index.add(cutoff_date, bank_acc.get_eod_balance(cutoff_date))
+    new_rows = {}
+    for row in range(len(ledger)):
+        ordinal = ledger.ordinals[row]
+        if ordinal > cutoff:
+            trn_date = date.fromordinal(ordinal)
+            new_rows[row] = open_ledger.append(chr(ledger.types[row]), trn_date, ledger.cents[row])
+            open_index.add(trn_date, ledger.signed_cents(row))
+    interest_rows = {yyyymm: new_rows[row] for yyyymm, row in bank_acc.interest_rows.items() if row in new_rows}
+    return CompactedAccount(months, month_summaries, open_ledger, open_index, interest_rows)
+
+def compact(app, through_yyyymm:int, archive:MonthArchive) -> dict:
+    """
+    Close every month up to a Year Month for all accounts, moving their rows to the archive. The month
+    files are durable before any account drops its rows
+
+    Args:
+        app (BankingApp): banking app
+        through_yyyymm (int): last Year Month to close
+        archive (MonthArchive): archive receiving the closed rows
+
+    Returns:
+        dict: number of accounts, months, rows moved and archive bytes written
+    """
+    through_yyyymm = str(through_yyyymm)
+    by_month = {}
+    rows = 0
+    compacted = {}
+    for bank_acc_num, bank_acc in app.accounts.items():
+        compacted_acc = compact_account(bank_acc, through_yyyymm)
+        if compacted_acc is None:
+            continue
+        compacted[bank_acc_num] = compacted_acc
+        for yyyymm, entry in compacted_acc.months.items():
+            by_month.setdefault(yyyymm, {})[bank_acc_num] = entry
+            rows += len(entry[1])
+
+    archive_bytes = 0
+    for yyyymm, month_accounts in sorted(by_month.items()):
+        #a month closed before has no rows left in memory, so nothing is overwritten
+        archive_bytes += archive.write_month(yyyymm, month_accounts)
+    if by_month:
+        archive.sync()
+
+    for bank_acc_num, compacted_acc in compacted.items():
+        bank_acc = app.accounts.get(bank_acc_num)
+        bank_acc.month_summaries.update(compacted_acc.month_summaries)
+        bank_acc.ledger = compacted_acc.ledger
+        bank_acc.balance_index = compacted_acc.balance_index
+        bank_acc.interest_rows = compacted_acc.interest_rows
+        bank_acc.archive = archive
+    logger.info(f"Compacted through {through_yyyymm}: {rows} rows of {len(compacted)} accounts into {len(by_month)} month files")
+    return {"accounts": len(compacted), "months": len(by_month), "rows": rows, "archive_bytes": archive_bytes}
@@ -0,0 +1,192 @@
+from array import array
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+_NONE = -1
+_INF = float("inf")
+
+class BalanceIndex:
+    """
+    Balance index of a bank account, keyed by transaction date.
+
+    The index is a treap (randomised balanced search tree) with one node per transaction date,
+    so transactions can arrive in any date order. Each node keeps the net amount of its date
+    and the lowest running balance within that date, and each subtree keeps its total and its
+    lowest running balance. This gives O(log n) inserts, end of day balance queries and
+    available amount queries for withdrawals, with n the number of transaction dates.
+
+    Nodes are stored in parallel arrays instead of objects to keep the index compact.
+    Amounts are in integer cents.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.root = _NONE
+        self._day = array("i")
+        self._prio = array("d")
+        self._left = array("i")
+        self._right = array("i")
+        self._net = array("q")  #net amount of the date
+        self._low = array("q")  #lowest running balance within the date, relative to the start of the date
+        self._tot = array("q")  #net amount of the subtree
+        self._mn = array("q")   #lowest running balance within the subtree, relative to the start of the subtree
+
+    def __len__(self):
+        return len(self._day)
+
+    def columns(self) -> list:
+        """
+        Returns:
+            list: the node arrays, in the order expected by from_columns
+        """
+        return [self._day, self._prio, self._left, self._right, self._net, self._low, self._tot, self._mn]
+
+    @classmethod
+    def from_columns(cls, root:int, columns:list) -> "BalanceIndex":
+        """
+        Rebuild a balance index from its node arrays, without re-inserting the transactions
+
+        Args:
+            root (int): root node
+            columns (list): node arrays as returned by columns()
+
+        Returns:
+            BalanceIndex: balance index
+        """
+        index = cls()
+        index.root = root
+        index._day, index._prio, index._left, index._right, index._net, index._low, index._tot, index._mn = columns
+        return index
+
+    def total(self) -> int:
+        """
+        Returns:
+            int: balance after all transactions
+        """
+        return self._tot[self.root] if self.root != _NONE else 0
+
+    def add(self, trn_date, amount:int) -> None:
+        """
+        Add an amount after the existing transactions of a date
+
+        Args:
+            trn_date (Date): transaction date
+            amount (int): signed amount, negative for withdrawals
+        """
+        self.root = self._insert(self.root, trn_date.toordinal(), amount)
+
+    def eod_balance(self, on_date) -> int:
+        """
+        Get the balance at the end of a date
+
+        Args:
+            on_date (Date): date
+
+        Returns:
+            int: end of day balance
+        """
+        day = on_date.toordinal()
+        node = self.root
+        balance = 0
+        while node != _NONE:
+            if self._day[node] <= day:
+                left = self._left[node]
+                balance += (self._tot[left] if left != _NONE else 0) + self._net[node]
+                node = self._right[node]
+            else:
+                node = self._left[node]
+        return balance
+
+    def available_on(self, trn_date) -> int:
+        """
+        Get the largest amount that can be withdrawn on a date without any balance,
+        on that date or later, going below zero
+
+        Args:
+            trn_date (Date): withdrawal date
+
+        Returns:
+            int: available amount
+        """
+        #the withdrawal goes after the existing transactions of the date, so it lowers the end of
+        #that date and every running balance on later dates
+        later_low = self._min_from_day(trn_date.toordinal() + 1)
+        return min(self.eod_balance(trn_date), later_low)
+
+    def _min_from_day(self, day:int) -> int:
+        node = self.root
+        before = 0
+        lowest = _INF
+        while node != _NONE:
+            left = self._left[node]
+            left_tot = self._tot[left] if left != _NONE else 0
+            if self._day[node] >= day:
+                start = before + left_tot
+                right = self._right[node]
+                lowest = min(lowest, start + self._low[node])
+                if right != _NONE:
+                    lowest = min(lowest, start + self._net[node] + self._mn[right])
+                node = left
+            else:
+                before += left_tot + self._net[node]
+                node = self._right[node]
+        return lowest
+
+    def _new_node(self, day:int, amount:int) -> int:
+        self._day.append(day)
+        self._prio.append(random.random())
+        self._left.append(_NONE)
+        self._right.append(_NONE)
+        self._net.append(amount)
+        self._low.append(amount)
+        self._tot.append(amount)
+        self._mn.append(amount)
+        return len(self._day) - 1
+
+    def _pull(self, node:int) -> None:
+        left = self._left[node]
+        right = self._right[node]
+        tot = self._net[node]
+        mn = self._low[node]
+        if left != _NONE:
+            left_tot = self._tot[left]
+            mn = min(self._mn[left], left_tot + mn)
+            tot += left_tot
+        if right != _NONE:
+            mn = min(mn, tot + self._mn[right])
+            tot += self._tot[right]
+        self._tot[node] = tot
+        self._mn[node] = mn
+
+    def _insert(self, node:int, day:int, amount:int) -> int:
+        if node == _NONE:
+            return self._new_node(day, amount)
+        node_day = self._day[node]
+        if day == node_day:
+            net = self._net[node] + amount
+            self._low[node] = min(self._low[node], net)
+            self._net[node] = net
+        elif day < node_day:
+            child = self._insert(self._left[node], day, amount)
+            self._left[node] = child
+            if self._prio[child] > self._prio[node]:
+                #rotate right
+                self._left[node] = self._right[child]
+                self._right[child] = node
+                self._pull(node)
+                node = child
+        else:
+            child = self._insert(self._right[node], day, amount)
+            self._right[node] = child
+            if self._prio[child] > self._prio[node]:
+                #rotate left
+                self._right[node] = self._left[child]
+                self._left[child] = node
+                self._pull(node)
+                node = child
+        self._pull(node)
+        return node
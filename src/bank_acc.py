@@ -1,8 +1,10 @@
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import logging
 
 from utils import utils
-from transaction import Transaction
+from utils import metrics
+from ledger import Ledger
+from balance_index import BalanceIndex
 
 logger = logging.getLogger(__name__)
 
@@ -16,47 +18,99 @@ class BankAccount:
             account_number (str): bank account number
         """
         self.account_number = account_number
-        self.balance = 0.0
-        self.transactions = {}
-        self.monthly_trn_dates = {}
-
-    def add_transaction(self, trn_type:str, trn_date, amount:float) -> bool:
+        self.balance = 0
+        self.ledger = Ledger()
+        self.balance_index = BalanceIndex()
+        self.interest_rows = {}
+        #closed months: summary per Year Month, detail rows in the archive
+        self.month_summaries = {}
+        self.archive = None
+
+    @metrics.instrument("BankAccount.add_transaction")
+    def add_transaction(self, trn_type:str, trn_date, cents:int) -> bool:
         """
-        Add a transaction to the transaction list for a bank account
+        Add a transaction to the transaction list for a bank account.
+        The transaction date may be earlier than existing transactions, a withdrawal is accepted only if
+        no balance on or after its date goes below zero
 
         Args:
             trn_type (str): Transaction Type
-            date (_type_): Transaction Date
-            amount (float): Transaction Amount
+            trn_date (Date): Transaction Date
+            cents (int): Transaction Amount in cents
 
         Returns:
-            bool: _description_
+            bool: True if posted, False if a withdrawal exceeds the balance
         """
         if trn_type=="W":
-            if amount > self.balance:
-                print("Insufficient funds for withdrawal.")
+            if cents > self.balance_index.available_on(trn_date):
                 return False
             else:
-                self.balance -= amount
+                self.balance_index.add(trn_date, -cents)
         else:
-            self.balance += amount
-        date_str=trn_date.strftime("%Y%m%d")
-        yyyymm=trn_date.strftime("%Y%m")
+            self.balance_index.add(trn_date, cents)
+        self.balance = self.balance_index.total()
 
-        trn_list=self.transactions.get(trn_date)
-        trn_list=[] if trn_list is None else trn_list
+        self.ledger.append(trn_type, trn_date, cents)
+        return True
+    
+    def load_transaction(self, trn_type:str, trn_date, cents:int) -> None:
+        """
+        Add a stored transaction as it is, without the withdrawal check. Used to rebuild an account
+        from storage in posting order
+
+        Args:
+            trn_type (str): Transaction Type, I for interest
+            trn_date (Date): Transaction Date
+            cents (int): Transaction Amount in cents
+        """
+        row=self.ledger.append(trn_type, trn_date, cents)
+        if trn_type=="I":
+            self.interest_rows[utils.get_yyyymm(trn_date)]=row
+        self.balance_index.add(trn_date, -cents if trn_type=="W" else cents)
+        self.balance = self.balance_index.total()
 
-        trn_id="" if trn_type=="I" else f"{date_str}-{len(trn_list)+1:02}"
-        trn_list.append(Transaction(trn_date,trn_id, trn_type, amount, self.balance))
-        self.transactions[trn_date]=trn_list
+    def post_interest(self, yyyymm:int, cents:int) -> int:
+        """
+        Credit the interest of a Year Month on its last day. The month has a single interest
+        transaction, posting again replaces its amount
 
-        mth_trn_dates=self.monthly_trn_dates.get(yyyymm)
-        mth_trn_dates=[] if mth_trn_dates is None else mth_trn_dates
+        Args:
+            yyyymm (int): Year Month
+            cents (int): interest amount in cents
+
+        Returns:
+            int: change in the balance from the month end onward, in cents
+        """
+        _, month_last_day=utils.get_month_first_last_day(yyyymm)
+        row=self.interest_rows.get(str(yyyymm))
+        if row is None:
+            self.interest_rows[str(yyyymm)]=self.ledger.append("I", month_last_day, cents)
+            delta_cents=cents
+        else:
+            delta_cents=cents-self.ledger.cents[row]
+            self.ledger.set_cents(row, cents)
+
+        if delta_cents:
+            self.balance_index.add(month_last_day, delta_cents)
+            self.balance = self.balance_index.total()
+        return delta_cents
+
+    def get_interest(self, yyyymm:int) -> int:
+        """
+        Get the interest credited for a Year Month
+
+        Args:
+            yyyymm (int): Year Month
+
+        Returns:
+            int: interest amount in cents, 0 if no interest was credited
+        """
+        summary=self.month_summaries.get(str(yyyymm))
+        if summary is not None:
+            return summary.interest
+        row=self.interest_rows.get(str(yyyymm))
+        return 0 if row is None else self.ledger.cents[row]
 
-        mth_trn_dates.append(trn_date)
-        self.monthly_trn_dates[yyyymm]=mth_trn_dates
-        return True
-    
     def print_statement(self, yyyymm:int=None, print_balance:bool=True):
         """
         print transactions
@@ -65,36 +119,101 @@ class BankAccount:
             yyyymm (int, optional): Year Month. Defaults to None.
             print_balance (bool, optional): flag to display balance or not display. Defaults to True.
         """
-        
-        tran_dict = self.transactions if yyyymm is None else self.get_transactions(yyyymm)
+        for line in self.statement_lines(yyyymm, print_balance):
+            print(line)
+
+    @metrics.instrument("BankAccount.statement_lines")
+    def statement_lines(self, yyyymm:int=None, print_balance:bool=True):
+        """
+        Produce the statement lines
+
+        Args:
+            yyyymm (int, optional): Year Month. Defaults to None.
+            print_balance (bool, optional): flag to display balance or not display. Defaults to True.
+
+        Yields:
+            str: statement line
+        """
+        tran_dict = self.get_transactions(yyyymm)
        
-        print(f"Account: {self.account_number}")
+        yield f"Account: {self.account_number}"
         balance_heading="| Balance"
         if not print_balance:
             balance_heading=""
 
-        print(f"Date     | Txn Id      | Type | Amount  {balance_heading}")
+        yield f"Date     | Txn Id      | Type | Amount  {balance_heading}"
+
+        #the transactions are already in date order
+        for trn_list in tran_dict.values():
+            for trn_obj in trn_list:
+                yield trn_obj.format(print_balance)
+
+    def get_eod_balance(self, on_date) -> int:
+        """
+        Get the balance at the end of a date
+
+        Args:
+            on_date (Date): date
+
+        Returns:
+            int: end of day balance in cents, 0 if there are no transactions up to the date. Within closed
+                 months only month ends are kept, in month_summaries
+        """
+        return self.balance_index.eod_balance(on_date)
+
+    def restamp_balances(self, tran_dict:dict, opening_balance:int=None) -> None:
+        """
+        Set the running balance of the transactions from the balance index, so balances stay
+        correct after backdated transactions
 
-        #sort the transactions by date
-        for date in sorted(tran_dict.keys()):
-            trn_list = tran_dict.get(date)
+        Args:
+            tran_dict (dict): map of transaction dates to list of transaction objects, in date order, covering
+                              every transaction between its first and last date
+            opening_balance (int, optional): end of day balance before the first date. Defaults to None to read it from the balance index.
+        """
+        if not tran_dict:
+            return
+        balance=opening_balance
+        if balance is None:
+            balance=self.balance_index.eod_balance(next(iter(tran_dict)) - timedelta(days=1))
+        for trn_list in tran_dict.values():
             for trn_obj in trn_list:
-                trn_obj.print(print_balance)
+                balance += -trn_obj.amount if trn_obj.trn_type=="W" else trn_obj.amount
+                trn_obj.balance=balance
 
-    def get_transactions(self, yyyymm:int) -> dict:
+    @metrics.instrument("BankAccount.get_transactions")
+    def get_transactions(self, yyyymm:int=None) -> dict:
         """
         Get the transactions for a Year Month
 
         Args:
-            yyyymm (int): Year Month
+            yyyymm (int, optional): Year Month. Defaults to None for the transactions of all open months.
 
         Returns:
-            dict: map of transaction dates to list of transaction objects for each transaction dates
-        """
-        mth_trn_dates=self.monthly_trn_dates.get(yyyymm)
-        mth_trn_dates=[] if mth_trn_dates is None else mth_trn_dates
-            
-        tran_dict={}
-        for date in mth_trn_dates:
-            tran_dict[date]=self.transactions.get(date)
+            dict: map of transaction dates to list of transaction objects for each transaction dates, in date order
+        """
+        if yyyymm is not None and str(yyyymm) in self.month_summaries:
+            opening_balance, tran_dict=self.archive.build_transactions(self.account_number, yyyymm)
+            self.restamp_balances(tran_dict, opening_balance)
+            return tran_dict
+        tran_dict=self.ledger.build_transactions(yyyymm)
+        self.restamp_balances(tran_dict)
         return tran_dict
+
+    def get_daily_amounts(self, yyyymm:int) -> dict:
+        """
+        Get the net amount posted on each transaction date of a Year Month, without building
+        the transaction views. The interest credited for the month itself is left out
+
+        Args:
+            yyyymm (int): Year Month
+
+        Returns:
+            dict: map of transaction dates to the net amount of the date in cents, in date order
+        """
+        daily_cents=self.ledger.get_daily_cents(yyyymm)
+        #the month's own interest is credited after the end of day balance of the last day
+        row=self.interest_rows.get(str(yyyymm))
+        if row is not None:
+            daily_cents[self.ledger.ordinals[row]] -= self.ledger.cents[row]
+        return {date.fromordinal(ordinal): cents for ordinal, cents in daily_cents.items()}
@@ -1,8 +1,17 @@
 import logging
-from datetime import datetime, timedelta
+import os
+from datetime import date, datetime, timedelta
 
 from utils import utils
+from utils import metrics
+import archive
 from bank_acc import BankAccount
+from book_totals import BookTotals
+from interest_rules import InterestRuleTimeline, RateDayTable, round_interest
+import month_end
+from journal import Journal
+import parsing
+from storage import MemoryStorage
 
 logger = logging.getLogger(__name__)
 
@@ -154,9 +163,33 @@ Have a nice day!
 ```
     """
 class BankingApp:
-    def __init__(self):
-        self.accounts={}
-        self.interest_rules = {} 
+    def __init__(self, data_dir:str=None, storage=None):
+        """
+        Constructor
+
+        Args:
+            data_dir (str, optional): directory of the journal and snapshots. Defaults to None to keep state in memory only.
+            storage (MemoryStorage, optional): storage backend, e.g. SqliteStorage. Defaults to None for in-memory storage.
+        """
+        if data_dir is not None and storage is not None:
+            raise ValueError("A journal data directory and a storage backend cannot be used together")
+        self.storage=storage if storage is not None else MemoryStorage()
+        self.accounts=self.storage.accounts
+        self.interest_rules = InterestRuleTimeline()
+        self.storage.load_interest_rules(self.interest_rules)
+        self.interest_cache={}
+        self.book_totals=BookTotals()
+        self.storage.load_book_totals(self.book_totals)
+        #months up to closed_through are compacted into the archive
+        self.closed_through=None
+        self.archive=None
+        self.journal=None
+        if data_dir is not None:
+            self.archive=archive.MonthArchive(os.path.join(data_dir, "archive"))
+            journal=Journal(data_dir)
+            #the book totals come back with the snapshot and the replayed records
+            journal.restore(self)
+            self.journal=journal
 
     def run(self):
         """
@@ -167,6 +200,9 @@ class BankingApp:
             print("[T] Input transactions")
             print("[I] Define interest rules")
             print("[P] Print statement")
+            print("[B] Book totals")
+            if metrics.enabled():
+                print("[M] Metrics")
             print("[Q] Quit")
             choice = input("> ").strip().upper()
 
@@ -176,12 +212,18 @@ class BankingApp:
                 self.define_interest_rules()
             elif choice == "P":
                 self.print_statement()
+            elif choice == "B":
+                self.print_book_totals()
+            elif choice == "M" and metrics.enabled():
+                print(metrics.to_prometheus())
             elif choice == "Q":
+                self.close()
                 print("Thank you for banking with AwesomeGIC Bank.")
                 print("Have a nice day!")
                 return
             else:
                 print("Invalid choice. Please try again.")
+            self.commit()
             print("\nIs there anything else you'd like to do?")
 
     def input_transactions(self):
@@ -192,57 +234,54 @@ class BankingApp:
         print("Please enter transaction details in <Date> <Account> <Type> <Amount> format")
         print("or enter blank to go back to main menu): ")
         trn_details = input("> ").strip().upper()
-        split_list=trn_details.split(" ")
-        if len(split_list)>1:
-            if len(split_list)==4:
-                trn_date_str=split_list[0]
-                bank_acc_num=split_list[1]
-                trn_type=split_list[2]
-                amount_str=split_list[3]
-            else:
-                print("Invalid Input Format! Please enter transaction details in <Date> <Account> <Type> <Amount> format (or enter blank to go back to main menu): ")
-                return
-        else:
+        if len(trn_details.split())<=1:
             return
 
-        #validations
-        trn_date=utils.get_date(trn_date_str)
-        if trn_date is None:
-            print("Invalid date format. Please use YYYYMMdd format.")
-            return
-    
-        amount=utils.get_number(amount_str)
-        if amount is None:
-            print("Amount is not a number. Please input a number up to 2 decimal places")
+        error=self.process_transaction(trn_details)
+        if error is not None:
+            print(error)
             return
-        else:
-            if amount <= 0:
-                print("Amount must be greater than zero. Please re-enter.")
-                return
-            else:
-                #up to 2 decimal places
-                if not utils.is_two_decimal_places(amount_str):
-                    print("Amount must be up to 2 decimal places. Please re-enter.")
-                    return
 
-        bank_acc=self.get_bank_acc(bank_acc_num)
-        
+        #print statement
+        bank_acc_num=trn_details.split()[1]
+        self.print_statement_for_acc(self.accounts.get(bank_acc_num),print_balance=False)
+
+    def process_transaction(self, trn_details:str) -> str:
+        """
+        Validate a transaction line and post it to the bank account
+
+        Args:
+            trn_details (str): transaction in <Date> <Account> <Type> <Amount> format, upper-cased
+
+        Returns:
+            str: error message if the transaction is rejected, None if it is posted
+        """
+        record, error=parsing.parse_transaction(trn_details)
+        if error is not None:
+            return error
+        return self.apply_transaction(record)
+
+    def apply_transaction(self, record:parsing.TransactionRecord) -> str:
+        """
+        Post a parsed transaction to the bank account
+
+        Args:
+            record (TransactionRecord): validated transaction
+
+        Returns:
+            str: error message if the transaction is rejected, None if it is posted
+        """
+        if self.is_month_closed(utils.get_yyyymm(record.trn_date)):
+            return "Transactions cannot be posted into a closed month."
+        bank_acc=self.get_bank_acc(record.account)
+
         #add transaction to bank acc
-        if trn_type == "D":
-            if not bank_acc.add_transaction(trn_type, trn_date, amount):
-                return
-        elif trn_type == "W":
-            if not bank_acc.add_transaction(trn_type, trn_date, amount):
-                return
-        else:
-            print("Invalid transaction type. Please use these transaction types: D for deposit, W for withdrawal")
-            return
-        
-        #add back
-        self.accounts[bank_acc_num]=bank_acc
+        if not self.post_transaction(bank_acc, record.trn_type, record.trn_date, record.cents):
+            return "Insufficient funds for withdrawal."
 
-        #print statement
-        self.print_statement_for_acc(bank_acc,print_balance=False)
+        #add back
+        self.accounts[record.account]=bank_acc
+        return None
 
     def define_interest_rules(self):
         """
@@ -252,53 +291,121 @@ class BankingApp:
         print("Please enter interest rules details in <Date> <RuleId> <Rate in %> format")
         print("or enter blank to go back to main menu):")
         interest_rule_details = input("> ").strip().upper()
-        split_list=interest_rule_details.split(" ")
-        
-        if len(split_list)>1:
-            if len(split_list)==3:# TBD while loop
-                interest_date_str=split_list[0]
-                rule_id=split_list[1]
-                rate_str=split_list[2]
-            else:
-                print("Invalid Input Format! Please enter interest rules details in <Date> <RuleId> <Rate in %> format):")
-                return
-        else:
+        if len(interest_rule_details.split())<=1:
             return
 
-        #validations
-        '''
-        * Date should be in YYYYMMdd format
-        * RuleId is string, free format
-        * Interest rate should be greater than 0 and less than 100
-        * If there's any existing rules on the same day, the latest one is kept
-        '''        
-        interest_date=utils.get_date(interest_date_str)
-        if interest_date is None:
-            print("Invalid date format. Please use YYYYMMdd format.")
+        error=self.process_interest_rule(interest_rule_details)
+        if error is not None:
+            print(error)
             return
 
-        rate=utils.get_number(rate_str)
-        if rate is None:
-            print("Amount is not a number. Please input a number up to 2 decimal places")
-        else:
-            if rate <= 0 or rate >=100 :
-                print("Rate must be between 0 and 100. Please re-enter.")
-                return
-    
-        self.interest_rules[interest_date]=(rule_id, rate)
+        self.print_interest_rules()
+
+    def process_interest_rule(self, interest_rule_details:str) -> str:
+        """
+        Validate an interest rule line and add it to the interest rules.
+        If there's any existing rules on the same day, the latest one is kept
+
+        Args:
+            interest_rule_details (str): interest rule in <Date> <RuleId> <Rate in %> format, upper-cased
+
+        Returns:
+            str: error message if the rule is rejected, None if it is added
+        """
+        record, error=parsing.parse_interest_rule(interest_rule_details)
+        if error is not None:
+            return error
+        self.apply_interest_rule(record)
+        return None
+
+    def apply_interest_rule(self, record:parsing.InterestRuleRecord) -> None:
+        """
+        Add a parsed interest rule
+
+        Args:
+            record (InterestRuleRecord): validated interest rule
+        """
+        self.add_interest_rule(record.rule_date, record.rule_id, record.rate_bp)
         logger.info("Interest rule added successfully.")
 
-        self.print_interest_rules()
+    def post_transaction(self, bank_acc:BankAccount, trn_type:str, trn_date, cents:int) -> bool:
+        """
+        Add a transaction to a bank account and record it in the journal
+
+        Args:
+            bank_acc (BankAccount): Bank Account object
+            trn_type (str): Transaction Type
+            trn_date (Date): Transaction Date
+            cents (int): Transaction Amount in cents
+
+        Returns:
+            bool: True if posted, False if a withdrawal exceeds the balance
+        """
+        if not bank_acc.add_transaction(trn_type, trn_date, cents):
+            return False
+        self.invalidate_interest(bank_acc.account_number, utils.get_yyyymm(trn_date))
+        self.book_totals.add(trn_type, trn_date, cents)
+        self.storage.record_transaction(bank_acc.account_number, trn_type, trn_date, cents)
+        if self.journal is not None:
+            self.journal.log_transaction(bank_acc.account_number, trn_type, trn_date, cents)
+        return True
+
+    def add_interest_rule(self, interest_date, rule_id:str, rate_bp:int) -> None:
+        """
+        Add an interest rule and record it in the journal
+
+        Args:
+            interest_date (Date): date the rule takes effect
+            rule_id (str): Rule Id
+            rate_bp (int): interest rate in basis points
+        """
+        self.interest_rules.add(interest_date, rule_id, rate_bp)
+        from_yyyymm=utils.get_yyyymm(interest_date)
+        for bank_acc_num in self.interest_cache.keys():
+            self.invalidate_interest(bank_acc_num, from_yyyymm)
+        self.storage.record_interest_rule(interest_date, rule_id, rate_bp)
+        if self.journal is not None:
+            self.journal.log_interest_rule(interest_date, rule_id, rate_bp)
+
+    def commit(self) -> None:
+        """
+        Make the stored and journaled changes durable, and write a snapshot when one is due
+        """
+        self.storage.commit()
+        if self.journal is None:
+            return
+        self.journal.commit()
+        if self.journal.snapshot_due():
+            self.journal.write_snapshot(self)
+
+    def close(self) -> None:
+        """
+        Commit and close the storage and the journal
+        """
+        self.commit()
+        self.storage.close()
+        if self.journal is not None:
+            self.journal.close()
 
     def print_interest_rules(self) -> None:
         """
         Print interest rules sorted by the date
         """
-        print(f"\n Interest rules:")
-        print("Date     | RuleId | Rate (%)")
-        for int_date in sorted(self.interest_rules.keys()):
-            rule_id, rate = self.interest_rules.get(int_date)
-            print(f"{int_date.strftime("%Y%m%d")} | {rule_id:6} | {rate:7.2f}")
+        print()
+        for line in self.interest_rule_lines():
+            print(line)
+
+    def interest_rule_lines(self):
+        """
+        Produce the interest rule listing sorted by the date
+
+        Yields:
+            str: listing line
+        """
+        yield " Interest rules:"
+        yield "Date     | RuleId | Rate (%)"
+        for int_date, rule_id, rate_bp in self.interest_rules:
+            yield f"{int_date.strftime("%Y%m%d")} | {rule_id:6} | {utils.format_hundredths(rate_bp)}"
 
     def print_statement(self) -> None:
         """
@@ -308,24 +415,66 @@ class BankingApp:
         print("Please enter account and month to generate the statement <Account> <Year><Month>")
         print("(or enter blank to go back to main menu):")
         print_details = input("> ").strip().upper()
-        split_list=print_details.split(" ")
+        split_list=print_details.split()
         
         if len(split_list)>1:
-            if len(split_list)==2:
+            if len(split_list)==2 and parsing.parse_date(split_list[1] + "01") is not None:
                 bank_acc_num=split_list[0]
                 yyyymm=split_list[1]
             else:
-                print("Invalid Input Format! Please enter account and month to generate the statement <Account> <Year><Month>")
+                print(parsing.STATEMENT_FORMAT_ERROR)
                 return
         else:
             return
 
         bank_acc=self.get_bank_acc(bank_acc_num)
 
-        self.calculate_interest_for_acc(bank_acc,yyyymm)
+        self.get_month_interest(bank_acc,yyyymm)
 
         self.print_statement_for_acc(bank_acc, yyyymm=yyyymm)
         
+    def print_book_totals(self) -> None:
+        """
+        To capture the period for Book totals
+        """
+        #202306 202308 or 20230601 20230630
+        print("Please enter the period of the book totals <From> <To>, as <Year><Month> for monthly totals")
+        print("or <Year><Month><Day> for daily totals (or enter blank to go back to main menu):")
+        period_details = input("> ").strip().upper()
+        if len(period_details.split())<=1:
+            return
+
+        period, error=parsing.parse_period(period_details)
+        if error is not None:
+            print(error)
+            return
+
+        for line in self.book_totals_lines(period):
+            print(line)
+
+    def book_totals_lines(self, period:parsing.PeriodRecord):
+        """
+        Produce the bank-wide totals of a period, one line per month or per day with postings, then the period total
+
+        Args:
+            period (PeriodRecord): validated period
+
+        Yields:
+            str: listing line
+        """
+        if period.by_month:
+            rows=self.book_totals.monthly(utils.get_yyyymm(period.first_date), utils.get_yyyymm(period.last_date))
+        else:
+            rows=[(trn_date.strftime("%Y%m%d"), totals) for trn_date, totals in self.book_totals.daily(period.first_date, period.last_date)]
+        rows.append(("Total", self.book_totals.totals(period.first_date, period.last_date)))
+
+        yield "Book totals:"
+        yield "Period   | Deposits     | Count  | Withdrawals  | Count  | Interest   | Balance"
+        for label, totals in rows:
+            yield (f"{label:8} | {utils.format_hundredths(totals.deposits, 12)} | {totals.deposit_count:6} | "
+                   f"{utils.format_hundredths(totals.withdrawals, 12)} | {totals.withdrawal_count:6} | "
+                   f"{utils.format_hundredths(totals.interest, 10)} | {utils.format_hundredths(totals.closing_balance, 12)}")
+
     def print_statement_for_acc(self,bank_acc:BankAccount,
                                 yyyymm:int=None,
                                 print_balance:bool=True
@@ -366,111 +515,243 @@ class BankingApp:
         Returns:
             BankAccount: Bank Account object
         """
-        return BankAccount(bank_acc_num)
+        return self.storage.create_account(bank_acc_num)
         
+    @metrics.instrument("BankingApp.calculate_interest_for_acc")
     def calculate_interest_for_acc(self, bank_acc:BankAccount,yyyymm:int):
         """
         Calculate the interest for a Bank Account Object for a given Year Month
 
+        Interest is applied on the end of day balance. The month is walked once in date order and
+        each span of days with a constant end of day balance is priced from the rate day table.
+
         Args:
             bank_acc (BankAccount): Bank Account Object
             yyyymm (int): Year Month
         """
-        acc_trns=bank_acc.get_transactions(yyyymm)
+        if self.is_month_closed(yyyymm):
+            return
+        month_first_day, _=utils.get_month_first_last_day(yyyymm)
+        opening_balance=bank_acc.get_eod_balance(month_first_day - timedelta(days=1))
+        total_interest, _=self.walk_month_interest(bank_acc, yyyymm, opening_balance)
+        self.credit_interest(bank_acc, yyyymm, round_interest(total_interest))
+
+    def calculate_interest_for_range(self, bank_acc:BankAccount, from_yyyymm:int, to_yyyymm:int, post:bool=True) -> dict:
+        """
+        Calculate the interest of a Bank Account for every month from one Year Month to another in one pass.
+        The end of day balance is carried across month ends, including the interest of the month before,
+        so the ledger is read once and the balance index only for the opening balance
+
+        Args:
+            bank_acc (BankAccount): Bank Account Object
+            from_yyyymm (int): first Year Month
+            to_yyyymm (int): last Year Month
+            post (bool, optional): credit the interest of each month. Defaults to True. If False nothing is changed
+                                   and each month is calculated as if the months before had been credited.
+
+        Returns:
+            dict: map of Year Month to interest in cents, as credited for closed months
+        """
+        months=utils.get_yyyymm_range(from_yyyymm, to_yyyymm)
+        interest={}
+        #closed months are frozen, their interest comes from the summaries
+        while months and self.is_month_closed(months[0]):
+            interest[months[0]]=bank_acc.get_interest(months[0])
+            months.pop(0)
+        if not months:
+            return interest
+        month_first_day, _=utils.get_month_first_last_day(months[0])
+        balance=bank_acc.get_eod_balance(month_first_day - timedelta(days=1))
+
+        for yyyymm in months:
+            total_interest, balance=self.walk_month_interest(bank_acc, yyyymm, balance)
+            cents=round_interest(total_interest)
+            if post:
+                self.credit_interest(bank_acc, yyyymm, cents)
+            #credited on the last day, part of the balance from the next month
+            balance += cents
+            interest[yyyymm]=cents
+        return interest
+
+    @metrics.instrument("BankingApp.walk_month_interest")
+    def walk_month_interest(self, bank_acc:BankAccount, yyyymm:int, opening_balance:int) -> tuple:
+        """
+        Walk the days of a month with a balance change, pricing each span of days with a constant
+        end of day balance from the rate day table. The month's own interest is left out
+
+        Args:
+            bank_acc (BankAccount): Bank Account Object
+            yyyymm (int): Year Month
+            opening_balance (int): end of day balance before the month in cents
+
+        Returns:
+            tuple: annualized interest before rounding, and the end of month balance in cents without the month's interest
+        """
         month_first_day, month_last_day=utils.get_month_first_last_day(yyyymm)
+        daily_amounts=bank_acc.get_daily_amounts(yyyymm)
+        if not self.interest_rules:
+            return 0, opening_balance + sum(daily_amounts.values())
 
+        rate_day_table=self.interest_rules.rate_day_table()
         total_interest=0
+        start_date=month_first_day
+        current_balance=opening_balance
+        for trn_date, amount in daily_amounts.items():
+            if trn_date > start_date:
+                total_interest += self.calculate_interest(rate_day_table,
+                                                          start_date,
+                                                          trn_date - timedelta(days=1),
+                                                          current_balance)
+                start_date=trn_date
+            current_balance += amount
+
+        total_interest += self.calculate_interest(rate_day_table,
+                                                  start_date,
+                                                  month_last_day,
+                                                  current_balance)
+        return total_interest, current_balance
+
+    def get_month_interest(self, bank_acc:BankAccount, yyyymm:int) -> int:
+        """
+        Get the interest of a Bank Account for a given Year Month. It is calculated and credited
+        only if it is not cached yet, or if a transaction or interest rule affecting the month arrived since
 
-        if self.interest_rules:
-            start_date=None
-            end_date=month_last_day
-            current_balance=0
-            # Find the latest interest rule to apply for each trn
-            sorted_trn_dates=sorted(acc_trns.keys(), reverse=True)
-            for trn_date in sorted_trn_dates:
-                trn_list = acc_trns.get(trn_date)
-                last_trn_obj=trn_list[-1]#last trn of the day
-                last_trn_obj.print()   
-            
-                start_date=last_trn_obj.trn_date
-                current_balance=last_trn_obj.balance
-                
-                int_date,rule_id,rate = self.get_applicable_rate(start_date)
-
-                # trn_date to end date    
-                total_interest += self.calculate_interest(start_date,
-                                                          end_date,
-                                                          current_balance,
-                                                          rate)
-
-                # Update for the next period
-                end_date=trn_date - timedelta(days=1)
-    
-                #include int_date to trn date-1 period
-                if int_date > month_first_day and int_date < trn_date:
-                    first_trn_obj=trn_list[0] #first trn of the day
-                    #first trn of trn date - or + amount
-                    eod_balance = (first_trn_obj.balance - first_trn_obj.amount) if first_trn_obj.trn_type=="D" else (first_trn_obj.balance + first_trn_obj.amount)
-                    total_interest += self.calculate_interest(start_date=int_date,
-                                                              end_date=(trn_date - timedelta(days=1)),
-                                                              balance=eod_balance,
-                                                              rate=rate)
-                    end_date=int_date - timedelta(days=1)
-
-            #if needed, add the first period: first day of the month to first trn of month
-            first_trn_date = sorted_trn_dates[-1]
-            if first_trn_date > month_first_day:
-                int_date,rule_id, rate = self.get_applicable_rate(month_first_day)
-                trn_list = acc_trns.get(first_trn_date)
-                first_trn_obj= trn_list[0]#1st trn of the day
-    
-                # balance b4 1st trn = 1st trn of 1st trn date balance - or + trn amt
-                eod_balance = (first_trn_obj.balance - first_trn_obj.amount) if first_trn_obj.trn_type=="D" else (first_trn_obj.balance + first_trn_obj.amount)
+        Args:
+            bank_acc (BankAccount): Bank Account Object
+            yyyymm (int): Year Month
 
-                total_interest += self.calculate_interest(start_date=month_first_day, 
-                                                          end_date=first_trn_date, 
-                                                          balance=eod_balance, 
-                                                          rate=rate)
+        Returns:
+            int: interest credited for the month in cents
+        """
+        acc_cache=self.interest_cache.get(bank_acc.account_number)
+        if acc_cache is not None and str(yyyymm) in acc_cache:
+            return acc_cache[str(yyyymm)]
+        if self.is_month_closed(yyyymm) or bank_acc.account_number not in self.accounts:
+            #an account never posted to is not stored and earns nothing
+            return bank_acc.get_interest(yyyymm)
+        self.calculate_interest_for_acc(bank_acc, yyyymm)
+        return self.interest_cache[bank_acc.account_number][str(yyyymm)]
+
+    def credit_interest(self, bank_acc:BankAccount, yyyymm:int, cents:int) -> None:
+        """
+        Credit or re-credit the interest of a Year Month, cache it and record it in the journal
 
-        bank_acc.add_transaction(trn_type="I", trn_date=month_last_day, amount=total_interest/365)
-        
+        Args:
+            bank_acc (BankAccount): Bank Account Object
+            yyyymm (int): Year Month
+            cents (int): interest amount in cents
+        """
+        if self.is_month_closed(yyyymm):
+            logger.warning(f"Interest of closed month {yyyymm} not changed for {bank_acc.account_number}")
+            return
+        new_row=str(yyyymm) not in bank_acc.interest_rows
+        if new_row and not cents and bank_acc.account_number not in self.accounts:
+            #no zero interest row for an account that is not stored, it would be an orphan row
+            return
+        delta=bank_acc.post_interest(yyyymm, cents)
+        _, month_last_day=utils.get_month_first_last_day(yyyymm)
+        if delta or new_row:
+            self.book_totals.add("I", month_last_day, delta, count=1 if new_row else 0)
+            self.storage.record_interest(bank_acc.account_number, yyyymm, cents)
+            if self.journal is not None:
+                #a new zero row too, so a restart has the same rows and counts
+                self.journal.log_interest(bank_acc.account_number, yyyymm, cents)
+        if delta:
+            #the interest is part of the balance of the following months
+            self.invalidate_interest(bank_acc.account_number, utils.get_yyyymm(month_last_day + timedelta(days=1)))
+        self.interest_cache.setdefault(bank_acc.account_number, {})[str(yyyymm)]=bank_acc.get_interest(yyyymm)
+
+    def invalidate_interest(self, bank_acc_num:str, from_yyyymm:str) -> None:
+        """
+        Drop the cached interest of a Bank Account from a Year Month onward
+
+        Args:
+            bank_acc_num (str): Bank Account Number
+            from_yyyymm (str): first Year Month to drop
+        """
+        acc_cache=self.interest_cache.get(bank_acc_num)
+        if not acc_cache:
+            return
+        for yyyymm in [yyyymm for yyyymm in acc_cache.keys() if yyyymm >= from_yyyymm]:
+            del acc_cache[yyyymm]
 
-    def get_applicable_rate(self, trn_date) :
+    def close_month(self, yyyymm:int) -> dict:
         """
-        Find the applicable interest rate for the given transaction date
+        Calculate and credit the interest of a Year Month for every bank account in one batch
 
         Args:
-            trn_date (Date): Transaction Date
+            yyyymm (int): Year Month
+
+        Returns:
+            dict: map of bank account number to the interest credited
+        """
+        if self.is_month_closed(yyyymm):
+            raise ValueError(f"Month {yyyymm} is compacted and can no longer be closed again")
+        return month_end.close_month(self, yyyymm)
+
+    def is_month_closed(self, yyyymm:int) -> bool:
+        """
+        Args:
+            yyyymm (int): Year Month
 
         Returns:
-            tuple: interest date, rule id and rate
-        """
-        rule_id=0
-        rate=0
-        int_date=None
-        for int_date in sorted(self.interest_rules.keys(),reverse=True):
-            if trn_date >=int_date:
-                rule_id,rate=self.interest_rules.get(int_date)
-                break
-        return int_date,rule_id, rate
-            
-    def calculate_interest(self,start_date, end_date, balance:float, rate:float) -> float:
+            bool: True if the month is compacted into the archive
+        """
+        return self.closed_through is not None and str(yyyymm) <= self.closed_through
+
+    def compact_months(self, through_yyyymm:int, archive_dir:str=None) -> dict:
+        """
+        Freeze every month up to a Year Month: their rows move to the compressed archive and each account
+        keeps a summary per month. Transactions can no longer be posted into these months and their interest
+        is no longer recalculated, so every month not closed since its last change is closed first
+
+        Args:
+            through_yyyymm (int): last Year Month to close
+            archive_dir (str, optional): archive directory. Defaults to None for the archive of the data directory.
+
+        Returns:
+            dict: number of accounts, months, rows moved and archive bytes written
+        """
+        through_yyyymm=str(through_yyyymm)
+        if not self.storage.in_memory:
+            raise ValueError("Compaction needs in-memory storage, the database already keeps the history on disk")
+        if self.closed_through is not None and through_yyyymm < self.closed_through:
+            raise ValueError(f"Months up to {self.closed_through} are already closed")
+        if self.archive is None:
+            if archive_dir is None:
+                raise ValueError("An archive directory is needed without a journal data directory")
+            self.archive=archive.MonthArchive(archive_dir)
+
+        #the frozen interest must be the interest of the frozen rows, months in order as each is part of the next
+        first_ordinals=[bank_acc.ledger.sorted_ordinals[0] for bank_acc in self.accounts.values() if len(bank_acc.ledger)]
+        if first_ordinals:
+            for yyyymm in utils.get_yyyymm_range(utils.get_yyyymm(date.fromordinal(min(first_ordinals))), through_yyyymm):
+                if any(yyyymm not in self.interest_cache.get(acc_num, {}) for acc_num in self.accounts.keys()):
+                    self.close_month(yyyymm)
+
+        stats=archive.compact(self, through_yyyymm, self.archive)
+        self.closed_through=through_yyyymm
+        for acc_cache in self.interest_cache.values():
+            for yyyymm in [yyyymm for yyyymm in acc_cache.keys() if yyyymm <= through_yyyymm]:
+                del acc_cache[yyyymm]
+        if self.journal is not None:
+            #the journal records before the compaction would bring the closed rows back, start from a snapshot
+            self.journal.write_snapshot(self)
+        return stats
+
+    def calculate_interest(self, rate_day_table:RateDayTable, start_date, end_date, balance:int) -> int:
         """
         Calculate the annualized interest for a given period
 
         Args:
+            rate_day_table (RateDayTable): cumulative rate x days of the interest rules
             start_date (Date): Start date of period
             end_date (Date): End date of period
-            balance (float): EOD balance
-            rate (float): interest rate
+            balance (int): EOD balance in cents
 
         Returns:
-            float: annualisaed interest amount
+            int: annualisaed interest in cents x basis points, exact
         """
-        num_days = (end_date - start_date).days + 1  # Include both start and end dates
-        annualized_interest = balance * (rate / 100) * num_days
-
-        #print(f"calculate interest for start={start_date}, end={end_date} for bal={balance} and rate={rate}")
-        #print(f"numdays={num_days} annualised_interest={annualized_interest}")
+        # Include both start and end dates, the rate may change within the period
+        return balance * rate_day_table.rate_days(start_date, end_date)
 
-        return annualized_interest
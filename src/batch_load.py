@@ -0,0 +1,177 @@
+import argparse
+import logging
+import time
+
+from banking_app import BankingApp
+import parsing
+import parallel_close
+from storage import SqliteStorage
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+"""
+Non-interactive bulk ingestion of transaction and interest rule files.
+
+The file layout is the same as data.txt: transaction lines, a blank line, then interest rule lines.
+```
+20230505 AC001 D 100.00
+20230601 AC001 D 150.00
+
+20230101 RULE01 1.95
+```
+Every line goes through the same validation as the console menu, but no statement is printed per line.
+Rejected lines are reported together at the end of the load.
+"""
+
+def load_file(app:BankingApp, file_path:str, chunk_size:int=10000) -> tuple:
+    """
+    Stream a transaction / interest rule file into the banking app. Lines are parsed in chunks with
+    the batch parser, then the records are posted in file order
+
+    Args:
+        app (BankingApp): banking app to load into
+        file_path (str): path of the file in data.txt layout
+        chunk_size (int, optional): lines parsed together. Defaults to 10000.
+
+    Returns:
+        tuple: number of rows read, number of rows posted and list of (line number, line, error) for rejected rows
+    """
+    rows=0
+    posted=0
+    rejected=[]
+    in_rules=False
+
+    def load_chunk(chunk:list, first_line_no:int) -> None:
+        nonlocal rows, posted
+        if in_rules:
+            records, errors=parsing.parse_interest_rules(chunk, first_line_no)
+        else:
+            records, errors=parsing.parse_transactions(chunk, first_line_no)
+        rows+=len(chunk)
+        for line_no, record in records:
+            if in_rules:
+                app.apply_interest_rule(record)
+                error=None
+            else:
+                error=app.apply_transaction(record)
+            if error is None:
+                posted+=1
+            else:
+                errors.append((line_no, chunk[line_no-first_line_no].strip().upper(), error))
+        #keep the rejected lines in file order
+        errors.sort(key=lambda item: item[0])
+        rejected.extend(errors)
+
+    chunk=[]
+    first_line_no=1
+    with open(file_path) as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                #blank line separates transactions from interest rules
+                if chunk:
+                    load_chunk(chunk, first_line_no)
+                    chunk=[]
+                in_rules=True
+                continue
+            if not chunk:
+                first_line_no=line_no
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                load_chunk(chunk, first_line_no)
+                chunk=[]
+    if chunk:
+        load_chunk(chunk, first_line_no)
+    return rows, posted, rejected
+
+def print_load_report(rows:int, posted:int, rejected:list, elapsed:float, max_errors:int=20) -> None:
+    """
+    Print the summary of a bulk load
+
+    Args:
+        rows (int): number of rows read
+        posted (int): number of rows posted
+        rejected (list): list of (line number, line, error) for rejected rows
+        elapsed (float): load time in seconds
+        max_errors (int, optional): maximum number of rejected lines to list. Defaults to 20.
+    """
+    rate=rows/elapsed if elapsed > 0 else 0.0
+    print(f"Rows read: {rows} | Posted: {posted} | Rejected: {len(rejected)}")
+    print(f"Elapsed: {elapsed:.3f}s | {rate:,.0f} rows/sec")
+    if not rejected:
+        return
+
+    error_counts={}
+    for _, _, error in rejected:
+        error_counts[error]=error_counts.get(error, 0)+1
+    print("\nRejected by reason:")
+    for error, count in sorted(error_counts.items(), key=lambda item: -item[1]):
+        print(f"{count:8} | {error}")
+
+    print(f"\nRejected lines (first {min(max_errors, len(rejected))}):")
+    for line_no, details, error in rejected[:max_errors]:
+        print(f"{line_no:8} | {details} | {error}")
+
+def main():
+    parser=argparse.ArgumentParser(description="Bulk load transactions and interest rules into AwesomeGIC Bank")
+    parser.add_argument("file", help="file in data.txt layout: transactions, a blank line, then interest rules")
+    parser.add_argument("--max-errors", type=int, default=20, help="maximum number of rejected lines to list")
+    parser.add_argument("--data-dir", help="directory of the journal and snapshots, state is kept in memory only if not given")
+    parser.add_argument("--db", help="SQLite database holding the accounts, transactions and interest rules")
+    parser.add_argument("--cache-accounts", type=int, help="with --db, most accounts kept in memory, least recently used are evicted")
+    parser.add_argument("--snapshot", action="store_true", help="write a snapshot after loading")
+    parser.add_argument("--close-month", metavar="YYYYMM", help="credit the month-end interest of every account after loading")
+    parser.add_argument("--workers", type=int, help="with --close-month, close the month in this many worker processes")
+    parser.add_argument("--statements", metavar="FILE", help="with --close-month and --workers, also write every month statement to this file")
+    parser.add_argument("--compact-through", metavar="YYYYMM", help="after loading and closing, move the rows of every month up to this one to the archive")
+    parser.add_argument("--archive-dir", help="with --compact-through and no --data-dir, directory of the archive")
+    parser.add_argument("--interactive", action="store_true", help="continue into the console menu after loading")
+    args=parser.parse_args()
+
+    metrics.install_signal_handler()
+    start=time.perf_counter()
+    app=BankingApp(data_dir=args.data_dir, storage=SqliteStorage(args.db, max_accounts=args.cache_accounts) if args.db else None)
+    if args.data_dir or args.db:
+        print(f"State restored in {time.perf_counter()-start:.3f}s")
+
+    start=time.perf_counter()
+    rows, posted, rejected=load_file(app, args.file)
+    app.commit()
+    elapsed=time.perf_counter()-start
+    print_load_report(rows, posted, rejected, elapsed, args.max_errors)
+
+    if args.close_month and args.workers:
+        start=time.perf_counter()
+        credited, report=parallel_close.close_month_parallel(app, args.close_month, workers=args.workers,
+                                                             statements_path=args.statements)
+        elapsed=time.perf_counter()-start
+        print(f"\nMonth-end close {args.close_month}: {len(credited)} accounts with {args.workers} workers")
+        parallel_close.print_shard_report(report, elapsed)
+    elif args.close_month:
+        start=time.perf_counter()
+        credited=app.close_month(args.close_month)
+        elapsed=time.perf_counter()-start
+        print(f"\nMonth-end close {args.close_month}: {len(credited)} accounts in {elapsed:.3f}s")
+
+    if args.compact_through:
+        start=time.perf_counter()
+        stats=app.compact_months(args.compact_through, archive_dir=args.archive_dir)
+        elapsed=time.perf_counter()-start
+        print(f"\nCompacted through {args.compact_through}: {stats['rows']} rows of {stats['accounts']} accounts "
+              f"into {stats['months']} month files, {stats['archive_bytes']} bytes, in {elapsed:.3f}s")
+
+    if args.db:
+        stats=app.accounts.stats()
+        print(f"Account cache: hits {stats['hits']} | misses {stats['misses']} | evictions {stats['evictions']} | "
+              f"resident accounts {stats['resident_accounts']} | resident rows {stats['resident_rows']}")
+
+    if args.snapshot and app.journal is not None:
+        app.journal.write_snapshot(app)
+
+    if args.interactive:
+        app.run()
+    else:
+        app.close()
+
+if __name__ == "__main__":
+    main()
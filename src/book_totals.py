@@ -0,0 +1,242 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+import logging
+from typing import NamedTuple
+
+from utils import utils
+
+logger = logging.getLogger(__name__)
+
+"""
+Bank-wide totals per day, kept up to date as transactions and interest are posted.
+
+Every posting adds its amount and count to the bucket of its date, backdated postings included, so
+the totals of any date range are two prefix sums away instead of a scan of every account. The
+buckets are Fenwick trees (binary indexed trees) over a range of date ordinals that grows when a
+posting falls outside it.
+"""
+
+_DEPOSITS, _DEPOSIT_COUNT, _WITHDRAWALS, _WITHDRAWAL_COUNT, _INTEREST, _INTEREST_COUNT = range(6)
+_NUM_COLUMNS = 6
+
+class PeriodTotals(NamedTuple):
+    deposits: int
+    deposit_count: int
+    withdrawals: int
+    withdrawal_count: int
+    interest: int
+    interest_count: int
+    opening_balance: int
+    closing_balance: int
+
+class BookTotals:
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._base = 0  #ordinal of the first day of the tree range
+        self._size = 0
+        self._trees = [array("q") for _ in range(_NUM_COLUMNS)]
+        #sorted ordinals of the days with postings, for the daily breakdown
+        self._days = []
+        self._day_values = {}
+
+    def __len__(self):
+        return len(self._days)
+
+    def add(self, trn_type:str, trn_date, cents:int, count:int=1) -> None:
+        """
+        Add a posting to the totals of its date
+
+        Args:
+            trn_type (str): Transaction Type, I for interest
+            trn_date (Date): Transaction Date
+            cents (int): Transaction Amount in cents, the change in amount when interest is re-credited
+            count (int, optional): number of postings. Defaults to 1, 0 when interest is re-credited.
+        """
+        if trn_type == "D":
+            column = _DEPOSITS
+        elif trn_type == "W":
+            column = _WITHDRAWALS
+        else:
+            column = _INTEREST
+        ordinal = trn_date.toordinal()
+        values = self._day_values.get(ordinal)
+        if values is None:
+            values = [0]*_NUM_COLUMNS
+            self._day_values[ordinal] = values
+            insort(self._days, ordinal)
+            if not self._base <= ordinal < self._base + self._size:
+                self._grow(ordinal, ordinal)
+        values[column] += cents
+        values[column + 1] += count
+        self._update(ordinal, column, cents)
+        self._update(ordinal, column + 1, count)
+
+    def columns(self) -> list:
+        """
+        Returns:
+            list: the day ordinals and their amounts and counts, in the order expected by from_columns
+        """
+        ordinals = array("i", self._days)
+        values = array("q")
+        for ordinal in self._days:
+            values.extend(self._day_values[ordinal])
+        return [ordinals, values]
+
+    @classmethod
+    def from_columns(cls, columns:list) -> "BookTotals":
+        """
+        Rebuild the totals from their day arrays. Days may still be added with add_day_totals before rebuild()
+
+        Args:
+            columns (list): day arrays as returned by columns()
+
+        Returns:
+            BookTotals: totals, the trees are not built yet
+        """
+        book_totals = cls()
+        ordinals, values = columns
+        for i, ordinal in enumerate(ordinals):
+            book_totals._day_values[ordinal] = values[i*_NUM_COLUMNS:(i+1)*_NUM_COLUMNS].tolist()
+        return book_totals
+
+    def add_day_totals(self, ordinal:int, trn_type:str, cents:int, count:int) -> None:
+        """
+        Add the totals of one transaction type on one day without updating the trees, rebuild() must follow
+
+        Args:
+            ordinal (int): date ordinal
+            trn_type (str): Transaction Type, I for interest
+            cents (int): total amount in cents
+            count (int): number of postings
+        """
+        values = self._day_values.get(ordinal)
+        if values is None:
+            values = [0]*_NUM_COLUMNS
+            self._day_values[ordinal] = values
+        column = _DEPOSITS if trn_type == "D" else _WITHDRAWALS if trn_type == "W" else _INTEREST
+        values[column] += cents
+        values[column + 1] += count
+
+    def rebuild(self) -> None:
+        """
+        Rebuild the date list and the trees from the day totals
+        """
+        self._days = sorted(self._day_values.keys())
+        if self._days and not (self._base <= self._days[0] and self._days[-1] < self._base + self._size):
+            self._grow(self._days[0], self._days[-1])
+        else:
+            self._build()
+
+    def totals(self, from_date, to_date) -> PeriodTotals:
+        """
+        Get the totals of the postings dated from one date to another, both included
+
+        Args:
+            from_date (Date): first date
+            to_date (Date): last date
+
+        Returns:
+            PeriodTotals: amounts and counts of the period, and the book balance at the end of the day before and of the last date
+        """
+        before = self._prefix(from_date.toordinal() - 1)
+        upto = self._prefix(to_date.toordinal())
+        return self._period_totals(before, upto)
+
+    def daily(self, from_date, to_date) -> list:
+        """
+        Get the totals of each date with postings, from one date to another
+
+        Args:
+            from_date (Date): first date
+            to_date (Date): last date
+
+        Returns:
+            list: (Date, PeriodTotals) in date order
+        """
+        lo = bisect_left(self._days, from_date.toordinal())
+        hi = bisect_right(self._days, to_date.toordinal())
+        if lo >= hi:
+            return []
+        result = []
+        before = self._prefix(self._days[lo] - 1)
+        for ordinal in self._days[lo:hi]:
+            values = self._day_values[ordinal]
+            upto = [total + value for total, value in zip(before, values)]
+            result.append((date.fromordinal(ordinal), self._period_totals(before, upto)))
+            before = upto
+        return result
+
+    def monthly(self, from_yyyymm:int, to_yyyymm:int) -> list:
+        """
+        Get the totals of each month, from one Year Month to another
+
+        Args:
+            from_yyyymm (int): first Year Month
+            to_yyyymm (int): last Year Month
+
+        Returns:
+            list: (Year Month, PeriodTotals) in month order
+        """
+        result = []
+        before = None
+        for yyyymm in utils.get_yyyymm_range(from_yyyymm, to_yyyymm):
+            month_first_day, month_last_day = utils.get_month_first_last_day(yyyymm)
+            if before is None:
+                before = self._prefix(month_first_day.toordinal() - 1)
+            upto = self._prefix(month_last_day.toordinal())
+            result.append((yyyymm, self._period_totals(before, upto)))
+            before = upto
+        return result
+
+    def _period_totals(self, before:list, upto:list) -> PeriodTotals:
+        amounts = [total - start for start, total in zip(before, upto)]
+        return PeriodTotals(*amounts, _balance(before), _balance(upto))
+
+    def _update(self, ordinal:int, column:int, value:int) -> None:
+        if not value:
+            return
+        tree = self._trees[column]
+        i = ordinal - self._base + 1
+        while i <= self._size:
+            tree[i] += value
+            i += i & -i
+
+    def _prefix(self, ordinal:int) -> list:
+        sums = [0]*_NUM_COLUMNS
+        i = min(ordinal - self._base + 1, self._size)
+        while i > 0:
+            for column in range(_NUM_COLUMNS):
+                sums[column] += self._trees[column][i]
+            i -= i & -i
+        return sums
+
+    def _grow(self, first:int, last:int) -> None:
+        #cover the current range and the new days with room on both sides, so regrowth is rare
+        if self._size:
+            first = min(first, self._base)
+            last = max(last, self._base + self._size - 1)
+        size = 1024
+        while size < 2*(last - first + 1):
+            size *= 2
+        self._base = first - (size - (last - first + 1))//2
+        self._size = size
+        self._build()
+
+    def _build(self) -> None:
+        for column in range(_NUM_COLUMNS):
+            #linear Fenwick build: each node adds itself to its parent once
+            tree = array("q", bytes(8*(self._size + 1)))
+            for ordinal, values in self._day_values.items():
+                tree[ordinal - self._base + 1] += values[column]
+            for i in range(1, self._size + 1):
+                parent = i + (i & -i)
+                if parent <= self._size:
+                    tree[parent] += tree[i]
+            self._trees[column] = tree
+
+def _balance(sums:list) -> int:
+    return sums[_DEPOSITS] - sums[_WITHDRAWALS] + sums[_INTEREST]
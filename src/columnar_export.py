@@ -0,0 +1,246 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from banking_app import BankingApp
+from storage import SqliteStorage
+import batch_load
+from utils import utils
+
+logger = logging.getLogger(__name__)
+
+"""
+Columnar export of the whole book for analytics, as NumPy .npy files that open as memory maps.
+
+One row per transaction, interest included, grouped by account in account number order and in date
+then posting order within an account, the order of the statements:
+```
+acc_index.npy   int32   index of the account in accounts.npy
+ordinal.npy     int32   transaction date as a proleptic Gregorian ordinal (date.toordinal)
+type.npy        uint8   transaction type code, ord("D"), ord("W") or ord("I")
+cents.npy       int64   amount in cents
+balance.npy     int64   running balance after the row, the Balance column of the statements
+accounts.npy    str     account numbers, sorted
+offsets.npy     int64   first row of each account, plus the total number of rows at the end
+manifest.json           format version and sizes, written last
+```
+Rows of compacted months are read back from the archive, so the export always covers the full history.
+ColumnarBook opens an export without reading the columns and answers per-account and per-month slices.
+"""
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+COLUMNS = {"acc_index": np.int32, "ordinal": np.int32, "type": np.uint8, "cents": np.int64, "balance": np.int64}
+
+_WITHDRAWAL = ord("W")
+
+def ledger_columns(ledger) -> tuple:
+    """
+    Get the rows of a ledger in date order
+
+    Args:
+        ledger (Ledger): bank account ledger
+
+    Returns:
+        tuple: ordinals, type codes and cents as numpy arrays
+    """
+    #the ledger arrays are read in place, then gathered into date order
+    order = np.frombuffer(ledger.order, dtype=np.int32)
+    return (np.frombuffer(ledger.sorted_ordinals, dtype=np.int32),
+            np.frombuffer(ledger.types, dtype=np.uint8)[order],
+            np.frombuffer(ledger.cents, dtype=np.int64)[order])
+
+def export_book(app:BankingApp, out_dir:str) -> dict:
+    """
+    Export every account of the book to columnar .npy files
+
+    Args:
+        app (BankingApp): banking app
+        out_dir (str): directory receiving the files, created if needed
+
+    Returns:
+        dict: the manifest content, with the number of accounts and rows
+    """
+    acc_nums = sorted(app.accounts.keys())
+    counts = np.zeros(len(acc_nums), dtype=np.int64)
+    for i, acc_num in enumerate(acc_nums):
+        bank_acc = app.accounts.get(acc_num)
+        counts[i] = len(bank_acc.ledger) + sum(summary.rows for summary in bank_acc.month_summaries.values())
+    offsets = np.zeros(len(acc_nums) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    num_rows = int(offsets[-1])
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        #an export without its manifest is incomplete
+        os.remove(manifest_path)
+    columns = {name: np.lib.format.open_memmap(os.path.join(out_dir, f"{name}.npy"), mode="w+", dtype=dtype, shape=(num_rows,))
+               for name, dtype in COLUMNS.items()}
+    columns["acc_index"][:] = np.repeat(np.arange(len(acc_nums), dtype=np.int32), counts)
+
+    #archived months come first in each account; each month file is read once, for every account
+    cursors = offsets[:-1].copy()
+    if app.archive is not None and app.closed_through is not None:
+        acc_indexes = {acc_num: i for i, acc_num in enumerate(acc_nums)}
+        for yyyymm in app.archive.months():
+            if yyyymm > app.closed_through:
+                continue
+            for acc_num, (_, ordinals, types, cents) in app.archive.read_month(yyyymm).items():
+                i = acc_indexes[acc_num]
+                _write_rows(columns, cursors[i], np.frombuffer(ordinals, dtype=np.int32),
+                            np.frombuffer(types, dtype=np.uint8), np.frombuffer(cents, dtype=np.int64))
+                cursors[i] += len(ordinals)
+
+    for i, acc_num in enumerate(acc_nums):
+        if not counts[i]:
+            continue
+        bank_acc = app.accounts.get(acc_num)
+        if len(bank_acc.ledger):
+            _write_rows(columns, cursors[i], *ledger_columns(bank_acc.ledger))
+        rows = slice(offsets[i], offsets[i+1])
+        types = columns["type"][rows]
+        cents = columns["cents"][rows]
+        np.cumsum(np.where(types == _WITHDRAWAL, -cents, cents), out=columns["balance"][rows])
+    for column in columns.values():
+        column.flush()
+    del columns
+
+    np.save(os.path.join(out_dir, "accounts.npy"), np.array(acc_nums, dtype=str))
+    np.save(os.path.join(out_dir, "offsets.npy"), offsets)
+    manifest = {"format_version": FORMAT_VERSION, "accounts": len(acc_nums), "rows": num_rows,
+                "columns": {name: np.dtype(dtype).str for name, dtype in COLUMNS.items()}}
+    with open(manifest_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    logger.info(f"Exported {num_rows} rows of {len(acc_nums)} accounts to {out_dir}")
+    return manifest
+
+def _write_rows(columns:dict, start:int, ordinals, types, cents) -> None:
+    rows = slice(start, start + len(ordinals))
+    columns["ordinal"][rows] = ordinals
+    columns["type"][rows] = types
+    columns["cents"][rows] = cents
+
+class ColumnarBook:
+    """
+    Read-only view of a columnar export. Every column is a memory map, so opening costs the same
+    whatever the size of the book, and slices are views into the files
+    """
+
+    def __init__(self, path:str):
+        """
+        Constructor
+
+        Args:
+            path (str): export directory
+        """
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise ValueError(f"{path} is not a complete columnar export")
+        with open(manifest_path) as file:
+            self.manifest = json.load(file)
+        if self.manifest["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar export version {self.manifest['format_version']}")
+        self.columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in COLUMNS}
+        self.accounts = np.load(os.path.join(path, "accounts.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def account_index(self, bank_acc_num:str) -> int:
+        """
+        Args:
+            bank_acc_num (str): Bank Account Number
+
+        Returns:
+            int: index of the account, None if it is not in the export
+        """
+        i = int(np.searchsorted(self.accounts, bank_acc_num))
+        if i < len(self.accounts) and self.accounts[i] == bank_acc_num:
+            return i
+        return None
+
+    def account_rows(self, bank_acc_num:str) -> dict:
+        """
+        Get the rows of an account
+
+        Args:
+            bank_acc_num (str): Bank Account Number
+
+        Returns:
+            dict: map of column name to a view of the account's rows, in date order; empty views if the account is not in the export
+        """
+        i = self.account_index(bank_acc_num)
+        if i is None:
+            return self._rows(0, 0)
+        return self._rows(int(self.offsets[i]), int(self.offsets[i+1]))
+
+    def account_month_rows(self, bank_acc_num:str, yyyymm:int) -> dict:
+        """
+        Get the rows of an account in a Year Month, found by bisection on the account's dates
+
+        Args:
+            bank_acc_num (str): Bank Account Number
+            yyyymm (int): Year Month
+
+        Returns:
+            dict: map of column name to a view of the rows, in date order
+        """
+        i = self.account_index(bank_acc_num)
+        if i is None:
+            return self._rows(0, 0)
+        start, stop = int(self.offsets[i]), int(self.offsets[i+1])
+        month_first_day, month_last_day = utils.get_month_first_last_day(yyyymm)
+        ordinals = self.columns["ordinal"][start:stop]
+        return self._rows(start + int(np.searchsorted(ordinals, month_first_day.toordinal(), side="left")),
+                          start + int(np.searchsorted(ordinals, month_last_day.toordinal(), side="right")))
+
+    def month_rows(self, yyyymm:int) -> dict:
+        """
+        Get the rows of every account in a Year Month
+
+        Args:
+            yyyymm (int): Year Month
+
+        Returns:
+            dict: map of column name to an array of the rows, grouped by account
+        """
+        month_first_day, month_last_day = utils.get_month_first_last_day(yyyymm)
+        ordinals = self.columns["ordinal"]
+        selected = np.flatnonzero((ordinals >= month_first_day.toordinal()) & (ordinals <= month_last_day.toordinal()))
+        return {name: column[selected] for name, column in self.columns.items()}
+
+    def _rows(self, start:int, stop:int) -> dict:
+        return {name: column[start:stop] for name, column in self.columns.items()}
+
+def main():
+    parser=argparse.ArgumentParser(description="Export the AwesomeGIC Bank book as memory-mappable NumPy columns")
+    parser.add_argument("out_dir", help="directory receiving the .npy files")
+    parser.add_argument("--data-dir", help="directory of the journal and snapshots to export from")
+    parser.add_argument("--db", help="SQLite database to export from")
+    parser.add_argument("--cache-accounts", type=int, help="with --db, most accounts kept in memory, least recently used are evicted")
+    parser.add_argument("--load", metavar="FILE", help="file in data.txt layout to load before exporting")
+    args=parser.parse_args()
+
+    app=BankingApp(data_dir=args.data_dir, storage=SqliteStorage(args.db, max_accounts=args.cache_accounts) if args.db else None)
+    if args.load:
+        batch_load.load_file(app, args.load)
+        app.commit()
+
+    start=time.perf_counter()
+    manifest=export_book(app, args.out_dir)
+    elapsed=time.perf_counter()-start
+    print(f"Accounts: {manifest['accounts']} | Rows: {manifest['rows']} | Elapsed: {elapsed:.3f}s")
+
+    start=time.perf_counter()
+    book=ColumnarBook(args.out_dir)
+    print(f"Mapped {len(book)} rows in {(time.perf_counter()-start)*1000:.2f} ms")
+    app.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+from array import array
+from bisect import bisect_left, bisect_right
+import logging
+
+from utils import utils
+
+logger = logging.getLogger(__name__)
+
+def round_interest(annualized_interest:int) -> int:
+    """
+    Turn the annualized interest of a month into the interest to credit,
+    divided by 365 days and rounded half up to cents
+
+    Args:
+        annualized_interest (int): sum of balance in cents x rate in basis points x days
+
+    Returns:
+        int: interest in cents
+    """
+    return utils.div_round_half_up(annualized_interest, 365*10000)
+
+class InterestRuleTimeline:
+    """
+    Interest rules kept in date order, so the rule in force on a date is found by bisection
+    instead of re-sorting the rule dates on every lookup.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._dates = []
+        self._rules = []
+        self._rate_day_table = None
+
+    def add(self, int_date, rule_id:str, rate_bp:int) -> None:
+        """
+        Add an interest rule. If there's an existing rule on the same day, the latest one is kept
+
+        Args:
+            int_date (Date): date the rule takes effect
+            rule_id (str): Rule Id
+            rate_bp (int): interest rate in basis points
+        """
+        idx=bisect_left(self._dates, int_date)
+        if idx < len(self._dates) and self._dates[idx]==int_date:
+            self._rules[idx]=(rule_id, rate_bp)
+        else:
+            self._dates.insert(idx, int_date)
+            self._rules.insert(idx, (rule_id, rate_bp))
+        self._rate_day_table = None
+
+    def rule_in_force(self, on_date):
+        """
+        Find the rule in force on a date, i.e. the latest rule dated on or before it
+
+        Args:
+            on_date (Date): date to look up
+
+        Returns:
+            tuple: interest date, rule id and rate in basis points, or None if no rule is in force yet
+        """
+        idx=bisect_right(self._dates, on_date)-1
+        if idx < 0:
+            return None
+        rule_id, rate=self._rules[idx]
+        return self._dates[idx], rule_id, rate
+
+    def rate_day_table(self) -> "RateDayTable":
+        """
+        Get the cumulative rate x days table for the current rules. It is rebuilt only after a rule change
+        and shared by every account
+
+        Returns:
+            RateDayTable: rate day table
+        """
+        if self._rate_day_table is None:
+            self._rate_day_table = RateDayTable(self._dates, [rate for _, rate in self._rules])
+        return self._rate_day_table
+
+    def first_date(self):
+        """
+        Returns:
+            Date: date of the earliest rule, None if there are no rules
+        """
+        return self._dates[0] if self._dates else None
+
+    def __iter__(self):
+        """
+        Walk the rules in date order
+
+        Yields:
+            tuple: interest date, rule id and rate in basis points
+        """
+        for int_date, (rule_id, rate) in zip(self._dates, self._rules):
+            yield int_date, rule_id, rate
+
+    def __len__(self):
+        return len(self._dates)
+
+class RateDayTable:
+    """
+    Prefix sums of the daily interest rate, one entry per day from the first rule to the last rule.
+    The sum of rates over any span of days is a single subtraction.
+
+    Rates are in basis points, so the sums are exact integers.
+    Days before the first rule have rate 0, days after the last rule keep the last rate.
+    """
+
+    def __init__(self, rule_dates:list, rates_bp:list):
+        """
+        Constructor
+
+        Args:
+            rule_dates (list): rule dates in ascending order
+            rates_bp (list): rate in basis points for each rule date
+        """
+        self.base = rule_dates[0].toordinal() if rule_dates else 0
+        self.last_rate = rates_bp[-1] if rates_bp else 0
+        #cum_rates[i] = sum of the rates of the days before base + i
+        self.cum_rates = array("q", [0])
+        for idx in range(1, len(rule_dates)):
+            num_days = rule_dates[idx].toordinal() - rule_dates[idx-1].toordinal()
+            rate_bp = rates_bp[idx-1]
+            total = self.cum_rates[-1]
+            self.cum_rates.extend(total + rate_bp*day for day in range(1, num_days+1))
+
+    def rate_before(self, ordinal:int) -> int:
+        """
+        Sum of the rates of all days before a day
+
+        Args:
+            ordinal (int): date ordinal
+
+        Returns:
+            int: cumulative basis points x days
+        """
+        offset = ordinal - self.base
+        if offset <= 0:
+            return 0
+        last = len(self.cum_rates) - 1
+        if offset <= last:
+            return self.cum_rates[offset]
+        return self.cum_rates[last] + self.last_rate*(offset - last)
+
+    def rate_days(self, start_date, end_date) -> int:
+        """
+        Sum of the daily rates from start date to end date, both included
+
+        Args:
+            start_date (Date): Start date of period
+            end_date (Date): End date of period
+
+        Returns:
+            int: basis points x days for the period
+        """
+        return self.rate_before(end_date.toordinal()+1) - self.rate_before(start_date.toordinal())
@@ -0,0 +1,178 @@
+import argparse
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import NamedTuple
+
+import numpy as np
+
+from banking_app import BankingApp
+from interest_rules import InterestRuleTimeline, round_interest
+import batch_load
+import month_end
+import parsing
+from storage import SqliteStorage
+from utils import utils
+
+logger = logging.getLogger(__name__)
+
+"""
+What-if interest over hypothetical interest rules, without posting anything.
+
+For each batch of accounts and each month, the end of day balances without the interest credited in
+the range are laid out once as an (accounts x days) array, and the daily rates of every scenario as
+a (days x scenarios) array. A single matrix product prices all scenarios. Each scenario's interest is
+part of its balance from the next month on. That amount is the same every day of the month, so it adds
+scenario interest x the scenario's rate-days for the month, and the balance array is shared by all
+scenarios.
+
+Closed months are frozen: every scenario gets the interest credited for them, from the month summaries.
+"""
+
+class ScenarioResult(NamedTuple):
+    accounts: dict  #map of bank account number to interest over the range in cents
+    months: dict    #map of Year Month to interest of all accounts in cents
+    total: int
+
+def evaluate_scenarios(app:BankingApp, scenarios:dict, from_yyyymm:int, to_yyyymm:int, batch_size:int=1000) -> dict:
+    """
+    Calculate the interest every account would earn from one Year Month to another under each set of
+    interest rules, as BankingApp.calculate_interest_for_range with post=False would for each of them.
+    Neither the rules of the app nor the ledgers are changed
+
+    Args:
+        app (BankingApp): banking app
+        scenarios (dict): map of scenario name to InterestRuleTimeline
+        from_yyyymm (int): first Year Month
+        to_yyyymm (int): last Year Month
+        batch_size (int, optional): accounts calculated together. Defaults to 1000.
+
+    Returns:
+        dict: map of scenario name to ScenarioResult
+    """
+    names=list(scenarios.keys())
+    months=utils.get_yyyymm_range(from_yyyymm, to_yyyymm)
+    closed_months=[yyyymm for yyyymm in months if app.is_month_closed(yyyymm)]
+    open_months=months[len(closed_months):]
+    #the rates do not depend on the accounts, built once per month for all batches
+    month_rates=[np.stack([month_end.build_daily_rates(scenarios[name], yyyymm) for name in names], axis=1)
+                 for yyyymm in open_months]
+
+    acc_nums=list(app.accounts.keys())
+    acc_interest=np.zeros((len(acc_nums), len(names)), dtype=np.int64)
+    month_totals=np.zeros((len(months), len(names)), dtype=np.int64)
+    #in batches, so a bounded account cache does not have to hold the whole book
+    for start in range(0, len(acc_nums), batch_size):
+        accounts=[app.accounts.get(acc_num) for acc_num in acc_nums[start:start+batch_size]]
+        batch_interest=acc_interest[start:start+len(accounts)]
+        for i, yyyymm in enumerate(closed_months):
+            credited=np.fromiter((acc.get_interest(yyyymm) for acc in accounts), dtype=np.int64, count=len(accounts))
+            batch_interest += credited[:, None]
+            month_totals[i] += int(credited.sum())
+        if not open_months:
+            continue
+
+        month_first_day, _=utils.get_month_first_last_day(open_months[0])
+        opening=np.fromiter((acc.get_eod_balance(month_first_day - timedelta(days=1)) for acc in accounts),
+                            dtype=np.int64, count=len(accounts))
+        carried=np.zeros((len(accounts), len(names)), dtype=np.int64)
+        for i, (yyyymm, daily_rates) in enumerate(zip(open_months, month_rates)):
+            eod_balances=_eod_balances(accounts, yyyymm, opening)
+            #exact integer cents x basis points x days, as in month_end.calculate_month_interest
+            annualized_interest=month_end.annualized_interest(eod_balances, daily_rates, carried)
+            interest=round_interest(annualized_interest).astype(np.int64)
+            carried += interest
+            month_totals[len(closed_months) + i] += interest.sum(axis=0)
+            opening=eod_balances[:, -1]
+        batch_interest += carried
+
+    results={}
+    for j, name in enumerate(names):
+        results[name]=ScenarioResult(dict(zip(acc_nums, acc_interest[:, j].tolist())),
+                                     dict(zip(months, month_totals[:, j].tolist())),
+                                     int(acc_interest[:, j].sum()))
+    return results
+
+def _eod_balances(accounts:list, yyyymm:int, opening):
+    #balances without the month's own interest, as BankingApp.walk_month_interest walks them
+    num_days=utils.get_month_first_last_day(yyyymm)[1].day
+    rows=[]
+    cols=[]
+    amounts=[]
+    for row, acc in enumerate(accounts):
+        for trn_date, amount in acc.get_daily_amounts(yyyymm).items():
+            rows.append(row)
+            cols.append(trn_date.day-1)
+            amounts.append(amount)
+    return month_end.eod_matrix(opening, rows, cols, amounts, num_days)
+
+def load_scenario(file_path:str) -> InterestRuleTimeline:
+    """
+    Read a set of interest rules, one <Date> <RuleId> <Rate in %> line per rule
+
+    Args:
+        file_path (str): path of the rule file
+
+    Returns:
+        InterestRuleTimeline: interest rules of the scenario
+    """
+    with open(file_path) as file:
+        records, errors=parsing.parse_interest_rules(file)
+    if errors:
+        line_no, line, error=errors[0]
+        raise ValueError(f"{file_path} line {line_no}: {error} ({line.strip()})")
+    interest_rules=InterestRuleTimeline()
+    for _, record in records:
+        interest_rules.add(record.rule_date, record.rule_id, record.rate_bp)
+    return interest_rules
+
+def main():
+    parser=argparse.ArgumentParser(description="Calculate the interest of the AwesomeGIC Bank book under hypothetical interest rules, without posting")
+    parser.add_argument("from_yyyymm", help="first Year Month")
+    parser.add_argument("to_yyyymm", help="last Year Month")
+    parser.add_argument("scenarios", nargs="+", metavar="RULES", help="interest rule files, one scenario each")
+    parser.add_argument("--data-dir", help="directory of the journal and snapshots to read the book from")
+    parser.add_argument("--db", help="SQLite database to read the book from")
+    parser.add_argument("--cache-accounts", type=int, help="with --db, most accounts kept in memory, least recently used are evicted")
+    parser.add_argument("--load", metavar="FILE", help="file in data.txt layout to load first")
+    parser.add_argument("--top", type=int, default=0, help="also list the accounts with the largest change from the current rules")
+    args=parser.parse_args()
+
+    #the file names are the scenario names in the report
+    names=[os.path.splitext(os.path.basename(path))[0] for path in args.scenarios]
+    for name in names:
+        if name == "current":
+            parser.error("scenario name current is reserved for the rules of the book, rename the file")
+        if names.count(name) > 1:
+            parser.error(f"more than one scenario file is named {name}, scenario names must be unique")
+
+    app=BankingApp(data_dir=args.data_dir, storage=SqliteStorage(args.db, max_accounts=args.cache_accounts) if args.db else None)
+    if args.load:
+        batch_load.load_file(app, args.load)
+        app.commit()
+
+    scenarios={"current": app.interest_rules}
+    for name, path in zip(names, args.scenarios):
+        scenarios[name]=load_scenario(path)
+    start=time.perf_counter()
+    results=evaluate_scenarios(app, scenarios, args.from_yyyymm, args.to_yyyymm)
+    elapsed=time.perf_counter()-start
+
+    current=results["current"]
+    print("Scenario             | Interest     | Change")
+    for name, result in results.items():
+        print(f"{name[:20]:20} | {utils.format_hundredths(result.total, 12)} | {utils.format_hundredths(result.total-current.total, 12)}")
+    for name, result in results.items():
+        if name == "current" or not args.top:
+            continue
+        changes=sorted(((result.accounts[acc_num]-cents, acc_num) for acc_num, cents in current.accounts.items()),
+                       key=lambda change: abs(change[0]), reverse=True)
+        print(f"\n{name}: largest changes")
+        for change, acc_num in changes[:args.top]:
+            print(f"{acc_num:20} | {utils.format_hundredths(change, 12)}")
+    print(f"\nAccounts: {len(current.accounts)} | Scenarios: {len(results)} | Elapsed: {elapsed:.3f}s")
+    app.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+from array import array
+from datetime import date
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+from archive import MonthSummary
+from bank_acc import BankAccount
+from balance_index import BalanceIndex
+from book_totals import BookTotals
+from ledger import Ledger
+from utils import utils
+
+logger = logging.getLogger(__name__)
+
+"""
+Durable state for the banking app: an append-only binary journal of accepted transactions and
+interest rules, plus periodic snapshots of every account.
+
+On startup the latest snapshot is read through a memory map, its ledger, balance index and book totals
+arrays are copied in as whole blocks, and only the journal records written after the snapshot are replayed.
+"""
+
+JOURNAL_FILE = "journal.bin"
+SNAPSHOT_FILE = "snapshot.bin"
+SNAPSHOT_MAGIC = b"BANKSNP6"
+
+_TRANSACTION = 1
+_INTEREST_RULE = 2
+_INTEREST = 3
+
+#kind, date ordinal, amount in cents, transaction type, account number length
+_TRN_RECORD = struct.Struct("<BiqcH")
+#kind, date ordinal, rate in basis points, rule id length
+_RULE_RECORD = struct.Struct("<BiiH")
+#kind, Year Month, amount in cents, account number length
+_INTEREST_RECORD = struct.Struct("<BiqH")
+_KIND = struct.Struct("<B")
+
+#journal offset, number of interest rules, number of accounts
+_SNAPSHOT_HEADER = struct.Struct("<QII")
+#last closed Year Month, 0 if none
+_CLOSED_THROUGH = struct.Struct("<I")
+#opening balance, closing balance, interest, number of rows
+_MONTH_SUMMARY = struct.Struct("<qqqi")
+_RULE_ENTRY = struct.Struct("<iiH")
+_STR_LEN = struct.Struct("<H")
+_ARRAY_HEADER = struct.Struct("<cQ")
+_INDEX_ROOT = struct.Struct("<i")
+_MONTH_COUNT = struct.Struct("<I")
+_INTEREST_ROW = struct.Struct("<i")
+
+class Journal:
+    """
+    Append-only journal with group commit. Records are buffered and written with a single
+    write and fsync once a group is full, or when commit() is called.
+
+    Records may be added from several threads, and commit() may run in another thread than the
+    one adding records. With auto_commit turned off, groups are only written by explicit commit() calls.
+    """
+
+    def __init__(self, data_dir:str, group_size:int=1000, group_interval:float=0.05, snapshot_every:int=1000000):
+        """
+        Constructor
+
+        Args:
+            data_dir (str): directory of the journal and snapshot files
+            group_size (int, optional): number of records written per fsync. Defaults to 1000.
+            group_interval (float, optional): seconds a record may wait in the buffer. Defaults to 0.05.
+            snapshot_every (int, optional): number of journal records between snapshots. Defaults to 1000000.
+        """
+        self.data_dir = data_dir
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.snapshot_every = snapshot_every
+        os.makedirs(data_dir, exist_ok=True)
+        self.journal_path = os.path.join(data_dir, JOURNAL_FILE)
+        self.snapshot_path = os.path.join(data_dir, SNAPSHOT_FILE)
+
+        self.auto_commit = True
+
+        self._buffer = bytearray()
+        self._pending = 0
+        self._first_pending_time = 0.0
+        self._records_since_snapshot = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def log_transaction(self, bank_acc_num:str, trn_type:str, trn_date, cents:int) -> None:
+        """
+        Add an accepted transaction to the journal
+
+        Args:
+            bank_acc_num (str): Bank Account Number
+            trn_type (str): Transaction Type
+            trn_date (Date): Transaction Date
+            cents (int): Transaction Amount in cents
+        """
+        acc_bytes = bank_acc_num.encode()
+        self._add_record(_TRN_RECORD.pack(_TRANSACTION, trn_date.toordinal(), cents, trn_type.encode(), len(acc_bytes)) + acc_bytes)
+
+    def log_interest_rule(self, int_date, rule_id:str, rate_bp:int) -> None:
+        """
+        Add an accepted interest rule to the journal
+
+        Args:
+            int_date (Date): date the rule takes effect
+            rule_id (str): Rule Id
+            rate_bp (int): interest rate in basis points
+        """
+        rule_bytes = rule_id.encode()
+        self._add_record(_RULE_RECORD.pack(_INTEREST_RULE, int_date.toordinal(), rate_bp, len(rule_bytes)) + rule_bytes)
+
+    def log_interest(self, bank_acc_num:str, yyyymm:int, cents:int) -> None:
+        """
+        Add the interest credited to an account for a Year Month to the journal
+
+        Args:
+            bank_acc_num (str): Bank Account Number
+            yyyymm (int): Year Month
+            cents (int): interest amount in cents
+        """
+        acc_bytes = bank_acc_num.encode()
+        self._add_record(_INTEREST_RECORD.pack(_INTEREST, int(yyyymm), cents, len(acc_bytes)) + acc_bytes)
+
+    def _add_record(self, record:bytes) -> None:
+        with self._lock:
+            if self._pending == 0:
+                self._first_pending_time = time.monotonic()
+            self._buffer += record
+            self._pending += 1
+            group_due = self._pending >= self.group_size or time.monotonic() - self._first_pending_time >= self.group_interval
+        if self.auto_commit and group_due:
+            self.commit()
+
+    def commit(self) -> None:
+        """
+        Write the buffered records and fsync the journal
+        """
+        #the write lock keeps groups in the order they were taken from the buffer
+        with self._write_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                data = bytes(self._buffer)
+                count = self._pending
+                self._buffer.clear()
+                self._pending = 0
+            if self._file is None:
+                self._file = open(self.journal_path, "ab")
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._records_since_snapshot += count
+
+    def snapshot_due(self) -> bool:
+        """
+        Returns:
+            bool: True if enough records were committed since the last snapshot
+        """
+        return self._records_since_snapshot >= self.snapshot_every
+
+    def close(self) -> None:
+        """
+        Commit the buffered records and close the journal
+        """
+        self.commit()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def write_snapshot(self, app) -> None:
+        """
+        Write a snapshot of every account and interest rule. The snapshot is written to a temporary
+        file and renamed, so a crash never leaves a partial snapshot behind
+
+        Args:
+            app (BankingApp): banking app
+        """
+        self.commit()
+        journal_offset = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb", buffering=1024*1024) as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(_SNAPSHOT_HEADER.pack(journal_offset, len(app.interest_rules), len(app.accounts)))
+            f.write(_CLOSED_THROUGH.pack(int(app.closed_through or 0)))
+            for int_date, rule_id, rate_bp in app.interest_rules:
+                rule_bytes = rule_id.encode()
+                f.write(_RULE_ENTRY.pack(int_date.toordinal(), rate_bp, len(rule_bytes)))
+                f.write(rule_bytes)
+            for column in app.book_totals.columns():
+                _write_array(f, column)
+            for bank_acc_num, bank_acc in app.accounts.items():
+                _write_str(f, bank_acc_num)
+                for column in bank_acc.ledger.columns():
+                    _write_array(f, column)
+                _write_array(f, bank_acc.ledger.order)
+                f.write(_MONTH_COUNT.pack(len(bank_acc.interest_rows)))
+                for yyyymm, row in bank_acc.interest_rows.items():
+                    _write_str(f, yyyymm)
+                    f.write(_INTEREST_ROW.pack(row))
+                f.write(_MONTH_COUNT.pack(len(bank_acc.month_summaries)))
+                for yyyymm, summary in bank_acc.month_summaries.items():
+                    _write_str(f, yyyymm)
+                    f.write(_MONTH_SUMMARY.pack(*summary))
+                f.write(_INDEX_ROOT.pack(bank_acc.balance_index.root))
+                for column in bank_acc.balance_index.columns():
+                    _write_array(f, column)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._records_since_snapshot = 0
+        logger.info(f"Snapshot written: {len(app.accounts)} accounts, journal offset {journal_offset}")
+
+    def restore(self, app) -> int:
+        """
+        Load the latest snapshot into the banking app and replay the journal records written after it
+
+        Args:
+            app (BankingApp): banking app with no journal attached yet
+
+        Returns:
+            int: number of journal records replayed
+        """
+        journal_offset = 0
+        if os.path.exists(self.snapshot_path):
+            journal_offset = self._load_snapshot(app)
+        replayed = self._replay(app, journal_offset)
+        app.book_totals.rebuild()
+        return replayed
+
+    def _load_snapshot(self, app) -> int:
+        with open(self.snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                if bytes(view[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+                    raise ValueError(f"{self.snapshot_path} is not a snapshot file")
+                pos = len(SNAPSHOT_MAGIC)
+                journal_offset, num_rules, num_accounts = _SNAPSHOT_HEADER.unpack_from(view, pos)
+                pos += _SNAPSHOT_HEADER.size
+                (closed_through,) = _CLOSED_THROUGH.unpack_from(view, pos)
+                pos += _CLOSED_THROUGH.size
+                app.closed_through = str(closed_through) if closed_through else None
+
+                for _ in range(num_rules):
+                    ordinal, rate_bp, length = _RULE_ENTRY.unpack_from(view, pos)
+                    pos += _RULE_ENTRY.size
+                    rule_id = bytes(view[pos:pos+length]).decode()
+                    pos += length
+                    app.interest_rules.add(date.fromordinal(ordinal), rule_id, rate_bp)
+
+                totals_columns = []
+                for _ in range(2):
+                    column, pos = _read_array(view, pos)
+                    totals_columns.append(column)
+                #the journal records replayed next are added before the trees are built once
+                app.book_totals = BookTotals.from_columns(totals_columns)
+
+                for _ in range(num_accounts):
+                    bank_acc_num, pos = _read_str(view, pos)
+                    columns = []
+                    for _ in range(3):
+                        column, pos = _read_array(view, pos)
+                        columns.append(column)
+                    order, pos = _read_array(view, pos)
+                    (num_interest_rows,) = _MONTH_COUNT.unpack_from(view, pos)
+                    pos += _MONTH_COUNT.size
+                    interest_rows = {}
+                    for _ in range(num_interest_rows):
+                        yyyymm, pos = _read_str(view, pos)
+                        (interest_rows[yyyymm],) = _INTEREST_ROW.unpack_from(view, pos)
+                        pos += _INTEREST_ROW.size
+                    month_summaries = {}
+                    (num_summaries,) = _MONTH_COUNT.unpack_from(view, pos)
+                    pos += _MONTH_COUNT.size
+                    for _ in range(num_summaries):
+                        yyyymm, pos = _read_str(view, pos)
+                        month_summaries[yyyymm] = MonthSummary(*_MONTH_SUMMARY.unpack_from(view, pos))
+                        pos += _MONTH_SUMMARY.size
+                    (root,) = _INDEX_ROOT.unpack_from(view, pos)
+                    pos += _INDEX_ROOT.size
+                    index_columns = []
+                    for _ in range(8):
+                        column, pos = _read_array(view, pos)
+                        index_columns.append(column)
+
+                    bank_acc = BankAccount(bank_acc_num)
+                    bank_acc.ledger = Ledger.from_columns(columns, order)
+                    bank_acc.balance_index = BalanceIndex.from_columns(root, index_columns)
+                    bank_acc.interest_rows = interest_rows
+                    if month_summaries:
+                        bank_acc.month_summaries = month_summaries
+                        bank_acc.archive = app.archive
+                    bank_acc.balance = bank_acc.balance_index.total()
+                    app.accounts[bank_acc_num] = bank_acc
+            finally:
+                view.release()
+        logger.info(f"Snapshot loaded: {num_accounts} accounts")
+        return journal_offset
+
+    def _replay(self, app, journal_offset:int) -> int:
+        if not os.path.exists(self.journal_path) or os.path.getsize(self.journal_path) <= journal_offset:
+            return 0
+        replayed = 0
+        #rows of the closed months are in the archive, they must never come back into the ledgers
+        closed_through = app.closed_through or ""
+        cutoff = utils.get_month_first_last_day(closed_through)[1].toordinal() if closed_through else 0
+        with open(self.journal_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                pos = journal_offset
+                end = len(view)
+                while pos < end:
+                    (kind,) = _KIND.unpack_from(view, pos)
+                    if kind == _TRANSACTION:
+                        if pos + _TRN_RECORD.size > end:
+                            break
+                        _, ordinal, cents, trn_type, length = _TRN_RECORD.unpack_from(view, pos)
+                        if pos + _TRN_RECORD.size + length > end:
+                            break
+                        pos += _TRN_RECORD.size
+                        bank_acc_num = bytes(view[pos:pos+length]).decode()
+                        pos += length
+                        if ordinal <= cutoff:
+                            logger.warning(f"Journal transaction of {bank_acc_num} in a closed month skipped")
+                        else:
+                            bank_acc = app.get_bank_acc(bank_acc_num)
+                            if bank_acc.add_transaction(trn_type.decode(), date.fromordinal(ordinal), cents):
+                                app.book_totals.add_day_totals(ordinal, trn_type.decode(), cents, 1)
+                            app.accounts[bank_acc_num] = bank_acc
+                    elif kind == _INTEREST_RULE:
+                        if pos + _RULE_RECORD.size > end:
+                            break
+                        _, ordinal, rate_bp, length = _RULE_RECORD.unpack_from(view, pos)
+                        if pos + _RULE_RECORD.size + length > end:
+                            break
+                        pos += _RULE_RECORD.size
+                        rule_id = bytes(view[pos:pos+length]).decode()
+                        pos += length
+                        app.interest_rules.add(date.fromordinal(ordinal), rule_id, rate_bp)
+                    elif kind == _INTEREST:
+                        if pos + _INTEREST_RECORD.size > end:
+                            break
+                        _, yyyymm, cents, length = _INTEREST_RECORD.unpack_from(view, pos)
+                        if pos + _INTEREST_RECORD.size + length > end:
+                            break
+                        pos += _INTEREST_RECORD.size
+                        bank_acc_num = bytes(view[pos:pos+length]).decode()
+                        pos += length
+                        if str(yyyymm) <= closed_through:
+                            logger.warning(f"Journal interest of {bank_acc_num} for closed month {yyyymm} skipped")
+                        else:
+                            bank_acc = app.get_bank_acc(bank_acc_num)
+                            new_row = str(yyyymm) not in bank_acc.interest_rows
+                            delta = bank_acc.post_interest(yyyymm, cents)
+                            _, month_last_day = utils.get_month_first_last_day(yyyymm)
+                            app.book_totals.add_day_totals(month_last_day.toordinal(), "I", delta, 1 if new_row else 0)
+                            app.accounts[bank_acc_num] = bank_acc
+                    else:
+                        break
+                    replayed += 1
+            finally:
+                view.release()
+
+        if pos < end:
+            #a crash during a group write leaves a partial record at the end, drop it
+            logger.warning(f"Journal truncated at offset {pos}, {end - pos} bytes of partial record dropped")
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(pos)
+        self._records_since_snapshot = replayed
+        logger.info(f"Journal replayed: {replayed} records from offset {journal_offset}")
+        return replayed
+
+def _write_str(f, value:str) -> None:
+    value_bytes = value.encode()
+    f.write(_STR_LEN.pack(len(value_bytes)))
+    f.write(value_bytes)
+
+def _read_str(view, pos:int) -> tuple:
+    (length,) = _STR_LEN.unpack_from(view, pos)
+    pos += _STR_LEN.size
+    return bytes(view[pos:pos+length]).decode(), pos + length
+
+def _write_array(f, values:array) -> None:
+    f.write(_ARRAY_HEADER.pack(values.typecode.encode(), len(values)))
+    f.write(values)
+
+def _read_array(view, pos:int) -> tuple:
+    typecode, length = _ARRAY_HEADER.unpack_from(view, pos)
+    pos += _ARRAY_HEADER.size
+    values = array(typecode.decode())
+    num_bytes = length * values.itemsize
+    values.frombytes(view[pos:pos+num_bytes])
+    return values, pos + num_bytes
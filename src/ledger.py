@@ -0,0 +1,223 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+import logging
+
+from transaction import Transaction
+from utils import utils
+
+logger = logging.getLogger(__name__)
+
+_WITHDRAWAL = ord("W")
+
+class LedgerView:
+    """
+    Rows of a ledger between two positions of its date order. Creating a view copies nothing; iterating
+    takes a slice of the row numbers only. A view is valid until the next row is added
+    """
+    __slots__ = ("ledger", "start", "stop")
+
+    def __init__(self, ledger:"Ledger", start:int, stop:int):
+        """
+        Constructor
+
+        Args:
+            ledger (Ledger): ledger
+            start (int): first position in date order
+            stop (int): position after the last one
+        """
+        self.ledger = ledger
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        """
+        Yields:
+            int: row numbers in date order, posting order kept within a day
+        """
+        #an array slice is a block copy, faster to walk than indexing the ledger row by row
+        return iter(self.ledger.order[self.start:self.stop])
+
+    def ordinals(self) -> array:
+        """
+        Returns:
+            array: date ordinal of each row, in date order
+        """
+        return self.ledger.sorted_ordinals[self.start:self.stop]
+
+class Ledger:
+    """
+    Transactions of a bank account stored as columns instead of one object per transaction.
+
+    Each row holds the transaction date as an ordinal, the amount in integer cents and the transaction
+    type as a one byte code. Rows are kept in the order they are posted, so row numbers never change.
+    A second pair of arrays keeps the row numbers and their dates in date order, updated on insert, so
+    the rows of any month or date range are found by bisection and read in date order without sorting.
+    Transaction objects are only built when a statement or month view is requested.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.ordinals = array("i")
+        self.cents = array("q")
+        self.types = array("B")
+        #row numbers in date order, posting order kept within a day, and their date ordinals
+        self.order = array("i")
+        self.sorted_ordinals = array("i")
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def columns(self) -> list:
+        """
+        Returns:
+            list: the row arrays, in the order expected by from_columns
+        """
+        return [self.ordinals, self.cents, self.types]
+
+    @classmethod
+    def from_columns(cls, columns:list, order:array) -> "Ledger":
+        """
+        Rebuild a ledger from its row arrays
+
+        Args:
+            columns (list): row arrays as returned by columns()
+            order (array): row numbers in date order
+
+        Returns:
+            Ledger: ledger
+        """
+        ledger = cls()
+        ledger.ordinals, ledger.cents, ledger.types = columns
+        ledger.order = order
+        ledger.sorted_ordinals = array("i", map(ledger.ordinals.__getitem__, order))
+        return ledger
+
+    def append(self, trn_type:str, trn_date, cents:int) -> int:
+        """
+        Add a transaction row
+
+        Args:
+            trn_type (str): Transaction Type
+            trn_date (Date): Transaction Date
+            cents (int): Transaction Amount in cents
+
+        Returns:
+            int: row number
+        """
+        row = len(self.ordinals)
+        ordinal = trn_date.toordinal()
+        self.ordinals.append(ordinal)
+        self.cents.append(cents)
+        self.types.append(ord(trn_type))
+
+        #most postings are in date order and go at the end, backdated ones after the rows of their date
+        sorted_ordinals = self.sorted_ordinals
+        if not sorted_ordinals or ordinal >= sorted_ordinals[-1]:
+            sorted_ordinals.append(ordinal)
+            self.order.append(row)
+        else:
+            pos = bisect_right(sorted_ordinals, ordinal)
+            sorted_ordinals.insert(pos, ordinal)
+            self.order.insert(pos, row)
+        return row
+
+    def set_cents(self, row:int, cents:int) -> None:
+        """
+        Change the amount of a row
+
+        Args:
+            row (int): row number
+            cents (int): Transaction Amount in cents
+        """
+        self.cents[row] = cents
+
+    def get_span(self, from_date, to_date) -> LedgerView:
+        """
+        Get the rows dated from one date to another, both included
+
+        Args:
+            from_date (Date): first date
+            to_date (Date): last date
+
+        Returns:
+            LedgerView: rows in date order
+        """
+        return LedgerView(self,
+                          bisect_left(self.sorted_ordinals, from_date.toordinal()),
+                          bisect_right(self.sorted_ordinals, to_date.toordinal()))
+
+    def get_rows(self, yyyymm:int=None) -> LedgerView:
+        """
+        Get the rows of a Year Month
+
+        Args:
+            yyyymm (int, optional): Year Month. Defaults to None for all rows.
+
+        Returns:
+            LedgerView: rows in date order, posting order kept within a day
+        """
+        if yyyymm is None:
+            return LedgerView(self, 0, len(self.order))
+        month_first_day, month_last_day = utils.get_month_first_last_day(yyyymm)
+        return self.get_span(month_first_day, month_last_day)
+
+    def signed_cents(self, row:int) -> int:
+        """
+        Args:
+            row (int): row number
+
+        Returns:
+            int: amount in cents, negative for withdrawals
+        """
+        cents = self.cents[row]
+        return -cents if self.types[row] == _WITHDRAWAL else cents
+
+    def get_daily_cents(self, yyyymm:int) -> dict:
+        """
+        Get the net amount posted on each date of a Year Month
+
+        Args:
+            yyyymm (int): Year Month
+
+        Returns:
+            dict: map of date ordinals to net amount in cents, in date order
+        """
+        cents = self.cents
+        types = self.types
+        rows = self.get_rows(yyyymm)
+        daily_cents = {}
+        for ordinal, row in zip(rows.ordinals(), rows):
+            amount = -cents[row] if types[row] == _WITHDRAWAL else cents[row]
+            daily_cents[ordinal] = daily_cents.get(ordinal, 0) + amount
+        return daily_cents
+
+    def build_transactions(self, yyyymm:int=None) -> dict:
+        """
+        Build the transaction objects of a Year Month
+
+        Args:
+            yyyymm (int, optional): Year Month. Defaults to None for all transactions.
+
+        Returns:
+            dict: map of transaction dates to list of transaction objects, in date order, balances are not set
+        """
+        rows = self.get_rows(yyyymm)
+        tran_dict = {}
+        day = None
+        for ordinal, row in zip(rows.ordinals(), rows):
+            if ordinal != day:
+                day = ordinal
+                trn_date = date.fromordinal(ordinal)
+                date_str = trn_date.strftime("%Y%m%d")
+                trn_list = []
+                tran_dict[trn_date] = trn_list
+            trn_type = chr(self.types[row])
+            trn_id = "" if trn_type == "I" else f"{date_str}-{len(trn_list)+1:02}"
+            trn_list.append(Transaction(trn_date, trn_id, trn_type, self.cents[row], None))
+        return tran_dict
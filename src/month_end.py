@@ -0,0 +1,151 @@
+import logging
+from datetime import timedelta
+
+import numpy as np
+
+from utils import utils
+from interest_rules import round_interest
+
+logger = logging.getLogger(__name__)
+
+"""
+Bank-wide month-end interest close.
+
+The end of day balances of every account are laid out as one (accounts x days) array and the
+rate in force on each day as one array, so the interest of the whole book is a single matrix product.
+"""
+
+def build_eod_balances(accounts:list, yyyymm:int):
+    """
+    Build the end of day balance of every account for every day of a month
+
+    Args:
+        accounts (list): list of BankAccount objects
+        yyyymm (int): Year Month
+
+    Returns:
+        numpy.ndarray: (accounts x days) array of end of day balances in cents
+    """
+    month_first_day, month_last_day=utils.get_month_first_last_day(yyyymm)
+    num_days=month_last_day.day
+    day_before=month_first_day - timedelta(days=1)
+
+    opening=np.fromiter((acc.get_eod_balance(day_before) for acc in accounts), dtype=np.int64, count=len(accounts))
+    rows=[]
+    cols=[]
+    amounts=[]
+    for row, acc in enumerate(accounts):
+        for trn_date, amount in acc.get_daily_amounts(yyyymm).items():
+            rows.append(row)
+            cols.append(trn_date.day-1)
+            amounts.append(amount)
+    return eod_matrix(opening, rows, cols, amounts, num_days)
+
+def eod_matrix(opening, rows, cols, amounts, num_days:int):
+    """
+    Build end of day balances from opening balances and net daily amounts
+
+    Args:
+        opening (sequence): opening balance of each account in cents
+        rows (sequence): account index of each amount
+        cols (sequence): day of the month of each amount, 0 based
+        amounts (sequence): net amount in cents
+        num_days (int): days in the month
+
+    Returns:
+        numpy.ndarray: (accounts x days) array of end of day balances in cents
+    """
+    opening=np.asarray(opening, dtype=np.int64)
+    daily_amounts=np.zeros((len(opening), num_days), dtype=np.int64)
+    np.add.at(daily_amounts, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), np.asarray(amounts, dtype=np.int64))
+    return opening[:, None] + np.cumsum(daily_amounts, axis=1)
+
+def build_daily_rates(interest_rules, yyyymm:int):
+    """
+    Build the rate in force on every day of a month
+
+    Args:
+        interest_rules (InterestRuleTimeline): interest rules
+        yyyymm (int): Year Month
+
+    Returns:
+        numpy.ndarray: rate in basis points for each day of the month
+    """
+    month_first_day, month_last_day=utils.get_month_first_last_day(yyyymm)
+    rate_day_table=interest_rules.rate_day_table()
+    first=month_first_day.toordinal()
+    cum_rates=np.fromiter((rate_day_table.rate_before(day) for day in range(first, month_last_day.toordinal()+2)),
+                          dtype=np.int64)
+    return np.diff(cum_rates)
+
+def annualized_interest(eod_balances, daily_rates, carried=None):
+    """
+    Sum the end of day balance x daily rate of every account over a month, exactly
+
+    Args:
+        eod_balances (numpy.ndarray): (accounts x days) array of end of day balances in cents
+        daily_rates (numpy.ndarray): rate in basis points for each day, or (days x scenarios) rates
+        carried (numpy.ndarray, optional): (accounts x scenarios) amount in cents added to the balance of every day. Defaults to None.
+
+    Returns:
+        numpy.ndarray: cents x basis points x days per account (and scenario), as int64, or as Python ints
+                       when the sums may not fit in int64
+    """
+    rate_days=np.asarray(daily_rates).sum(axis=0)
+    largest=int(np.max(np.abs(eod_balances), initial=0))
+    if carried is not None:
+        largest += int(np.max(np.abs(carried), initial=0))
+    #each sum is at most the largest balance x the rate-days of the month, int64 would wrap around silently past 2**63
+    if largest * int(np.max(np.abs(rate_days), initial=0)) >= 2**63:
+        eod_balances, daily_rates, rate_days=eod_balances.astype(object), np.asarray(daily_rates).astype(object), rate_days.astype(object)
+        if carried is not None:
+            carried=carried.astype(object)
+    total=eod_balances @ daily_rates
+    if carried is not None:
+        total=total + carried * rate_days
+    return total
+
+def calculate_month_interest(accounts:list, interest_rules, yyyymm:int):
+    """
+    Calculate the interest of a month for many accounts at once
+
+    Args:
+        accounts (list): list of BankAccount objects
+        interest_rules (InterestRuleTimeline): interest rules
+        yyyymm (int): Year Month
+
+    Returns:
+        list: interest in cents to credit for each account, same rounding as BankingApp.calculate_interest_for_acc
+    """
+    if not accounts or not interest_rules:
+        return [0]*len(accounts)
+    eod_balances=build_eod_balances(accounts, yyyymm)
+    daily_rates=build_daily_rates(interest_rules, yyyymm)
+    #exact integer cents x basis points x days
+    return [round_interest(total) for total in annualized_interest(eod_balances, daily_rates).tolist()]
+
+def close_month(app, yyyymm:int, batch_size:int=1000) -> dict:
+    """
+    Credit the month-end interest of every account in the bank. Accounts already credited for the month
+    have their interest transaction replaced, not duplicated
+
+    Args:
+        app (BankingApp): banking app
+        yyyymm (int): Year Month
+        batch_size (int, optional): accounts calculated together. Defaults to 1000.
+
+    Returns:
+        dict: map of bank account number to the interest credited in cents
+    """
+    acc_nums=list(app.accounts.keys())
+    credited={}
+    #in batches, so a bounded account cache does not have to hold the whole book
+    for start in range(0, len(acc_nums), batch_size):
+        batch=acc_nums[start:start+batch_size]
+        accounts=[app.accounts.get(acc_num) for acc_num in batch]
+        interest=calculate_month_interest(accounts, app.interest_rules, yyyymm)
+        for acc_num, bank_acc, cents in zip(batch, accounts, interest):
+            app.credit_interest(bank_acc, yyyymm, cents)
+            credited[acc_num]=bank_acc.get_interest(yyyymm)
+    logger.info(f"Month-end close {yyyymm}: interest posted for {len(credited)} accounts")
+    return credited
@@ -0,0 +1,231 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+from utils import utils
+from interest_rules import round_interest
+import month_end
+import statement_export
+
+logger = logging.getLogger(__name__)
+
+"""
+Month-end close spread over worker processes.
+
+The accounts are sorted by account number and cut into contiguous shards of about the same number
+of month transaction rows. Each worker receives its shard as flat arrays (opening balances, and the
+date ordinal, type code and cents of every row of the month), never BankAccount objects, and
+calculates the interest of every account and, if asked, renders their statements to a part file.
+
+Results are merged in shard order, so the interest credited and the statement file are the same
+whatever the number of workers, and the same as month_end.close_month and statement_export.
+"""
+
+_INTEREST = ord("I")
+#months with fewer rows are gathered without numpy, its per-call cost is higher than the copy
+_GATHER_ROWS = 16
+
+class ShardData:
+    """
+    Compact month data of a shard of accounts, cheap to pickle
+    """
+    __slots__ = ("shard", "acc_nums", "openings", "row_counts", "ordinals", "types", "cents")
+
+    def __init__(self, shard:int):
+        """
+        Constructor
+
+        Args:
+            shard (int): shard number
+        """
+        self.shard = shard
+        self.acc_nums = []
+        self.openings = array("q")
+        self.row_counts = array("i")
+        self.ordinals = array("i")
+        self.types = bytearray()
+        self.cents = array("q")
+
+    def add_account(self, bank_acc, yyyymm:str, day_before) -> None:
+        """
+        Add the month rows of an account, in date then posting order
+
+        Args:
+            bank_acc (BankAccount): Bank Account object
+            yyyymm (str): Year Month
+            day_before (Date): day before the month
+        """
+        ledger = bank_acc.ledger
+        view = ledger.get_rows(yyyymm)
+        self.acc_nums.append(bank_acc.account_number)
+        self.openings.append(bank_acc.get_eod_balance(day_before))
+        self.row_counts.append(len(view))
+        #the dates are a block copy of the date order, the other columns are gathered by row number
+        self.ordinals += view.ordinals()
+        if len(view) < _GATHER_ROWS:
+            rows = ledger.order[view.start:view.stop]
+            self.types += bytes(map(ledger.types.__getitem__, rows))
+            self.cents.extend(map(ledger.cents.__getitem__, rows))
+        else:
+            rows = np.frombuffer(ledger.order, dtype=np.int32)[view.start:view.stop]
+            self.types += np.frombuffer(ledger.types, dtype=np.uint8)[rows].tobytes()
+            self.cents.frombytes(np.frombuffer(ledger.cents, dtype=np.int64)[rows].tobytes())
+
+def plan_shards(app, yyyymm:str, num_shards:int) -> list:
+    """
+    Cut the accounts, in account number order, into contiguous shards of about the same number of month rows
+
+    Args:
+        app (BankingApp): banking app
+        yyyymm (str): Year Month
+        num_shards (int): number of shards
+
+    Returns:
+        list: list of account number lists, one per shard
+    """
+    acc_nums = sorted(app.accounts.keys())
+    weights = [len(app.accounts.get(acc_num).ledger.get_rows(yyyymm)) + 1 for acc_num in acc_nums]
+    target = sum(weights) / max(num_shards, 1)
+    shards = []
+    current = []
+    weight = 0
+    for acc_num, acc_weight in zip(acc_nums, weights):
+        current.append(acc_num)
+        weight += acc_weight
+        if weight >= target and len(shards) < num_shards - 1:
+            shards.append(current)
+            current = []
+            weight = 0
+    if current or not shards:
+        shards.append(current)
+    return shards
+
+def close_shard(data:ShardData, yyyymm:str, daily_rates:list, part_path:str=None) -> tuple:
+    """
+    Calculate the interest of a shard and render its statements. Runs in a worker process
+
+    Args:
+        data (ShardData): shard month data
+        yyyymm (str): Year Month
+        daily_rates (list): rate in basis points for each day of the month
+        part_path (str, optional): file receiving the shard's statements. Defaults to None for no statements.
+
+    Returns:
+        tuple: shard number, list of interest in cents per account, seconds spent, statement lines written
+    """
+    start = time.perf_counter()
+    month_first_day, month_last_day = utils.get_month_first_last_day(yyyymm)
+    first = month_first_day.toordinal()
+    last = month_last_day.toordinal()
+
+    #the month's own interest row is left out, as in BankAccount.get_daily_amounts
+    acc_index = np.repeat(np.arange(len(data.acc_nums)), np.asarray(data.row_counts, dtype=np.intp))
+    ordinals = np.asarray(data.ordinals, dtype=np.int64)
+    types = np.frombuffer(bytes(data.types), dtype=np.uint8)
+    cents = np.asarray(data.cents, dtype=np.int64)
+    signed = np.where(types == ord("W"), -cents, cents)
+    keep = types != _INTEREST
+    eod_balances = month_end.eod_matrix(data.openings, acc_index[keep], ordinals[keep] - first, signed[keep], last - first + 1)
+    annualized = month_end.annualized_interest(eod_balances, np.asarray(daily_rates, dtype=np.int64))
+    interest = [round_interest(total) for total in annualized.tolist()]
+
+    lines = 0
+    if part_path is not None:
+        with open(part_path, "w", buffering=statement_export.BUFFER_SIZE) as file:
+            pos = 0
+            for acc_num, opening, count, cents_due in zip(data.acc_nums, data.openings, data.row_counts, interest):
+                rows = [(data.ordinals[row], data.types[row], data.cents[row]) for row in range(pos, pos + count)]
+                pos += count
+                #credit or re-credit the month's interest row as BankAccount.post_interest does
+                for k, row in enumerate(rows):
+                    if row[1] == _INTEREST:
+                        rows[k] = (row[0], _INTEREST, cents_due)
+                        break
+                else:
+                    rows.append((last, _INTEREST, cents_due))
+                lines += statement_export.write_lines(file, statement_export.format_statement(acc_num, opening, rows))
+    return data.shard, interest, time.perf_counter() - start, lines
+
+def close_month_parallel(app, yyyymm:str, workers:int=None, statements_path:str=None) -> tuple:
+    """
+    Credit the month-end interest of every account using a pool of worker processes, and optionally
+    write every month statement to one file
+
+    Args:
+        app (BankingApp): banking app
+        yyyymm (str): Year Month
+        workers (int, optional): number of worker processes. Defaults to None for the number of CPUs.
+        statements_path (str, optional): file receiving the statements in account number order. Defaults to None.
+
+    Returns:
+        tuple: map of bank account number to the interest credited in cents, and list of per-shard
+               (shard, accounts, rows, seconds)
+    """
+    yyyymm = str(yyyymm)
+    if app.is_month_closed(yyyymm):
+        raise ValueError(f"Month {yyyymm} is compacted and can no longer be closed again")
+    workers = workers or os.cpu_count() or 1
+    month_first_day, _ = utils.get_month_first_last_day(yyyymm)
+    day_before = month_first_day - timedelta(days=1)
+    if app.interest_rules:
+        daily_rates = month_end.build_daily_rates(app.interest_rules, yyyymm).tolist()
+    else:
+        daily_rates = [0]*utils.get_month_first_last_day(yyyymm)[1].day
+
+    shards = plan_shards(app, yyyymm, workers)
+    part_paths = [None]*len(shards)
+    if statements_path is not None:
+        part_paths = [f"{statements_path}.part{shard:04}" for shard in range(len(shards))]
+
+    results = [None]*len(shards)
+    report = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for shard, acc_nums in enumerate(shards):
+            data = ShardData(shard)
+            for acc_num in acc_nums:
+                data.add_account(app.accounts.get(acc_num), yyyymm, day_before)
+            futures.append(pool.submit(close_shard, data, yyyymm, daily_rates, part_paths[shard]))
+            report.append([shard, len(acc_nums), len(data.cents), 0.0])
+        for future in futures:
+            shard, interest, seconds, _ = future.result()
+            results[shard] = interest
+            report[shard][3] = seconds
+
+    credited = {}
+    for acc_nums, interest in zip(shards, results):
+        for acc_num, cents in zip(acc_nums, interest):
+            bank_acc = app.accounts.get(acc_num)
+            app.credit_interest(bank_acc, yyyymm, cents)
+            credited[acc_num] = bank_acc.get_interest(yyyymm)
+
+    if statements_path is not None:
+        with open(statements_path, "wb") as out:
+            for part_path in part_paths:
+                with open(part_path, "rb") as part:
+                    shutil.copyfileobj(part, out, statement_export.BUFFER_SIZE)
+                os.remove(part_path)
+    logger.info(f"Parallel month-end close {yyyymm}: {len(credited)} accounts in {len(shards)} shards")
+    return credited, [tuple(row) for row in report]
+
+def print_shard_report(report:list, elapsed:float) -> None:
+    """
+    Print the per-shard timing and the skew between shards
+
+    Args:
+        report (list): per-shard (shard, accounts, rows, seconds)
+        elapsed (float): wall clock time of the close in seconds
+    """
+    print("Shard | Accounts | Rows      | Seconds")
+    for shard, accounts, rows, seconds in report:
+        print(f"{shard:5} | {accounts:8} | {rows:9} | {seconds:7.3f}")
+    seconds = [row[3] for row in report]
+    mean = sum(seconds) / len(seconds) if seconds else 0.0
+    skew = max(seconds) / mean if mean > 0 else 1.0
+    print(f"Elapsed: {elapsed:.3f}s | Shard time total: {sum(seconds):.3f}s | Skew (max/mean): {skew:.2f}")
@@ -0,0 +1,202 @@
+from datetime import date
+import logging
+import sys
+from typing import NamedTuple
+
+from utils import utils
+
+logger = logging.getLogger(__name__)
+
+"""
+Parsing and validation of transaction and interest rule lines.
+
+Each line is split once on whitespace, so repeated spaces between fields are accepted, and parsed
+into a typed record. Dates are read as fixed-width YYYYMMDD and cached, so every line with the same
+date gets the same date object. The batch functions parse many lines at once and return the records
+and the errors with their line numbers.
+"""
+
+TRANSACTION_FORMAT_ERROR = "Invalid Input Format! Please enter transaction details in <Date> <Account> <Type> <Amount> format (or enter blank to go back to main menu): "
+INTEREST_RULE_FORMAT_ERROR = "Invalid Input Format! Please enter interest rules details in <Date> <RuleId> <Rate in %> format):"
+DATE_ERROR = "Invalid date format. Please use YYYYMMdd format."
+PERIOD_FORMAT_ERROR = "Invalid Input Format! Please enter the period in <From> <To> format, as YYYYMM YYYYMM or YYYYMMdd YYYYMMdd"
+STATEMENT_FORMAT_ERROR = "Invalid Input Format! Please enter account and month to generate the statement <Account> <Year><Month>"
+
+#cleared when full, valid dates only
+_DATE_CACHE_SIZE = 100000
+_date_cache = {}
+
+class TransactionRecord(NamedTuple):
+    trn_date: date
+    account: str
+    trn_type: str
+    cents: int
+
+class InterestRuleRecord(NamedTuple):
+    rule_date: date
+    rule_id: str
+    rate_bp: int
+
+class PeriodRecord(NamedTuple):
+    first_date: date
+    last_date: date
+    by_month: bool
+
+def parse_date(input_str:str) -> date:
+    """
+    Parse a fixed-width YYYYMMDD date
+
+    Args:
+        input_str (str): date string, e.g. 20230626
+
+    Returns:
+        date: date, None if the string is not a valid YYYYMMDD date
+    """
+    cached = _date_cache.get(input_str)
+    if cached is not None:
+        return cached
+    if len(input_str) != 8 or not (input_str.isascii() and input_str.isdecimal()):
+        return None
+    try:
+        parsed = date(int(input_str[:4]), int(input_str[4:6]), int(input_str[6:]))
+    except ValueError:
+        return None
+    if len(_date_cache) >= _DATE_CACHE_SIZE:
+        _date_cache.clear()
+    _date_cache[input_str] = parsed
+    return parsed
+
+def parse_transaction(trn_details:str) -> tuple:
+    """
+    Parse a transaction line
+
+    Args:
+        trn_details (str): transaction in <Date> <Account> <Type> <Amount> format, upper-cased
+
+    Returns:
+        tuple: TransactionRecord and None, or None and the error message
+    """
+    fields = trn_details.split()
+    if len(fields) != 4:
+        return None, TRANSACTION_FORMAT_ERROR
+    trn_date_str, bank_acc_num, trn_type, amount_str = fields
+
+    trn_date = parse_date(trn_date_str)
+    if trn_date is None:
+        return None, DATE_ERROR
+
+    parsed_amount = utils.parse_hundredths(amount_str)
+    if parsed_amount is None:
+        return None, "Amount is not a number. Please input a number up to 2 decimal places"
+    cents, two_decimal_places = parsed_amount
+    if cents <= 0:
+        return None, "Amount must be greater than zero. Please re-enter."
+    if not two_decimal_places:
+        return None, "Amount must be up to 2 decimal places. Please re-enter."
+
+    if trn_type not in ("D", "W"):
+        return None, "Invalid transaction type. Please use these transaction types: D for deposit, W for withdrawal"
+    return TransactionRecord(trn_date, sys.intern(bank_acc_num), trn_type, cents), None
+
+def parse_interest_rule(interest_rule_details:str) -> tuple:
+    """
+    Parse an interest rule line
+    * Date should be in YYYYMMdd format
+    * RuleId is string, free format
+    * Interest rate should be greater than 0 and less than 100
+
+    Args:
+        interest_rule_details (str): interest rule in <Date> <RuleId> <Rate in %> format, upper-cased
+
+    Returns:
+        tuple: InterestRuleRecord and None, or None and the error message
+    """
+    fields = interest_rule_details.split()
+    if len(fields) != 3:
+        return None, INTEREST_RULE_FORMAT_ERROR
+    interest_date_str, rule_id, rate_str = fields
+
+    interest_date = parse_date(interest_date_str)
+    if interest_date is None:
+        return None, DATE_ERROR
+
+    parsed_rate = utils.parse_hundredths(rate_str)
+    if parsed_rate is None:
+        return None, "Rate is not a number. Please input a number up to 2 decimal places"
+    rate_bp, two_decimal_places = parsed_rate
+    if rate_bp <= 0 or rate_bp >= 10000:
+        return None, "Rate must be between 0 and 100. Please re-enter."
+    if not two_decimal_places:
+        return None, "Rate must be up to 2 decimal places. Please re-enter."
+    return InterestRuleRecord(interest_date, rule_id, rate_bp), None
+
+def parse_period(period_details:str) -> tuple:
+    """
+    Parse a period of two Year Months, for monthly totals, or of two dates, for daily totals
+
+    Args:
+        period_details (str): period in <From> <To> format, both YYYYMM or both YYYYMMdd
+
+    Returns:
+        tuple: PeriodRecord and None, or None and the error message
+    """
+    fields = period_details.split()
+    if len(fields) != 2:
+        return None, PERIOD_FORMAT_ERROR
+    from_str, to_str = fields
+    if len(from_str) == 6 and len(to_str) == 6:
+        first_date = parse_date(from_str + "01")
+        last_month_first_day = parse_date(to_str + "01")
+        if first_date is None or last_month_first_day is None:
+            return None, PERIOD_FORMAT_ERROR
+        _, last_date = utils.get_month_first_last_day(to_str)
+        by_month = True
+    else:
+        first_date = parse_date(from_str)
+        last_date = parse_date(to_str)
+        if first_date is None or last_date is None:
+            return None, PERIOD_FORMAT_ERROR
+        by_month = False
+    if last_date < first_date:
+        return None, "The end of the period must not be before its start."
+    return PeriodRecord(first_date, last_date, by_month), None
+
+def _parse_lines(parse_line, lines, first_line_no:int) -> tuple:
+    records = []
+    errors = []
+    for line_no, line in enumerate(lines, start=first_line_no):
+        details = line.strip().upper()
+        if not details:
+            continue
+        record, error = parse_line(details)
+        if error is None:
+            records.append((line_no, record))
+        else:
+            errors.append((line_no, details, error))
+    return records, errors
+
+def parse_transactions(lines, first_line_no:int=1) -> tuple:
+    """
+    Parse many transaction lines, blank lines are skipped
+
+    Args:
+        lines (iterable): transaction lines, any case, with or without line endings
+        first_line_no (int, optional): line number of the first line. Defaults to 1.
+
+    Returns:
+        tuple: list of (line number, TransactionRecord) and list of (line number, line, error)
+    """
+    return _parse_lines(parse_transaction, lines, first_line_no)
+
+def parse_interest_rules(lines, first_line_no:int=1) -> tuple:
+    """
+    Parse many interest rule lines, blank lines are skipped
+
+    Args:
+        lines (iterable): interest rule lines, any case, with or without line endings
+        first_line_no (int, optional): line number of the first line. Defaults to 1.
+
+    Returns:
+        tuple: list of (line number, InterestRuleRecord) and list of (line number, line, error)
+    """
+    return _parse_lines(parse_interest_rule, lines, first_line_no)
@@ -0,0 +1,153 @@
+from concurrent.futures import Future
+import logging
+import queue
+import threading
+
+from banking_app import BankingApp
+import parsing
+
+logger = logging.getLogger(__name__)
+
+"""
+Thread-safe posting of transactions from many producer threads.
+
+Producers parse and validate their lines on their own thread, then hand the records to a single
+writer thread through a bounded queue. The writer is the only thread changing the banking app, so
+the insufficient funds check and the posting of a withdrawal can not interleave with another
+posting, and transaction ids, which follow the posting order within a day, can not be duplicated.
+Records from one producer are posted in the order they were submitted.
+
+The writer posts whatever is queued as one batch and commits the storage and journal once per
+batch before resolving the futures, so a resolved future means the posting is durable.
+While the engine runs, every change to the banking app has to go through it.
+"""
+
+_STOP = object()
+
+class PostingEngine:
+
+    def __init__(self, app:BankingApp, max_pending:int=100000, batch_size:int=1000):
+        """
+        Constructor
+
+        Args:
+            app (BankingApp): banking app to post into
+            max_pending (int, optional): most records waiting for the writer, producers block beyond. Defaults to 100000.
+            batch_size (int, optional): most records posted between two commits. Defaults to 1000.
+        """
+        self.app = app
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_pending)
+        #counted by the writer thread, lines failing validation are not included
+        self.posted = 0
+        self.rejected = 0
+        self.batches = 0
+        self._writer = None
+        #set by stop(), no record may be queued behind the stop marker
+        self._closing = False
+        self._lock = threading.Lock()
+
+    def start(self) -> "PostingEngine":
+        """
+        Start the writer thread
+
+        Returns:
+            PostingEngine: self
+        """
+        self._closing = False
+        self._writer = threading.Thread(target=self._write_loop, name="posting-writer", daemon=True)
+        self._writer.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Post everything submitted so far, then stop the writer thread. Submits from then on raise RuntimeError
+        """
+        with self._lock:
+            if self._writer is None or self._closing:
+                return
+            self._closing = True
+            self.queue.put(_STOP)
+        self._writer.join()
+        self._writer = None
+
+    def __enter__(self) -> "PostingEngine":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def submit(self, trn_details:str) -> Future:
+        """
+        Submit a transaction line. Can be called from any thread
+
+        Args:
+            trn_details (str): transaction in <Date> <Account> <Type> <Amount> format, upper-cased
+
+        Returns:
+            Future: resolves to the error message if the transaction is rejected, None once it is posted
+        """
+        record, error = parsing.parse_transaction(trn_details)
+        if error is not None:
+            future = Future()
+            future.set_result(error)
+            return future
+        return self.submit_record(record)
+
+    def submit_record(self, record:parsing.TransactionRecord) -> Future:
+        """
+        Submit a parsed transaction. Can be called from any thread
+
+        Args:
+            record (TransactionRecord): validated transaction
+
+        Returns:
+            Future: resolves to the error message if the transaction is rejected, None once it is posted
+        """
+        future = Future()
+        with self._lock:
+            if self._writer is None:
+                raise RuntimeError("Posting engine is not started")
+            if self._closing:
+                raise RuntimeError("Posting engine is stopping")
+            self.queue.put((record, future))
+        return future
+
+    def _write_loop(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            results = []
+            for item in batch:
+                if item is _STOP:
+                    stopping = True
+                    continue
+                record, future = item
+                try:
+                    error = self.app.apply_transaction(record)
+                except Exception as e:
+                    logger.exception(f"Posting failed for {record}")
+                    future.set_exception(e)
+                    continue
+                if error is None:
+                    self.posted += 1
+                else:
+                    self.rejected += 1
+                results.append((future, error))
+
+            try:
+                self.app.commit()
+            except Exception as e:
+                logger.exception("Commit failed")
+                for future, _ in results:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            for future, error in results:
+                future.set_result(error)
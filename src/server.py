@@ -0,0 +1,350 @@
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from banking_app import BankingApp
+import parsing
+from utils import utils
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+"""
+Asyncio TCP front-end serving many concurrent sessions against one shared BankingApp.
+
+The line protocol follows the console menu, with the menu choice first:
+```
+T 20230626 AC001 W 100.00
+I 20230615 RULE03 2.20
+P AC001 202306
+B 202306 202308
+STATS
+Q
+```
+Each response is a block of lines ended by an empty line.
+
+A line the server can not read, longer than the stream limit or not valid input, gets the reply the
+console prints for it and the session carries on.
+
+Commands on the same account run one at a time in arrival order, so trn_id sequencing matches the
+console. When a data directory is used, a posting is acknowledged only after its journal group is
+fsynced, while commands on other accounts carry on in the meantime. As in the console, a snapshot is
+written once enough records are committed, and on stop.
+"""
+
+_INVALID_CHOICE = "Invalid choice. Please try again."
+#what the console prints for a line of each menu choice it can not read
+_FORMAT_ERRORS = {"T": parsing.TRANSACTION_FORMAT_ERROR, "I": parsing.INTEREST_RULE_FORMAT_ERROR,
+                  "P": parsing.STATEMENT_FORMAT_ERROR, "B": parsing.PERIOD_FORMAT_ERROR}
+
+class BankServer:
+
+    def __init__(self, app:BankingApp, commit_interval:float=0.002):
+        """
+        Constructor
+
+        Args:
+            app (BankingApp): banking app shared by all sessions
+            commit_interval (float, optional): seconds between journal group commits. Defaults to 0.002.
+        """
+        self.app = app
+        self.commit_interval = commit_interval
+        self.account_locks = {}
+        self.latencies = {}
+        self.sessions = 0
+        self._next_commit = None
+        self._committer = None
+        if app.journal is not None:
+            #group commits are driven by the server, off the event loop
+            app.journal.auto_commit = False
+
+    async def start(self, host:str, port:int) -> asyncio.AbstractServer:
+        """
+        Start listening
+
+        Args:
+            host (str): host to bind
+            port (int): port to bind, 0 for any free port
+
+        Returns:
+            asyncio.AbstractServer: listening server
+        """
+        if self.app.journal is not None:
+            self._committer = asyncio.create_task(self._commit_loop())
+        return await asyncio.start_server(self.handle_client, host, port, limit=1024*1024, backlog=4096)
+
+    async def stop(self) -> None:
+        """
+        Stop the journal committer, write a snapshot and close the banking app
+        """
+        if self._committer is not None:
+            self._committer.cancel()
+            try:
+                await self._committer
+            except asyncio.CancelledError:
+                pass
+            self._committer = None
+        if self.app.journal is not None:
+            self.app.journal.write_snapshot(self.app)
+        self.app.close()
+
+    async def handle_client(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        """
+        Serve one client session
+
+        Args:
+            reader (asyncio.StreamReader): client input
+            writer (asyncio.StreamWriter): client output
+        """
+        self.sessions += 1
+        try:
+            while True:
+                line, complete = await self._read_line(reader)
+                if not line:
+                    break
+                start = time.perf_counter()
+                #bytes that are not UTF-8 fail validation like any other bad input
+                command, _, details = line.decode(errors="replace").strip().upper().partition(" ")
+                if not complete:
+                    response = [_FORMAT_ERRORS.get(command, _INVALID_CHOICE)]
+                elif command == "Q":
+                    writer.write(b"Thank you for banking with AwesomeGIC Bank.\nHave a nice day!\n\n")
+                    await writer.drain()
+                    break
+                else:
+                    try:
+                        response = await self.execute(command, details.strip())
+                    except ValueError:
+                        logger.exception(f"Command {command} failed")
+                        response = [_FORMAT_ERRORS.get(command, _INVALID_CHOICE)]
+                writer.write(("\n".join(response) + "\n\n").encode())
+                await writer.drain()
+                self.latencies.setdefault(command, []).append(time.perf_counter() - start)
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def _read_line(self, reader:asyncio.StreamReader) -> tuple:
+        """
+        Read one line of a session
+
+        Args:
+            reader (asyncio.StreamReader): client input
+
+        Returns:
+            tuple: line, empty at the end of the input, and False if the line is longer than the stream limit,
+                   in which case only its start is returned and the rest is dropped
+        """
+        try:
+            return await reader.readuntil(b"\n"), True
+        except asyncio.IncompleteReadError as e:
+            return e.partial, True
+        except asyncio.LimitOverrunError as e:
+            head = await reader.readexactly(e.consumed)
+        while True:
+            try:
+                await reader.readuntil(b"\n")
+                return head, False
+            except asyncio.IncompleteReadError:
+                return head, False
+            except asyncio.LimitOverrunError as e:
+                await reader.readexactly(e.consumed)
+
+    async def execute(self, command:str, details:str) -> list:
+        """
+        Run one command
+
+        Args:
+            command (str): menu choice
+            details (str): rest of the line
+
+        Returns:
+            list: response lines
+        """
+        if command == "T":
+            split_list = details.split()
+            if len(split_list) != 4:
+                return [self.app.process_transaction(details)]
+            async with self._account_lock(split_list[1]):
+                error = self.app.process_transaction(details)
+                if error is not None:
+                    return [error]
+                response = list(self.app.accounts.get(split_list[1]).statement_lines(print_balance=False))
+                await self._durable()
+                return response
+        elif command == "I":
+            error = self.app.process_interest_rule(details)
+            if error is not None:
+                return [error]
+            response = list(self.app.interest_rule_lines())
+            await self._durable()
+            return response
+        elif command == "P":
+            split_list = details.split()
+            if len(split_list) != 2:
+                return [parsing.STATEMENT_FORMAT_ERROR]
+            bank_acc_num, yyyymm = split_list
+            if parsing.parse_date(yyyymm + "01") is None:
+                return [parsing.STATEMENT_FORMAT_ERROR]
+            async with self._account_lock(bank_acc_num):
+                bank_acc = self.app.accounts.get(bank_acc_num)
+                if bank_acc is None:
+                    return [f"Account {bank_acc_num} not found."]
+                self.app.get_month_interest(bank_acc, yyyymm)
+                response = list(bank_acc.statement_lines(yyyymm))
+                await self._durable()
+                return response
+        elif command == "B":
+            period, error = parsing.parse_period(details)
+            if error is not None:
+                return [error]
+            return list(self.app.book_totals_lines(period))
+        elif command == "STATS":
+            return self.stats_lines()
+        return [_INVALID_CHOICE]
+
+    def stats_lines(self) -> list:
+        """
+        Per-command latency report
+
+        Returns:
+            list: report lines
+        """
+        lines = [f"Sessions: {self.sessions}", "Command | Count   | p50 ms  | p95 ms  | p99 ms  | max ms"]
+        for command, latencies in sorted(self.latencies.items()):
+            values = sorted(latencies)
+            lines.append(f"{command:7} | {len(values):7} | {utils.percentile(values, 50)*1000:7.3f} | "
+                         f"{utils.percentile(values, 95)*1000:7.3f} | {utils.percentile(values, 99)*1000:7.3f} | "
+                         f"{values[-1]*1000:7.3f}")
+        return lines
+
+    def _account_lock(self, bank_acc_num:str) -> asyncio.Lock:
+        lock = self.account_locks.get(bank_acc_num)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.account_locks[bank_acc_num] = lock
+        return lock
+
+    async def _durable(self) -> None:
+        """
+        Wait until everything journaled so far is fsynced
+        """
+        if self.app.journal is None:
+            return
+        if self._next_commit is None:
+            self._next_commit = asyncio.get_running_loop().create_future()
+        await asyncio.shield(self._next_commit)
+
+    async def _commit_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.commit_interval)
+            waiting = self._next_commit
+            if waiting is None:
+                continue
+            self._next_commit = None
+            try:
+                await loop.run_in_executor(None, self.app.journal.commit)
+            except Exception as e:
+                waiting.set_exception(e)
+                continue
+            waiting.set_result(None)
+            if self.app.journal.snapshot_due():
+                #on the event loop, so no session changes the accounts while they are written
+                self.app.journal.write_snapshot(self.app)
+
+async def serve(host:str, port:int, data_dir:str=None) -> None:
+    """
+    Run the server until interrupted
+
+    Args:
+        host (str): host to bind
+        port (int): port to bind
+        data_dir (str, optional): directory of the journal and snapshots. Defaults to None.
+    """
+    bank_server = BankServer(BankingApp(data_dir=data_dir))
+    server = await bank_server.start(host, port)
+    print(f"AwesomeGIC Bank serving on {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await bank_server.stop()
+        print("\n".join(bank_server.stats_lines()))
+
+async def _request(reader:asyncio.StreamReader, writer:asyncio.StreamWriter, line:str) -> list:
+    writer.write((line + "\n").encode())
+    await writer.drain()
+    response = []
+    while True:
+        response_line = await reader.readline()
+        if not response_line or response_line == b"\n":
+            return response
+        response.append(response_line.decode().rstrip("\n"))
+
+async def _load_session(host:str, port:int, session:int, num_commands:int, latencies:list) -> None:
+    reader, writer = await asyncio.open_connection(host, port, limit=1024*1024)
+    bank_acc_num = f"LOAD{session:06}"
+    rnd = random.Random(session)
+    try:
+        for k in range(num_commands):
+            if k == num_commands - 1:
+                line = f"P {bank_acc_num} 202306"
+            else:
+                trn_type = "D" if k % 3 != 2 else "W"
+                line = f"T 202306{k % 28 + 1:02} {bank_acc_num} {trn_type} {rnd.randint(1, 20)}.{rnd.randint(0, 99):02}"
+            start = time.perf_counter()
+            await _request(reader, writer, line)
+            latencies.append(time.perf_counter() - start)
+        await _request(reader, writer, "Q")
+    finally:
+        writer.close()
+
+async def run_load(host:str, port:int, num_sessions:int, num_commands:int) -> None:
+    """
+    Open many concurrent sessions against a running server and report client-side latency
+
+    Args:
+        host (str): server host
+        port (int): server port
+        num_sessions (int): number of concurrent sessions
+        num_commands (int): commands per session, the last one prints a statement
+    """
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_load_session(host, port, session, num_commands, latencies)
+                           for session in range(num_sessions)))
+    elapsed = time.perf_counter() - start
+    values = sorted(latencies)
+    print(f"Sessions: {num_sessions} | Commands: {len(values)} | Elapsed: {elapsed:.3f}s | {len(values)/elapsed:,.0f} commands/sec")
+    print(f"Client latency ms: p50 {utils.percentile(values, 50)*1000:.3f} | p95 {utils.percentile(values, 95)*1000:.3f} | "
+          f"p99 {utils.percentile(values, 99)*1000:.3f} | max {values[-1]*1000:.3f}")
+
+    reader, writer = await asyncio.open_connection(host, port)
+    print("\n".join(await _request(reader, writer, "STATS")))
+    writer.close()
+
+def main():
+    parser=argparse.ArgumentParser(description="AwesomeGIC Bank TCP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--data-dir", help="directory of the journal and snapshots, state is kept in memory only if not given")
+    parser.add_argument("--load", type=int, metavar="SESSIONS", help="run the load client with this many concurrent sessions against a running server")
+    parser.add_argument("--commands", type=int, default=10, help="commands per load session")
+    args=parser.parse_args()
+
+    metrics.install_signal_handler()
+    try:
+        if args.load:
+            asyncio.run(run_load(args.host, args.port, args.load, args.commands))
+        else:
+            asyncio.run(serve(args.host, args.port, args.data_dir))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import logging
+import os
+import time
+from datetime import date, timedelta
+
+from banking_app import BankingApp
+from storage import SqliteStorage
+from bank_acc import BankAccount
+import batch_load
+from utils import utils
+
+logger = logging.getLogger(__name__)
+
+"""
+Bulk export of month statements to files.
+
+Statements are produced straight from the ledger columns, one line at a time, without building
+Transaction objects. Date strings are formatted once per day and reused, and lines are written
+in large chunks through a buffered file, so memory stays bounded whatever the size of the book.
+
+Each statement is byte-identical to what the [P] Print statement menu choice prints for the
+same account and month. In single file mode the statements are written one after another.
+"""
+
+STATEMENT_HEADER = "Date     | Txn Id      | Type | Amount  | Balance"
+BUFFER_SIZE = 1024*1024
+CHUNK_LINES = 4096
+
+_WITHDRAWAL = ord("W")
+_INTEREST = ord("I")
+
+#date ordinal to YYYYMMDD, shared by every statement of an export
+_date_strs = {}
+
+def _date_str(ordinal:int) -> str:
+    date_str = _date_strs.get(ordinal)
+    if date_str is None:
+        date_str = date.fromordinal(ordinal).strftime("%Y%m%d")
+        _date_strs[ordinal] = date_str
+    return date_str
+
+def statement_lines(bank_acc:BankAccount, yyyymm:int):
+    """
+    Produce the statement lines of a bank account for a Year Month, same text as BankAccount.statement_lines
+
+    Args:
+        bank_acc (BankAccount): Bank Account object
+        yyyymm (int): Year Month
+
+    Yields:
+        str: statement line
+    """
+    if str(yyyymm) in bank_acc.month_summaries:
+        #closed month, the rows are in the archive
+        return bank_acc.statement_lines(yyyymm)
+    ledger = bank_acc.ledger
+    ordinals = ledger.ordinals
+    #rows in date order, posting order kept within a day
+    rows = ledger.get_rows(yyyymm)
+    opening_balance = 0
+    if rows:
+        opening_balance = bank_acc.get_eod_balance(date.fromordinal(ledger.sorted_ordinals[rows.start]) - timedelta(days=1))
+    return format_statement(bank_acc.account_number, opening_balance,
+                            ((ordinals[row], ledger.types[row], ledger.cents[row]) for row in rows))
+
+def format_statement(account_number:str, opening_balance:int, rows):
+    """
+    Produce statement lines from plain transaction rows
+
+    Args:
+        account_number (str): bank account number
+        opening_balance (int): end of day balance before the first row in cents
+        rows (iterable): (date ordinal, type code, cents) in date order, posting order kept within a day
+
+    Yields:
+        str: statement line
+    """
+    yield f"Account: {account_number}"
+    yield STATEMENT_HEADER
+
+    balance = opening_balance
+    day = None
+    seq = 0
+    for ordinal, trn_type, amount in rows:
+        if ordinal != day:
+            day = ordinal
+            seq = 0
+            date_str = _date_str(ordinal)
+        seq += 1
+        balance += -amount if trn_type == _WITHDRAWAL else amount
+        trn_id = "" if trn_type == _INTEREST else f"{date_str}-{seq:02}"
+        yield f"{date_str} | {trn_id:11} | {chr(trn_type):4} | {utils.format_hundredths(amount)} | {utils.format_hundredths(balance)}"
+
+def write_lines(file, lines) -> int:
+    """
+    Write lines to a file in chunks
+
+    Args:
+        file (file): text file open for writing
+        lines (iterable): lines without line endings
+
+    Returns:
+        int: number of lines written
+    """
+    count = 0
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= CHUNK_LINES:
+            file.write("\n".join(chunk))
+            file.write("\n")
+            count += len(chunk)
+            chunk.clear()
+    if chunk:
+        file.write("\n".join(chunk))
+        file.write("\n")
+        count += len(chunk)
+    return count
+
+def _select_accounts(app:BankingApp, acc_nums:list=None):
+    """
+    Yields:
+        BankAccount: accounts to export, in account number order
+    """
+    for acc_num in sorted(app.accounts.keys() if acc_nums is None else acc_nums):
+        bank_acc = app.accounts.get(acc_num)
+        if bank_acc is None:
+            logger.warning(f"Account {acc_num} not found, no statement exported")
+            continue
+        yield bank_acc
+
+def export_statements(app:BankingApp, yyyymm:int, output:str=None, out_dir:str=None, acc_nums:list=None) -> tuple:
+    """
+    Export the statements of a Year Month, either to one file or to one file per account.
+    The month's interest is credited first, as the [P] menu choice does
+
+    Args:
+        app (BankingApp): banking app
+        yyyymm (int): Year Month
+        output (str, optional): file receiving every statement. Defaults to None.
+        out_dir (str, optional): directory receiving <Account>_<YearMonth>.txt files, used if output is not given. Defaults to None.
+        acc_nums (list, optional): account numbers to export. Defaults to None for all accounts.
+
+    Returns:
+        tuple: number of statements and number of lines written
+    """
+    if output is None and out_dir is None:
+        raise ValueError("Either output or out_dir must be given")
+
+    statements = 0
+    lines = 0
+    if output is not None:
+        with open(output, "w", buffering=BUFFER_SIZE) as file:
+            for bank_acc in _select_accounts(app, acc_nums):
+                app.get_month_interest(bank_acc, yyyymm)
+                lines += write_lines(file, statement_lines(bank_acc, yyyymm))
+                statements += 1
+    else:
+        os.makedirs(out_dir, exist_ok=True)
+        for bank_acc in _select_accounts(app, acc_nums):
+            app.get_month_interest(bank_acc, yyyymm)
+            file_path = os.path.join(out_dir, f"{bank_acc.account_number}_{yyyymm}.txt")
+            with open(file_path, "w", buffering=BUFFER_SIZE) as file:
+                lines += write_lines(file, statement_lines(bank_acc, yyyymm))
+            statements += 1
+    app.commit()
+    logger.info(f"Exported {statements} statements for {yyyymm}, {lines} lines")
+    return statements, lines
+
+def main():
+    parser=argparse.ArgumentParser(description="Export AwesomeGIC Bank month statements to files")
+    parser.add_argument("yyyymm", help="Year Month of the statements")
+    parser.add_argument("--data-dir", help="directory of the journal and snapshots to export from")
+    parser.add_argument("--db", help="SQLite database to export from")
+    parser.add_argument("--cache-accounts", type=int, help="with --db, most accounts kept in memory, least recently used are evicted")
+    parser.add_argument("--load", metavar="FILE", help="file in data.txt layout to load before exporting")
+    parser.add_argument("--accounts", nargs="+", metavar="ACCOUNT", help="accounts to export, all accounts if not given")
+    target=parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output", help="write every statement to this file")
+    target.add_argument("--out-dir", help="write one <Account>_<YearMonth>.txt file per account to this directory")
+    args=parser.parse_args()
+
+    app=BankingApp(data_dir=args.data_dir, storage=SqliteStorage(args.db, max_accounts=args.cache_accounts) if args.db else None)
+    if args.load:
+        batch_load.load_file(app, args.load)
+        app.commit()
+
+    start=time.perf_counter()
+    statements, lines=export_statements(app, args.yyyymm.strip(), output=args.output, out_dir=args.out_dir,
+                                        acc_nums=[acc.upper() for acc in args.accounts] if args.accounts else None)
+    elapsed=time.perf_counter()-start
+    print(f"Statements: {statements} | Lines: {lines} | Elapsed: {elapsed:.3f}s")
+    app.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+from collections import OrderedDict
+from datetime import date
+import logging
+import sqlite3
+
+from bank_acc import BankAccount
+from transaction import Transaction
+from utils import utils
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+"""
+Storage backends of the banking app.
+
+BankingApp reads and writes accounts through storage.accounts, a mapping of bank account number
+to BankAccount, and reports every change it makes through the record_* methods:
+
+* MemoryStorage keeps the accounts in a plain dict, the original behaviour.
+* SqliteStorage keeps accounts, transactions and interest rules in a SQLite database in WAL mode.
+  Accounts are loaded from the database on first use, writes are batched with executemany,
+  and month statements are read with a range query on the (account, date) index.
+  Loaded accounts are kept in an LRU cache bounded by a number of accounts and / or transaction rows;
+  cold accounts are evicted and reloaded from the database when touched again.
+
+Every change to an account is recorded in the database as it is made, so an evicted account can be
+dropped without writing it back. Callers should not keep BankAccount objects across calls to accounts.get.
+"""
+
+class MemoryStorage:
+    """
+    Everything held in memory, nothing persisted
+    """
+    #accounts live in memory only, so their closed months can be compacted
+    in_memory = True
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.accounts = {}
+
+    def create_account(self, bank_acc_num:str) -> BankAccount:
+        """
+        Args:
+            bank_acc_num (str): Bank Account Number
+
+        Returns:
+            BankAccount: new, empty Bank Account object
+        """
+        return BankAccount(bank_acc_num)
+
+    def load_interest_rules(self, interest_rules) -> None:
+        """
+        Add the stored interest rules to a timeline
+
+        Args:
+            interest_rules (InterestRuleTimeline): interest rules
+        """
+
+    def load_book_totals(self, book_totals) -> None:
+        """
+        Add the stored transactions to the bank-wide totals
+
+        Args:
+            book_totals (BookTotals): bank-wide totals
+        """
+
+    def record_transaction(self, bank_acc_num:str, trn_type:str, trn_date, cents:int) -> None:
+        """
+        Record a posted transaction
+
+        Args:
+            bank_acc_num (str): Bank Account Number
+            trn_type (str): Transaction Type
+            trn_date (Date): Transaction Date
+            cents (int): Transaction Amount in cents
+        """
+
+    def record_interest(self, bank_acc_num:str, yyyymm:int, cents:int) -> None:
+        """
+        Record the interest credited for a Year Month, replacing any earlier amount
+
+        Args:
+            bank_acc_num (str): Bank Account Number
+            yyyymm (int): Year Month
+            cents (int): interest amount in cents
+        """
+
+    def record_interest_rule(self, interest_date, rule_id:str, rate_bp:int) -> None:
+        """
+        Record an interest rule, replacing any rule on the same date
+
+        Args:
+            interest_date (Date): date the rule takes effect
+            rule_id (str): Rule Id
+            rate_bp (int): interest rate in basis points
+        """
+
+    def commit(self) -> None:
+        """
+        Make the recorded changes durable
+        """
+
+    def close(self) -> None:
+        """
+        Commit and release the storage
+        """
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id INTEGER PRIMARY KEY,
+    acc_num TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    acc_num TEXT NOT NULL,
+    trn_date INTEGER NOT NULL,
+    trn_type TEXT NOT NULL,
+    cents INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_acc_date ON transactions (acc_num, trn_date);
+CREATE TABLE IF NOT EXISTS interest_rules (
+    rule_date INTEGER PRIMARY KEY,
+    rule_id TEXT NOT NULL,
+    rate_bp INTEGER NOT NULL
+);
+"""
+
+class SqliteStorage(MemoryStorage):
+    """
+    Accounts, transactions and interest rules kept in a SQLite database. Dates are stored as ordinals
+    and amounts as integer cents; the transaction id keeps the posting order
+    """
+    in_memory = False
+
+    def __init__(self, db_path:str, batch_size:int=10000, max_accounts:int=None, max_rows:int=None):
+        """
+        Constructor
+
+        Args:
+            db_path (str): database file, created if it does not exist
+            batch_size (int, optional): pending transaction rows written with one executemany. Defaults to 10000.
+            max_accounts (int, optional): most accounts kept in memory. Defaults to None for no limit.
+            max_rows (int, optional): most transaction rows of loaded accounts kept in memory. Defaults to None for no limit.
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._pending_accounts = []
+        self._pending_trns = []
+        #accounts with rows not written yet, they are flushed before the account is reloaded
+        self._pending_acc_nums = set()
+        self.accounts = SqliteAccounts(self, max_accounts=max_accounts, max_rows=max_rows)
+
+    def create_account(self, bank_acc_num:str) -> BankAccount:
+        return SqliteBankAccount(bank_acc_num, self)
+
+    def load_interest_rules(self, interest_rules) -> None:
+        for ordinal, rule_id, rate_bp in self.conn.execute("SELECT rule_date, rule_id, rate_bp FROM interest_rules"):
+            interest_rules.add(date.fromordinal(ordinal), rule_id, rate_bp)
+
+    def load_book_totals(self, book_totals) -> None:
+        rows = self.conn.execute("SELECT trn_date, trn_type, SUM(cents), COUNT(*) FROM transactions GROUP BY trn_date, trn_type")
+        for ordinal, trn_type, cents, count in rows:
+            book_totals.add_day_totals(ordinal, trn_type, cents, count)
+        book_totals.rebuild()
+
+    def add_account(self, bank_acc_num:str) -> None:
+        """
+        Record a new account
+
+        Args:
+            bank_acc_num (str): Bank Account Number
+        """
+        self._pending_accounts.append((bank_acc_num,))
+        self._pending_acc_nums.add(bank_acc_num)
+
+    def record_transaction(self, bank_acc_num:str, trn_type:str, trn_date, cents:int) -> None:
+        self._pending_trns.append((bank_acc_num, trn_date.toordinal(), trn_type, cents))
+        self._pending_acc_nums.add(bank_acc_num)
+        if len(self._pending_trns) >= self.batch_size:
+            self.flush()
+
+    def record_interest(self, bank_acc_num:str, yyyymm:int, cents:int) -> None:
+        #earlier rows first, so the interest row keeps its place in the posting order
+        self.flush()
+        _, month_last_day=utils.get_month_first_last_day(yyyymm)
+        ordinal = month_last_day.toordinal()
+        cursor = self.conn.execute("UPDATE transactions SET cents=? WHERE acc_num=? AND trn_date=? AND trn_type='I'",
+                                   (cents, bank_acc_num, ordinal))
+        if cursor.rowcount == 0:
+            self.conn.execute("INSERT INTO transactions (acc_num, trn_date, trn_type, cents) VALUES (?, ?, 'I', ?)",
+                              (bank_acc_num, ordinal, cents))
+
+    def record_interest_rule(self, interest_date, rule_id:str, rate_bp:int) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO interest_rules (rule_date, rule_id, rate_bp) VALUES (?, ?, ?)",
+                          (interest_date.toordinal(), rule_id, rate_bp))
+
+    def flush(self) -> None:
+        """
+        Write the pending rows into the open database transaction, so queries see them
+        """
+        if self._pending_accounts:
+            self.conn.executemany("INSERT OR IGNORE INTO accounts (acc_num) VALUES (?)", self._pending_accounts)
+            self._pending_accounts = []
+        if self._pending_trns:
+            self.conn.executemany("INSERT INTO transactions (acc_num, trn_date, trn_type, cents) VALUES (?, ?, ?, ?)",
+                                  self._pending_trns)
+            self._pending_trns = []
+        self._pending_acc_nums.clear()
+
+    def commit(self) -> None:
+        self.flush()
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.commit()
+        self.conn.close()
+
+    def account_numbers(self) -> list:
+        """
+        Returns:
+            list: every stored bank account number, in creation order
+        """
+        self.flush()
+        return [acc_num for (acc_num,) in self.conn.execute("SELECT acc_num FROM accounts ORDER BY id")]
+
+    def has_account(self, bank_acc_num:str) -> bool:
+        """
+        Args:
+            bank_acc_num (str): Bank Account Number
+
+        Returns:
+            bool: True if the account is stored
+        """
+        if bank_acc_num in self._pending_acc_nums:
+            self.flush()
+        return self.conn.execute("SELECT 1 FROM accounts WHERE acc_num=?", (bank_acc_num,)).fetchone() is not None
+
+    def load_account(self, bank_acc_num:str) -> BankAccount:
+        """
+        Rebuild a bank account from its stored transactions
+
+        Args:
+            bank_acc_num (str): Bank Account Number
+
+        Returns:
+            BankAccount: Bank Account object, None if the account is not stored
+        """
+        if not self.has_account(bank_acc_num):
+            return None
+        bank_acc = self.create_account(bank_acc_num)
+        rows = self.conn.execute("SELECT trn_type, trn_date, cents FROM transactions WHERE acc_num=? ORDER BY id",
+                                 (bank_acc_num,))
+        for trn_type, ordinal, cents in rows:
+            bank_acc.load_transaction(trn_type, date.fromordinal(ordinal), cents)
+        return bank_acc
+
+    def month_rows(self, bank_acc_num:str, yyyymm:int) -> list:
+        """
+        Range query of the transactions of an account in a Year Month
+
+        Args:
+            bank_acc_num (str): Bank Account Number
+            yyyymm (int): Year Month
+
+        Returns:
+            list: (date ordinal, type, cents) in date then posting order
+        """
+        self.flush()
+        month_first_day, month_last_day=utils.get_month_first_last_day(yyyymm)
+        return self.conn.execute("SELECT trn_date, trn_type, cents FROM transactions "
+                                 "WHERE acc_num=? AND trn_date BETWEEN ? AND ? ORDER BY trn_date, id",
+                                 (bank_acc_num, month_first_day.toordinal(), month_last_day.toordinal())).fetchall()
+
+class SqliteAccounts:
+    """
+    Mapping of bank account number to BankAccount backed by a SqliteStorage. Accounts are loaded
+    from the database on first access and kept in an LRU cache
+    """
+
+    def __init__(self, storage:SqliteStorage, max_accounts:int=None, max_rows:int=None):
+        """
+        Constructor
+
+        Args:
+            storage (SqliteStorage): storage holding the accounts
+            max_accounts (int, optional): most accounts kept in memory. Defaults to None for no limit.
+            max_rows (int, optional): most transaction rows of loaded accounts kept in memory. Defaults to None for no limit.
+        """
+        self.storage = storage
+        self.max_accounts = max_accounts
+        self.max_rows = max_rows
+        #least recently used first, with the number of rows each account held when last touched
+        self.loaded = OrderedDict()
+        self.resident_rows = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, bank_acc_num:str, default=None) -> BankAccount:
+        entry = self.loaded.get(bank_acc_num)
+        if entry is not None:
+            self.hits += 1
+            self.loaded.move_to_end(bank_acc_num)
+            return entry[0]
+        self.misses += 1
+        bank_acc = self.storage.load_account(bank_acc_num)
+        if bank_acc is None:
+            return default
+        self._put(bank_acc_num, bank_acc)
+        return bank_acc
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: cache counters and the number of accounts and rows in memory
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "resident_accounts": len(self.loaded), "resident_rows": self.resident_rows}
+
+    def _put(self, bank_acc_num:str, bank_acc:BankAccount) -> None:
+        entry = self.loaded.pop(bank_acc_num, None)
+        if entry is not None:
+            self.resident_rows -= entry[1]
+        rows = len(bank_acc.ledger)
+        self.loaded[bank_acc_num] = (bank_acc, rows)
+        self.resident_rows += rows
+        #the account just touched is never evicted
+        while len(self.loaded) > 1 and ((self.max_accounts is not None and len(self.loaded) > self.max_accounts)
+                                        or (self.max_rows is not None and self.resident_rows > self.max_rows)):
+            _, (_, evicted_rows) = self.loaded.popitem(last=False)
+            self.resident_rows -= evicted_rows
+            self.evictions += 1
+
+    def __getitem__(self, bank_acc_num:str) -> BankAccount:
+        bank_acc = self.get(bank_acc_num)
+        if bank_acc is None:
+            raise KeyError(bank_acc_num)
+        return bank_acc
+
+    def __setitem__(self, bank_acc_num:str, bank_acc:BankAccount) -> None:
+        if bank_acc_num not in self.loaded and not self.storage.has_account(bank_acc_num):
+            self.storage.add_account(bank_acc_num)
+        self._put(bank_acc_num, bank_acc)
+
+    def __contains__(self, bank_acc_num:str) -> bool:
+        return bank_acc_num in self.loaded or self.storage.has_account(bank_acc_num)
+
+    def __len__(self) -> int:
+        return len(self.storage.account_numbers())
+
+    def __iter__(self):
+        return iter(self.storage.account_numbers())
+
+    def keys(self) -> list:
+        return self.storage.account_numbers()
+
+    def values(self):
+        for bank_acc_num in self.storage.account_numbers():
+            yield self.get(bank_acc_num)
+
+    def items(self):
+        for bank_acc_num in self.storage.account_numbers():
+            yield bank_acc_num, self.get(bank_acc_num)
+
+class SqliteBankAccount(BankAccount):
+    """
+    Bank account whose month statements are read back from the database
+    """
+
+    def __init__(self, account_number:str, storage:SqliteStorage):
+        """
+        Constructor
+
+        Args:
+            account_number (str): bank account number
+            storage (SqliteStorage): storage holding the account
+        """
+        super().__init__(account_number)
+        self.storage = storage
+
+    @metrics.instrument("SqliteBankAccount.get_transactions")
+    def get_transactions(self, yyyymm:int=None) -> dict:
+        if yyyymm is None:
+            return super().get_transactions(yyyymm)
+
+        tran_dict = {}
+        day = None
+        for ordinal, trn_type, cents in self.storage.month_rows(self.account_number, yyyymm):
+            if ordinal != day:
+                day = ordinal
+                trn_date = date.fromordinal(ordinal)
+                date_str = trn_date.strftime("%Y%m%d")
+                trn_list = []
+                tran_dict[trn_date] = trn_list
+            trn_id = "" if trn_type == "I" else f"{date_str}-{len(trn_list)+1:02}"
+            trn_list.append(Transaction(trn_date, trn_id, trn_type, cents, None))
+        self.restamp_balances(tran_dict)
+        return tran_dict
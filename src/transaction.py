@@ -6,6 +6,11 @@ from utils import utils
 logger = logging.getLogger(__name__)
 
 class Transaction:
+    """
+    Statement view of a transaction, amount and balance are in integer cents
+    """
+    __slots__ = ("trn_date", "trn_id", "trn_type", "amount", "balance")
+
     def __init__(self, trn_date, trn_id, trn_type, amount, balance):
         self.trn_date = trn_date
         self.trn_id = trn_id
@@ -14,12 +19,23 @@ class Transaction:
         self.balance = balance
       
     def print(self, print_balance:bool=True):
-        
-        balance_str=f"| {self.balance:7.2f}"
+        print(self.format(print_balance))
+
+    def format(self, print_balance:bool=True) -> str:
+        """
+        Format the transaction as a statement line
+
+        Args:
+            print_balance (bool, optional): flag to display balance or not display. Defaults to True.
+
+        Returns:
+            str: statement line
+        """
+        balance_str=f"| {utils.format_hundredths(self.balance)}"
 
         if not print_balance:
             balance_str=""
 
-        print(f"{self.trn_date.strftime("%Y%m%d")} | {self.trn_id:11} | {self.trn_type:4} | {self.amount:7.2f} {balance_str}")
+        return f"{self.trn_date.strftime("%Y%m%d")} | {self.trn_id:11} | {self.trn_type:4} | {utils.format_hundredths(self.amount)} {balance_str}"
 
   
\ No newline at end of file
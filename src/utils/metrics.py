@@ -0,0 +1,196 @@
+import functools
+import inspect
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+"""
+Opt-in hot path instrumentation.
+
+Set BANKAPP_METRICS=1 before starting the app to record, for each instrumented function, the call
+count, a latency histogram and the number of memory blocks allocated by the call.
+When the variable is not set, @instrument returns the function unchanged, so there is no cost at all.
+
+The data can be dumped as JSON or Prometheus text format with the [M] menu choice, or by sending
+SIGUSR1 to the process, which writes to BANKAPP_METRICS_FILE (stderr if not set).
+"""
+
+ENV_VAR = "BANKAPP_METRICS"
+FILE_ENV_VAR = "BANKAPP_METRICS_FILE"
+
+#latency histogram bucket upper bounds in seconds
+BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, float("inf"))
+
+_ENABLED = os.environ.get(ENV_VAR, "") not in ("", "0")
+_metrics = {}
+#re-entrant, the SIGUSR1 dump runs on the main thread and may interrupt a record()
+_lock = threading.RLock()
+
+class Metric:
+    """
+    Measurements of one instrumented function
+    """
+
+    def __init__(self, name:str):
+        """
+        Constructor
+
+        Args:
+            name (str): metric name
+        """
+        self.name = name
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.bucket_counts = [0]*len(BUCKETS)
+        self.allocated_blocks = 0
+        self.max_allocated_blocks = 0
+
+    def record(self, seconds:float, blocks:int) -> None:
+        """
+        Record one call
+
+        Args:
+            seconds (float): latency of the call
+            blocks (int): net memory blocks allocated by the call
+        """
+        bucket = 0
+        while seconds > BUCKETS[bucket]:
+            bucket += 1
+        with _lock:
+            self.count += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.bucket_counts[bucket] += 1
+            self.allocated_blocks += blocks
+            self.max_allocated_blocks = max(self.max_allocated_blocks, blocks)
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            dict: measurements, the histogram is keyed by bucket upper bound
+        """
+        return {
+            "count": self.count,
+            "total_seconds": self.total_seconds,
+            "max_seconds": self.max_seconds,
+            "histogram": {_bound_label(bound): count for bound, count in zip(BUCKETS, self.bucket_counts)},
+            "allocated_blocks": self.allocated_blocks,
+            "max_allocated_blocks": self.max_allocated_blocks,
+        }
+
+def enabled() -> bool:
+    """
+    Returns:
+        bool: True if instrumentation was turned on with BANKAPP_METRICS
+    """
+    return _ENABLED
+
+def instrument(name:str=None):
+    """
+    Decorator recording call count, latency and allocations of a function. Generator functions are
+    measured from the first to the last item produced
+
+    Args:
+        name (str, optional): metric name. Defaults to None for the function's qualified name.
+
+    Returns:
+        callable: decorator, which returns the function unchanged when instrumentation is off
+    """
+    def decorator(func):
+        if not _ENABLED:
+            return func
+        metric = _metrics.setdefault(name or func.__qualname__, Metric(name or func.__qualname__))
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                blocks = sys.getallocatedblocks()
+                start = time.perf_counter()
+                try:
+                    yield from func(*args, **kwargs)
+                finally:
+                    metric.record(time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            blocks = sys.getallocatedblocks()
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metric.record(time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+        return wrapper
+    return decorator
+
+def snapshot() -> dict:
+    """
+    Returns:
+        dict: map of metric name to its measurements
+    """
+    with _lock:
+        return {name: metric.to_dict() for name, metric in sorted(_metrics.items())}
+
+def to_json() -> str:
+    """
+    Returns:
+        str: all measurements as JSON
+    """
+    return json.dumps(snapshot(), indent=2)
+
+def to_prometheus() -> str:
+    """
+    Returns:
+        str: all measurements in Prometheus text exposition format
+    """
+    lines = [
+        "# HELP bankapp_call_seconds Latency of instrumented calls.",
+        "# TYPE bankapp_call_seconds histogram",
+    ]
+    data = snapshot()
+    for name, values in data.items():
+        cumulative = 0
+        for bound, count in values["histogram"].items():
+            cumulative += count
+            lines.append(f'bankapp_call_seconds_bucket{{function="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'bankapp_call_seconds_sum{{function="{name}"}} {values["total_seconds"]}')
+        lines.append(f'bankapp_call_seconds_count{{function="{name}"}} {values["count"]}')
+    lines.append("# HELP bankapp_allocated_blocks_total Net memory blocks allocated by instrumented calls.")
+    lines.append("# TYPE bankapp_allocated_blocks_total counter")
+    for name, values in data.items():
+        lines.append(f'bankapp_allocated_blocks_total{{function="{name}"}} {values["allocated_blocks"]}')
+    return "\n".join(lines) + "\n"
+
+def dump(file_path:str=None) -> None:
+    """
+    Write all measurements, in Prometheus format if the file name ends with .prom, else as JSON
+
+    Args:
+        file_path (str, optional): output file. Defaults to None for stderr.
+    """
+    if file_path is None:
+        sys.stderr.write(to_json() + "\n")
+        return
+    text = to_prometheus() if file_path.endswith(".prom") else to_json()
+    with open(file_path, "w") as file:
+        file.write(text)
+
+def install_signal_handler() -> None:
+    """
+    Dump the measurements to BANKAPP_METRICS_FILE on SIGUSR1. Does nothing when instrumentation is off
+    or the platform has no SIGUSR1
+    """
+    if not _ENABLED or not hasattr(signal, "SIGUSR1"):
+        return
+    file_path = os.environ.get(FILE_ENV_VAR)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: dump(file_path))
+
+def _bound_label(bound:float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
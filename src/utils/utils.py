@@ -1,65 +1,75 @@
 import logging
 import datetime
-from decimal import Decimal, InvalidOperation
 import calendar
+import functools
 import math
 
 logger = logging.getLogger(__name__)
 
-def get_number(input_str:str):
+def parse_hundredths(input_str:str):
     """
-    convert input string to float
+    Parse a decimal number into an integer count of hundredths (cents for amounts, basis points for rates).
+    The string is parsed once, without going through float
 
     Args:
-        input_str (str): input string
+        input_str (str): input string, e.g. 100.25
 
     Returns:
-        _type_: _description_
+        tuple: hundredths and a flag that is False if the number has more than 2 decimal places,
+               or None if the input is not a number
     """
-    try:            
-        return float(input_str)
-    except ValueError:
+    sign=1
+    if input_str[:1] in ("-", "+") and len(input_str) > 1:
+        sign=-1 if input_str[0]=="-" else 1
+        input_str=input_str[1:]
+    whole, dot, frac=input_str.partition(".")
+    if not (whole or frac):
         return None
+    for digits in (whole, frac):
+        if digits and not (digits.isascii() and digits.isdecimal()):
+            return None
+    value=int(whole or "0")*100 + int((frac+"00")[:2])
+    return sign*value, len(frac) <= 2
 
-def is_two_decimal_places(input_str):
+def format_hundredths(value:int, width:int=7) -> str:
     """
-    Check if input is up to 2 decimal places
+    Format an integer count of hundredths with 2 decimal places, right aligned
 
     Args:
-        input_str (_type_): _description_
+        value (int): hundredths, e.g. cents
+        width (int, optional): field width. Defaults to 7.
 
     Returns:
-        _type_: _description_
+        str: formatted number, e.g. 100.25
     """
-    try:
-        number = Decimal(input_str)
-        #print(number.as_tuple())
-        # Check if the number of decimal places is up to 2
-        return number.as_tuple().exponent >= -2 #
-    except InvalidOperation:
-        return False
-    
-def get_date(input_str):
+    sign="-" if value < 0 else ""
+    whole, frac=divmod(abs(value), 100)
+    return f"{sign}{whole}.{frac:02}".rjust(width)
+
+def div_round_half_up(numerator:int, denominator:int) -> int:
     """
-    Convert input string to date
+    Integer division rounded half up, used to round interest to cents
 
     Args:
-        input_str (_type_): _description_
+        numerator (int): non-negative numerator
+        denominator (int): positive denominator
 
     Returns:
-        _type_: _description_
+        int: rounded quotient
     """
-    try:
-        return datetime.datetime.strptime(input_str, "%Y%m%d").date()
-    except ValueError:
-        return None
-    
+    return (numerator + denominator//2) // denominator
+
+#every ledger month lookup, interest walk and credit needs the month bounds, dates are immutable so they are shared
+@functools.lru_cache(maxsize=1024)
 def get_month_first_last_day(yyyymm:int):
     """
     Get the first and last day for a given month
 
     Args:
-        yyyymm (int): _description_
+        yyyymm (int): Year Month
+
+    Returns:
+        tuple: first and last date of the month
     """
     year=int(str(yyyymm)[:4])
     month=int(str(yyyymm)[4:])
@@ -69,6 +79,52 @@ def get_month_first_last_day(yyyymm:int):
 
     return first_day,last_day
 
+def get_yyyymm(input_date) -> str:
+    """
+    Get the Year Month of a date
+
+    Args:
+        input_date (Date): date
+
+    Returns:
+        str: Year Month in YYYYMM format
+    """
+    return f"{input_date.year:04}{input_date.month:02}"
+
+def get_yyyymm_range(from_yyyymm:int, to_yyyymm:int) -> list:
+    """
+    Get the Year Months from one Year Month to another, both included
+
+    Args:
+        from_yyyymm (int): first Year Month
+        to_yyyymm (int): last Year Month
+
+    Returns:
+        list: Year Months in YYYYMM format, empty if to_yyyymm is before from_yyyymm
+    """
+    year, month=int(str(from_yyyymm)[:4]), int(str(from_yyyymm)[4:])
+    months=[]
+    while f"{year:04}{month:02}" <= str(to_yyyymm):
+        months.append(f"{year:04}{month:02}")
+        year, month=(year+1, 1) if month==12 else (year, month+1)
+    return months
+
+def percentile(sorted_values:list, pct:float) -> float:
+    """
+    Get a percentile of already sorted values, nearest rank
+
+    Args:
+        sorted_values (list): values in ascending order
+        pct (float): percentile between 0 and 100
+
+    Returns:
+        float: percentile value, 0 if there are no values
+    """
+    if not sorted_values:
+        return 0.0
+    rank=max(math.ceil(pct/100*len(sorted_values)), 1)
+    return sorted_values[rank-1]
+
 # def math_round(num):
 #     frac = num - math.floor(num)
 #     if frac < 0.5:
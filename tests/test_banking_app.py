@@ -0,0 +1,111 @@
+import io
+import sys
+from datetime import date
+
+from banking_app import BankingApp
+from storage import SqliteStorage
+
+def print_statement(app:BankingApp, details:str) -> str:
+    stdin, stdout = sys.stdin, sys.stdout
+    sys.stdin, sys.stdout = io.StringIO(details + "\n"), io.StringIO()
+    try:
+        app.print_statement()
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdin, sys.stdout = stdin, stdout
+
+def test_statement_of_unknown_account_stores_nothing(tmp_path):
+    app = BankingApp(storage=SqliteStorage(str(tmp_path / "bank.db")))
+    app.process_interest_rule("20230101 RULE01 1.95")
+    app.process_transaction("20230601 AC001 D 100.00")
+    before = app.book_totals.totals(date(2023, 1, 1), date(2023, 12, 31))
+
+    output = print_statement(app, "ZZ9 202306")
+    app.commit()
+
+    assert "Account: ZZ9" in output
+    assert "ZZ9" not in app.accounts
+    assert list(app.storage.conn.execute("SELECT * FROM transactions WHERE acc_num='ZZ9'")) == []
+    assert app.book_totals.totals(date(2023, 1, 1), date(2023, 12, 31)) == before
+
+def test_statement_of_unknown_account_in_memory_keeps_totals():
+    app = BankingApp()
+    app.process_interest_rule("20230101 RULE01 1.95")
+    before = app.book_totals.totals(date(2023, 1, 1), date(2023, 12, 31))
+
+    print_statement(app, "ZZ9 202306")
+
+    assert "ZZ9" not in app.accounts
+    assert app.book_totals.totals(date(2023, 1, 1), date(2023, 12, 31)) == before
+
+def test_compaction_credits_months_not_closed(tmp_path):
+    def book():
+        app = BankingApp()
+        app.process_interest_rule("20230101 RULE01 1.95")
+        app.process_transaction("20230410 AC001 D 1000.00")
+        app.process_transaction("20230515 AC001 W 200.00")
+        app.process_transaction("20230620 AC001 D 50.00")
+        return app
+    closed = book()
+    for yyyymm in ("202304", "202305", "202306"):
+        closed.close_month(yyyymm)
+    compacted = book()
+    compacted.close_month("202306")
+    #202305 is credited again after 202304, and the later months are re-credited for it
+    compacted.process_transaction("20230520 AC001 D 10.00")
+    closed.process_transaction("20230520 AC001 D 10.00")
+    for yyyymm in ("202305", "202306"):
+        closed.get_month_interest(closed.accounts["AC001"], yyyymm)
+
+    compacted.compact_months("202306", archive_dir=str(tmp_path / "archive"))
+
+    for yyyymm in ("202304", "202305", "202306"):
+        assert compacted.accounts["AC001"].get_interest(yyyymm) == closed.accounts["AC001"].get_interest(yyyymm)
+    assert compacted.accounts["AC001"].balance == closed.accounts["AC001"].balance
+
+def test_compaction_crash_before_snapshot_keeps_totals(tmp_path, monkeypatch):
+    def load(app):
+        app.process_interest_rule("20230101 RULE01 1.95")
+        app.process_transaction("20230410 AC001 D 1000.00")
+        app.process_transaction("20230515 AC001 W 200.00")
+        app.process_transaction("20230402 AC002 D 50.00")
+    expected = BankingApp()
+    load(expected)
+    for yyyymm in ("202304", "202305"):
+        expected.close_month(yyyymm)
+
+    app = BankingApp(data_dir=str(tmp_path))
+    load(app)
+    def crash(app):
+        raise OSError("crash")
+    #the month files are written, the process dies before the snapshot of the compacted state
+    monkeypatch.setattr(app.journal, "write_snapshot", crash)
+    try:
+        app.compact_months("202305")
+    except OSError:
+        pass
+    app.journal.close()
+    assert app.archive.months() == ["202304", "202305"]
+
+    restarted = BankingApp(data_dir=str(tmp_path))
+    assert restarted.closed_through is None
+    assert restarted.book_totals.totals(date(2023, 1, 1), date(2023, 12, 31)) == \
+        expected.book_totals.totals(date(2023, 1, 1), date(2023, 12, 31))
+    assert restarted.accounts["AC001"].balance == expected.accounts["AC001"].balance
+
+def test_restart_restores_book_totals_from_snapshot_and_journal(tmp_path):
+    app = BankingApp(data_dir=str(tmp_path))
+    app.process_interest_rule("20230101 RULE01 1.95")
+    app.process_transaction("20230410 AC001 D 1000.00")
+    app.close_month("202304")
+    app.journal.write_snapshot(app)
+    #after the snapshot: a new day, a backdated deposit and the interest re-credited for it
+    app.process_transaction("20230405 AC001 D 500.00")
+    app.process_transaction("20230502 AC002 D 20.00")
+    app.close_month("202304")
+    expected = app.book_totals.daily(date(2023, 1, 1), date(2023, 12, 31))
+    app.close()
+
+    restarted = BankingApp(data_dir=str(tmp_path))
+
+    assert restarted.book_totals.daily(date(2023, 1, 1), date(2023, 12, 31)) == expected
@@ -0,0 +1,28 @@
+from banking_app import BankingApp
+import interest_scenarios
+import month_end
+
+def large_balance_app() -> BankingApp:
+    #balance x rate-days of the month is past the int64 range
+    app = BankingApp()
+    app.process_interest_rule("20230101 RULE01 99.00")
+    for day in range(1, 4):
+        app.process_transaction(f"202306{day:02} AC001 D 9999999999999.99")
+    app.process_transaction("20230601 AC002 D 100.00")
+    return app
+
+def test_month_interest_past_int64_matches_single_account():
+    app = large_balance_app()
+    accounts = [app.accounts["AC001"], app.accounts["AC002"]]
+    expected = [sum(app.calculate_interest_for_range(bank_acc, "202306", "202306", post=False).values()) for bank_acc in accounts]
+
+    assert month_end.calculate_month_interest(accounts, app.interest_rules, "202306") == expected
+
+def test_scenarios_past_int64_match_single_account():
+    app = large_balance_app()
+    expected = {acc_num: sum(app.calculate_interest_for_range(app.accounts[acc_num], "202306", "202308", post=False).values())
+                for acc_num in app.accounts}
+
+    results = interest_scenarios.evaluate_scenarios(app, {"current": app.interest_rules}, "202306", "202308")
+
+    assert results["current"].accounts == expected
@@ -0,0 +1,77 @@
+import random
+import threading
+import time
+
+import pytest
+
+from banking_app import BankingApp
+from posting_engine import PostingEngine
+
+def produce(engine:PostingEngine, producer:int, num_lines:int, submitted:list) -> None:
+    rnd = random.Random(producer)
+    for _ in range(num_lines):
+        trn_type = "D" if rnd.random() < 0.55 else "W"
+        #few accounts and days, so withdrawals compete for the same balances and ids share days
+        line = f"202306{rnd.randint(1, 5):02} AC{rnd.randrange(4):03} {trn_type} {rnd.randint(1, 300)}.{rnd.randint(0, 99):02}"
+        submitted.append((line, engine.submit(line)))
+
+def test_concurrent_posting_matches_serial_replay():
+    app = BankingApp()
+    applied = []
+    apply_transaction = app.apply_transaction
+    def record_order(record):
+        #called on the writer thread only, in posting order
+        applied.append(record)
+        return apply_transaction(record)
+    app.apply_transaction = record_order
+
+    submitted_lists = [[] for _ in range(8)]
+    with PostingEngine(app, batch_size=16) as engine:
+        producers = [threading.Thread(target=produce, args=(engine, producer, 300, submitted_lists[producer]))
+                     for producer in range(8)]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+    submitted = [item for items in submitted_lists for item in items]
+    assert len(applied) == len(submitted)
+
+    serial = BankingApp()
+    serial_errors = [serial.apply_transaction(record) for record in applied]
+    assert sorted(serial_errors, key=str) == sorted((future.result() for _, future in submitted), key=str)
+
+    assert sorted(app.accounts.keys()) == sorted(serial.accounts.keys())
+    for bank_acc_num in serial.accounts.keys():
+        lines = list(app.accounts.get(bank_acc_num).statement_lines())
+        assert lines == list(serial.accounts.get(bank_acc_num).statement_lines())
+        #transaction ids run from 01 without gaps within each day
+        day_counts = {}
+        for line in lines[2:]:
+            day, number = line.split("|")[1].strip().split("-")
+            day_counts[day] = day_counts.get(day, 0) + 1
+            assert int(number) == day_counts[day]
+
+def test_submit_racing_stop_is_posted_or_rejected():
+    app = BankingApp()
+    engine = PostingEngine(app).start()
+    futures = []
+    def keep_submitting():
+        while True:
+            try:
+                futures.append(engine.submit("20230601 AC001 D 1.00"))
+            except RuntimeError:
+                return
+    producers = [threading.Thread(target=keep_submitting) for _ in range(4)]
+    for producer in producers:
+        producer.start()
+    while len(futures) < 1000:
+        time.sleep(0.001)
+    engine.stop()
+    for producer in producers:
+        producer.join()
+
+    #every future handed out is resolved, none is queued behind the stop
+    assert all(future.result(timeout=5) is None for future in futures)
+    assert app.accounts.get("AC001").balance == 100*len(futures)
+    with pytest.raises(RuntimeError):
+        engine.submit("20230602 AC001 D 1.00")
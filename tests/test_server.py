@@ -0,0 +1,75 @@
+import asyncio
+import os
+
+from banking_app import BankingApp
+from journal import Journal, SNAPSHOT_FILE
+import parsing
+from server import BankServer
+
+async def session(lines:list, app:BankingApp=None, after=None) -> list:
+    app = app or BankingApp()
+    bank_server = BankServer(app)
+    server = await bank_server.start("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    responses = []
+    try:
+        for line in lines:
+            writer.write((line if isinstance(line, bytes) else line.encode()) + b"\n")
+            await writer.drain()
+            response = []
+            while True:
+                response_line = await reader.readline()
+                if not response_line or response_line == b"\n":
+                    break
+                response.append(response_line.decode().rstrip("\n"))
+            responses.append(response)
+        if after is not None:
+            after()
+    finally:
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        await bank_server.stop()
+    return responses, app
+
+def test_statement_with_malformed_month_gets_error_reply():
+    responses, _ = asyncio.run(session(["T 20230601 AC001 D 100.00", "P AC001 2023", "P AC001 20231", "P AC001 202306"]))
+
+    assert responses[1] == ["Invalid Input Format! Please enter account and month to generate the statement <Account> <Year><Month>"]
+    assert responses[2] == responses[1]
+    assert responses[3][0] == "Account: AC001"
+
+def test_statement_of_unknown_account_gets_error_reply():
+    responses, app = asyncio.run(session(["P ZZ9 202306"]))
+
+    assert responses[0] == ["Account ZZ9 not found."]
+    assert "ZZ9" not in app.accounts
+
+def test_oversized_line_gets_error_reply_and_session_continues():
+    responses, _ = asyncio.run(session(["T 20230601 AC001 D " + "9"*(2*1024*1024), "T 20230601 AC001 D 100.00"]))
+
+    assert responses[0] == [parsing.TRANSACTION_FORMAT_ERROR]
+    assert responses[1][0] == "Account: AC001"
+
+def test_undecodable_line_gets_error_reply_and_session_continues():
+    responses, _ = asyncio.run(session([b"T 20230601 AC001 D 1\xff0.00", b"\xff\xfe", "T 20230601 AC001 D 100.00"]))
+
+    assert responses[0] == ["Amount is not a number. Please input a number up to 2 decimal places"]
+    assert responses[1] == ["Invalid choice. Please try again."]
+    assert responses[2][0] == "Account: AC001"
+
+def test_snapshots_are_written_when_due_and_on_stop(tmp_path):
+    app = BankingApp(data_dir=str(tmp_path))
+    app.journal.snapshot_every = 2
+    snapshot_path = os.path.join(str(tmp_path), SNAPSHOT_FILE)
+    written_while_serving = []
+
+    asyncio.run(session([f"T 2023060{day} AC001 D 100.00" for day in range(1, 4)], app,
+                        after=lambda: written_while_serving.append(os.path.exists(snapshot_path))))
+
+    assert written_while_serving == [True]
+    #the snapshot on stop covers the whole journal
+    restored = BankingApp()
+    assert Journal(str(tmp_path)).restore(restored) == 0
+    assert restored.accounts.get("AC001").balance == 30000